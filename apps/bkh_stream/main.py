@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+"""Plot figure using Bokeh Server, streaming the buildings into the session progressively.
+
+The initial document holds the rivers and a coarse overview image of the buildings only, so that the map paints as soon
+as possible. Buildings are then streamed in chunks, those within the current view first, see mapcompare/progressive.py.
+Time to first meaningful paint and to the last chunk are printed per session.
+
+To run the live app, cd to the containing folder via the command line
+and enter 'bokeh serve --show main.py'.
+
+"""
+import sys; sys.path.insert(0, '../..')
+from bokeh.io import curdoc
+from bokeh.events import RangesUpdate
+from bokeh.models import ColumnDataSource, Range1d
+from bokeh.plotting import figure
+from mapcompare.sql2gdf import sql2gdf
+from mapcompare.snapshot import loadSnapshot
+from mapcompare.progressive import ProgressiveStream, overviewImage
+from mapcompare.tilecache import basemapSource
+from mapcompare.misc.pw import password
+
+
+# INPUTS
+db_name = 'dd'
+snapshot = False # read the layers from the memory-mapped Arrow snapshot written by scripts/snapshot.py instead of PostGIS
+progressive = True # stream the buildings after the first paint, otherwise send all layers within the initial document
+chunk_size = 5000 # buildings per streamed chunk
+initial_view = None # (x0, x1, y0, y1) in Web Mercator to open the map at, streamed first, defaulting to the full extent
+tile_cache = False # OSM basemap from the tile cache prefetched by scripts/osm_tiles.py and served by `mapcompare tiles` at MAPCOMPARE_TILE_URL
+
+# created first, so that the session's timings include loading the layers
+stream = ProgressiveStream(curdoc(), chunk_size)
+
+if snapshot:
+    buildings_in, buildings_out, rivers = loadSnapshot(db_name, password, ragged=True)
+else:
+    buildings_in, buildings_out, rivers = sql2gdf(db_name, password, ragged=True)
+
+# transform to webmercator to align with basemap
+buildings_in, buildings_out, rivers = [layer.toCrs('epsg:3857') for layer in (buildings_in, buildings_out, rivers)]
+
+bounds = [layer.total_bounds for layer in (buildings_in, buildings_out, rivers)]
+extent = [min(b[0] for b in bounds), max(b[2] for b in bounds), min(b[1] for b in bounds), max(b[3] for b in bounds)]
+view = initial_view or extent
+
+p = figure(title="Click on a legend entry to hide/unhide features",
+    aspect_ratio=(extent[1] - extent[0]) / (extent[3] - extent[2]),
+    plot_height=600,
+    background_fill_color="white",
+    tooltips=[('Building use', '@use')],
+    x_range=Range1d(view[0], view[1]),
+    y_range=Range1d(view[2], view[3]),
+)
+
+p.add_tile(basemapSource('bokeh', tile_cache))
+
+p.xaxis.visible = False
+p.yaxis.visible = False
+
+if progressive:
+
+    # coarse overview of the buildings, shown until the last chunk has arrived
+    overview = p.image_rgba(image=[overviewImage([buildings_out, buildings_in], [(211, 211, 211), (255, 0, 0)], extent)],
+                            x=extent[0], y=extent[2], dw=extent[1] - extent[0], dh=extent[3] - extent[2])
+    stream.on_complete.append(lambda: setattr(overview, 'visible', False))
+
+    sources = [ColumnDataSource(data=dict(xs=[], ys=[], use=[])) for _ in range(2)]
+
+    for source, layer in zip(sources, (buildings_in, buildings_out)):
+        stream.add(source, layer, attributes=['use'])
+
+    # one queue across both layers, so that the view fills with buildings within and outside 500m alike
+    stream.order(view, extent)
+
+    # panning or zooming in while streaming fetches the new view next
+    p.on_event(RangesUpdate, lambda event: stream.prioritise((event.x0, event.x1, event.y0, event.y1)))
+
+else:
+
+    sources = [ColumnDataSource(data=dict(layer.toBokeh(), use=list(layer.attributes['use']))) for layer in (buildings_in, buildings_out)]
+
+p.multi_polygons('xs', 'ys', legend_label="Buildings within 500m of river/stream", color='red', source=sources[0])
+p.multi_polygons('xs', 'ys', legend_label="Buildings outside 500m of river/stream", color='lightgrey', line_color='black', line_width=0.5, source=sources[1])
+p.multi_polygons('xs', 'ys', legend_label="River/stream", color='lightblue', line_color='blue', line_width=0.25, source=ColumnDataSource(data=rivers.toBokeh()))
+
+p.legend.location = "top_right"
+p.legend.label_text_font_size = "8pt"
+p.legend.click_policy="hide"
+
+doc = curdoc()
+doc.add_root(p)
+doc.title = 'Bokeh Progressive Streaming App'
+
+doc.on_session_destroyed(lambda session_context: print(stream.report()))
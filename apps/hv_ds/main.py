@@ -11,8 +11,20 @@ import sys; sys.path.insert(0, '../..')
 import holoviews as hv
 from spatialpandas import GeoDataFrame
 import datashader as ds
-from mapcompare.sql2gdf import sql2gdf
+from mapcompare.sql2gdf import sql2gdf, sourceFingerprint
+from mapcompare.spatialparquet import loadParquet
+from mapcompare.snapshot import loadSnapshot
+from mapcompare.ragged import spatialFrame
+from mapcompare.hover import sharedIndex, hoverLayer
+from mapcompare.lod import sharedLevelOfDetail
+from mapcompare.scheduler import scheduledShade
+from mapcompare.viewcache import sharedCache, cachedShade, frameFingerprint
+from mapcompare.tilepyramid import liveBeyondZoom
+from mapcompare.tilecache import basemapSource
+from mapcompare.warmup import warmup as warmupKernels
+from mapcompare.symbology import hvPointsLegend
 from mapcompare.misc.pw import password
+from bokeh.io import curdoc
 from holoviews.operation.datashader import (
     datashade, inspect_polygons
 )
@@ -23,6 +35,19 @@ hv.extension('bokeh')
 
 # INPUTS
 db_name = 'dd'
+parquet = False # read a Hilbert-sorted, spatially partitioned Parquet dataset lazily with dask, see mapcompare/spatialparquet.py
+snapshot = False # read the layers from the memory-mapped Arrow snapshot written by scripts/snapshot.py instead of PostGIS
+tile_pyramid = False # show the tiles precomputed by scripts/ds_tiles.py and datashade live only beyond max_tile_zoom, without inspect_polygons() hover, see indexed_hover
+max_tile_zoom = 16 # max_zoom used for scripts/ds_tiles.py
+pyramid_url = 'http://localhost:8001' # reachable by the browser, e.g. served by `mapcompare tiles --pyramid dd --port 8001`
+tile_cache = False # OSM basemap from the tile cache prefetched by scripts/osm_tiles.py and served by `mapcompare tiles` at MAPCOMPARE_TILE_URL
+scheduled = False # debounce pans and zooms and datashade off the event loop, dropping superseded viewports, see mapcompare/scheduler.py
+view_cache = False # share shaded viewports across sessions in an LRU cache, see mapcompare/viewcache.py
+view_cache_mb = 512
+view_cache_dir = None # optional folder receiving entries evicted from memory, e.g. '../../mapcompare/temp/viewcache/'
+lod_threshold = None # e.g. 20000, draw viewports with fewer features as vector polygons instead of datashading them, see mapcompare/lod.py
+indexed_hover = False # hit-test hover events against an STRtree instead of inspect_polygons(), see mapcompare/hover.py
+warmup = False # compile the kernels on a tiny synthetic frame ahead of the first session's first datashade, once per process
 
 def prepGDFs(*gdfs):
     """Prepare GeoDataFrames for use by Holoviews' Polygons class.
@@ -55,32 +80,104 @@ def renderFigure(spatialpdGDF, db_name=db_name):
 
     color_key = {'Buildings within 500m of river/stream': 'red', 'Buildings outside 500m of river/stream': 'grey', 'River/stream': 'lightblue'}
 
-    legend    = hv.NdOverlay({k: hv.Points([0,0], label=str(k)).opts(
-                                            color=v, apply_ranges=False) 
-                            for k, v in color_key.items()}, 'category')
+    legend = hvPointsLegend(hv, color_key)
 
     polys = hv.Polygons(spatialpdGDF, vdims='category')
 
-    shaded = datashade(polys, color_key=color_key, aggregator=ds.by('category', ds.any()))
-    hover = inspect_polygons(shaded).opts(fill_color='purple', tools=['hover'])
+    # shared by all sessions of the server process
+    cache = sharedCache(db_name, frameFingerprint(spatialpdGDF), view_cache_mb * 2**20, view_cache_dir) if view_cache else None
 
-    tiles = hv.element.tiles.OSM().opts(
+    if view_cache:
+        curdoc().on_session_destroyed(lambda session_context: print(cache.report()))
+
+    tiles = basemapSource('holoviews', tile_cache, name='OSM').opts(
     min_height=500, responsive=True, xaxis=None, yaxis=None)
 
-    layout = tiles * shaded * hover * legend
+    if tile_pyramid:
+
+        # precomputed tiles up to max_tile_zoom, live datashading beyond
+        # inspect_polygons() is left out as it relies on the datashaded element of every pan and zoom, unlike the indexed hover
+        pyramid = hv.Tiles(pyramid_url + '/{Z}/{X}/{Y}.png')
+        shaded = liveBeyondZoom(polys, max_tile_zoom, hv.RGB, cache=cache, color_key=color_key, aggregator=ds.by('category', ds.any()))
+
+        layout = tiles * pyramid * shaded * legend
+
+        if indexed_hover:
+            layout = layout * hoverLayer(hover_index, hv.Polygons).opts(fill_color='purple', tools=['hover'])
+
+    else:
+
+        if scheduled:
+            shaded, scheduler = scheduledShade(polys, hv.RGB, cache=cache, color_key=color_key, aggregator=ds.by('category', ds.any()),
+                                                blank=lod.isVector if lod_threshold else None)
+            curdoc().on_session_destroyed(lambda session_context: print(scheduler.report()))
+        elif lod_threshold:
+            shaded = lod.rasterLayer(polys, hv.RGB, cache=cache, color_key=color_key, aggregator=ds.by('category', ds.any()))
+        elif view_cache:
+            shaded = cachedShade(polys, cache, color_key=color_key, aggregator=ds.by('category', ds.any()))
+        else:
+            shaded = datashade(polys, color_key=color_key, aggregator=ds.by('category', ds.any()))
+
+        if indexed_hover:
+            hover = hoverLayer(hover_index, hv.Polygons).opts(fill_color='purple', tools=['hover'])
+        else:
+            hover = inspect_polygons(shaded).opts(fill_color='purple', tools=['hover'])
+
+        if lod_threshold:
+            # culled to the viewport, with native Bokeh hover
+            vector = lod.vectorLayer(hv.Polygons).opts(color='category', cmap=color_key, line_color='black', line_width=0.1, tools=['hover'])
+            layout = tiles * shaded * vector * hover * legend
+        else:
+            layout = tiles * shaded * hover * legend
 
     return layout
 
 
-buildings_in, buildings_out, rivers = sql2gdf(db_name, password)
+# module globals of main.py are rerun per session, warmup() compiles once per process
+if warmup:
+    warmupKernels(['Buildings outside 500m of river/stream', 'Buildings within 500m of river/stream', 'River/stream'])
+
+# in drawing order, rivers/streams on top
+categories = ['Buildings within 500m of river/stream', 'Buildings outside 500m of river/stream', 'River/stream']
+
+if parquet:
+
+    # only the partitions intersecting the current viewport are read on each pan and zoom
+    spatialpdGDF = loadParquet(db_name, 3857, categories, lambda: prepGDFs(*sql2gdf(db_name, password)),
+                               fingerprint=sourceFingerprint(db_name, password))
 
-spatialpdGDF = prepGDFs(buildings_in, buildings_out, rivers)
+elif snapshot:
+
+    # exported on first use, shared with other processes via the page cache afterwards,
+    # and merged from the coordinate arrays rather than via one shapely object per feature
+    layers = [layer.toCrs('epsg:3857') for layer in loadSnapshot(db_name, password, ragged=True)]
+
+    spatialpdGDF = spatialFrame(layers, categories)
+
+else:
+
+    buildings_in, buildings_out, rivers = sql2gdf(db_name, password)
+
+    spatialpdGDF = prepGDFs(buildings_in, buildings_out, rivers)
+
+if indexed_hover:
+
+    # built once per server process and dataset, as the app script is executed again for every session
+    hover_index = sharedIndex(db_name + (' parquet' if parquet else ' snapshot' if snapshot else ''), spatialpdGDF, categories)
+
+if lod_threshold:
+
+    # built once per server process and dataset, like the hover index
+    lod = sharedLevelOfDetail(db_name + (' parquet' if parquet else ' snapshot' if snapshot else ''), spatialpdGDF, threshold=lod_threshold)
 
 layout = renderFigure(spatialpdGDF)
 
 doc = hv.renderer('bokeh').server_doc(layout)
 doc.title = 'HoloViews + Datashader + Bokeh App'
 
+if indexed_hover:
+    doc.on_session_destroyed(lambda session_context: print(hover_index.report()))
+
     
 
 
@@ -1,2 +1,4 @@
-import mapcompare.cProfile_viz
-import mapcompare.sql2gdf
\ No newline at end of file
+"""Comparison of Python packages and libraries for visualising geospatial vector data.
+
+Submodules are imported on demand, so that e.g. the mapcompare command or tile workers do not pull in sqlalchemy or any visualisation library they do not use.
+"""
@@ -0,0 +1,174 @@
+"""Analysis of repeated benchmark runs: cold vs. warm runs, outliers, bootstrap confidence intervals and pairwise comparisons.
+
+Means and standard deviations over all runs, as plotted by profile_comp.py until now, mix effects that are not the
+rendering itself. Instead, per library:
+    - cold runs are reported separately from warm runs. For datashader, to_cProfile() repeats renderFigure() within
+      one process, so its first run includes numba's JIT compilation and is cold by default. Other libraries run once
+      per process, manually repeated, so that all of their runs are alike and none is cold unless `cold_runs` says so
+    - warm runs further than `k` scaled median absolute deviations from their median are dropped as outliers, e.g. a
+      run interrupted by another process
+    - the median of the remaining warm runs is reported with a percentile bootstrap confidence interval
+
+Pairs of libraries are compared by the ratio of their medians, with a bootstrap confidence interval, Cliff's delta as
+the effect size and a permutation test p-value, Holm-corrected across all pairs.
+"""
+
+import itertools
+from typing import Callable, Dict, Tuple, Union
+import numpy as np
+import pandas as pd
+from mapcompare.benchstore import permutationTest
+
+
+def splitCold(times: pd.DataFrame, cold_runs: Union[int, Dict[str, int]]=None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Split times with 'lib', 'sample' (run number, from 1 or 0) and 'secs' columns into cold and warm runs per lib.
+
+    Parameters
+    ----------
+    cold_runs : int or dict, optional
+        First runs counted as cold, for all libs or by lib, 0 for libs missing from the dict. Defaults to 1 for the libs
+        whose runs to_cProfile() repeats within one process, i.e. those starting with 'ds', and 0 for all others.
+    """
+
+    if cold_runs is None:
+        cold_runs = {lib: 1 for lib in times['lib'].unique() if lib.startswith('ds')}
+
+    if isinstance(cold_runs, dict):
+        cold_runs = times['lib'].map(cold_runs).fillna(0)
+
+    rank = times.groupby('lib')['sample'].rank(method='first')
+    cold = rank <= cold_runs
+
+    return times[cold], times[~cold]
+
+
+def outlierMask(values: np.ndarray, k: float=3.5) -> np.ndarray:
+    """Return whether values lie further than k scaled median absolute deviations from their median.
+    """
+
+    values = np.asarray(values, dtype=float)
+    median = np.median(values)
+    # scaled to estimate the standard deviation of normally distributed values
+    mad = 1.4826 * np.median(np.abs(values - median))
+
+    if mad == 0:
+        return np.zeros(len(values), dtype=bool)
+
+    return np.abs(values - median) / mad > k
+
+
+def bootstrapCI(values: np.ndarray, statistic: Callable=np.median, n_boot: int=10000, level: float=0.95,
+                seed: int=0) -> Tuple[float, float]:
+    """Return the percentile bootstrap confidence interval of a statistic of a sample.
+    """
+
+    values = np.asarray(values, dtype=float)
+    rng = np.random.default_rng(seed)
+
+    resamples = rng.choice(values, size=(n_boot, len(values)), replace=True)
+    stats = np.apply_along_axis(statistic, 1, resamples)
+
+    return tuple(np.quantile(stats, [(1 - level) / 2, (1 + level) / 2]))
+
+
+def ratioCI(a: np.ndarray, b: np.ndarray, n_boot: int=10000, level: float=0.95, seed: int=0) -> Tuple[float, float]:
+    """Return the percentile bootstrap confidence interval of median(b) / median(a), resampling both samples.
+    """
+
+    rng = np.random.default_rng(seed)
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+
+    ratios = (np.median(rng.choice(b, size=(n_boot, len(b))), axis=1)
+              / np.median(rng.choice(a, size=(n_boot, len(a))), axis=1))
+
+    return tuple(np.quantile(ratios, [(1 - level) / 2, (1 + level) / 2]))
+
+
+def cliffsDelta(a: np.ndarray, b: np.ndarray) -> float:
+    """Return Cliff's delta, the probability of b exceeding a minus that of a exceeding b, from -1 to 1.
+
+    Magnitudes below 0.147 are conventionally negligible, below 0.33 small, below 0.474 medium and large above.
+    """
+
+    diff = np.subtract.outer(np.asarray(b, dtype=float), np.asarray(a, dtype=float))
+
+    return (np.sum(diff > 0) - np.sum(diff < 0)) / diff.size
+
+
+def holm(p_values: np.ndarray) -> np.ndarray:
+    """Return Holm-Bonferroni adjusted p-values.
+    """
+
+    p_values = np.asarray(p_values, dtype=float)
+    order = np.argsort(p_values)
+    adjusted = np.maximum.accumulate((len(p_values) - np.arange(len(p_values))) * p_values[order])
+
+    result = np.empty(len(p_values))
+    result[order] = np.minimum(adjusted, 1)
+
+    return result
+
+
+def _warmSamples(times: pd.DataFrame, cold_runs: Union[int, Dict[str, int]], k: float) -> dict:
+
+    _, warm = splitCold(times, cold_runs)
+
+    return {lib: group['secs'].values[~outlierMask(group['secs'].values, k)] for lib, group in warm.groupby('lib')}
+
+
+def summarise(times: pd.DataFrame, cold_runs: Union[int, Dict[str, int]]=None, k: float=3.5, level: float=0.95) -> pd.DataFrame:
+    """Return per lib the cold run(s), and the median of the warm runs without outliers with its confidence interval.
+
+    Parameters
+    ----------
+    times : pd.DataFrame
+        'lib', 'sample' and 'secs' columns, e.g. from benchstore.profileTimes().
+    cold_runs : int or dict, optional
+        Runs counted as cold, for all libs or by lib, see splitCold().
+    k : float
+        Outlier threshold in scaled median absolute deviations.
+    level : float
+        Confidence level.
+
+    Returns
+    ----------
+        One row per lib.
+    """
+
+    cold, warm = splitCold(times, cold_runs)
+    samples = _warmSamples(times, cold_runs, k)
+    rows = []
+
+    for lib in sorted(times['lib'].unique()):
+        values = samples.get(lib, np.array([]))
+        low, high = bootstrapCI(values, level=level) if len(values) > 1 else (np.nan, np.nan)
+
+        rows.append(dict(lib=lib, cold=cold.loc[cold['lib'] == lib, 'secs'].mean(), median=np.median(values) if len(values) else np.nan,
+                         ci_low=low, ci_high=high, n_warm=len(values),
+                         outliers=int((warm['lib'] == lib).sum()) - len(values)))
+
+    return pd.DataFrame(rows)
+
+
+def pairwise(times: pd.DataFrame, cold_runs: Union[int, Dict[str, int]]=None, k: float=3.5, level: float=0.95) -> pd.DataFrame:
+    """Compare the warm runs of every pair of libs.
+
+    Returns
+    ----------
+        One row per pair with the ratio of medians (b / a) and its confidence interval, Cliff's delta, the permutation
+        test p-value, its Holm-adjusted value and whether the difference is significant at 1 - level.
+    """
+
+    samples = {lib: values for lib, values in _warmSamples(times, cold_runs, k).items() if len(values) > 1}
+    rows = []
+
+    for a, b in itertools.combinations(sorted(samples), 2):
+        low, high = ratioCI(samples[a], samples[b], level=level)
+        rows.append(dict(a=a, b=b, ratio=np.median(samples[b]) / np.median(samples[a]), ci_low=low, ci_high=high,
+                         cliffs_delta=cliffsDelta(samples[a], samples[b]), p_value=permutationTest(samples[a], samples[b])))
+
+    table = pd.DataFrame(rows, columns=['a', 'b', 'ratio', 'ci_low', 'ci_high', 'cliffs_delta', 'p_value'])
+    table['p_holm'] = holm(table['p_value'].values) if len(table) else []
+    table['significant'] = table['p_holm'] < 1 - level
+
+    return table
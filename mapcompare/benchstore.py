@@ -0,0 +1,370 @@
+"""Store of benchmark results across runs, library versions and machines, and detection of regressions between runs.
+
+profile_comp.py compares the libraries within one set of profiles, by eye. The store keeps every run instead:
+    - runs: time, label, host, platform, Python, cores, git commit, the versions of the compared libraries and the CPU
+      frequency scaling and affinity settings, see systemSettings()
+    - results: one row per run, job (lib, db, basemap, savefig, options), sample and metric, e.g. render secs or max_rss_mb
+in an SQLite database at mapcompare/outputs/benchmarks.sqlite, filled by `mapcompare matrix` and profile_comp.py.
+
+compareRuns() matches the jobs of two runs and flags a metric as a regression if its median has grown by more than a
+threshold and a permutation test on the samples finds the change significant after Holm's correction across all jobs
+and metrics compared, e.g. after upgrading bokeh:
+
+    mapcompare matrix --lib bkh --lib gv --db dd_subset --repeat 5 --label "bokeh 3.1"
+    mapcompare compare
+
+The test needs at least 4 samples per job and run to reach a significance level of 0.05, see minRepeat(). With fewer,
+changes above the threshold are flagged as untested rather than as regressions.
+"""
+
+import os
+import io
+import json
+import glob
+import pstats
+import sqlite3
+import socket
+import platform
+import subprocess
+from math import comb
+from itertools import combinations
+from datetime import datetime
+from importlib import metadata
+from typing import Dict, List, Tuple
+import numpy as np
+import pandas as pd
+
+storepath = os.path.join(os.path.dirname(__file__), 'outputs', 'benchmarks.sqlite')
+
+# distributions whose versions are recorded with every run
+TRACKED = ('numpy', 'pandas', 'shapely', 'pyproj', 'geopandas', 'matplotlib', 'cartopy', 'geoplot', 'altair', 'bokeh',
+           'holoviews', 'geoviews', 'hvplot', 'datashader', 'spatialpandas', 'numba', 'plotly', 'pyarrow')
+
+KEYS = ['lib', 'db', 'basemap', 'savefig', 'options']
+METRICS = ['import', 'load', 'render', 'write', 'wall', 'max_rss_mb', 'output_bytes']
+
+_schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started TEXT NOT NULL,
+    label TEXT,
+    host TEXT,
+    platform TEXT,
+    python TEXT,
+    cpu_count INTEGER,
+    git_commit TEXT,
+    versions TEXT,
+    settings TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs(run_id),
+    lib TEXT NOT NULL,
+    db TEXT NOT NULL,
+    basemap INTEGER,
+    savefig INTEGER,
+    options TEXT,
+    sample INTEGER,
+    status TEXT,
+    metric TEXT NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS results_run ON results (run_id);
+"""
+
+
+def libraryVersions() -> Dict[str, str]:
+    """Return the installed versions of the TRACKED distributions, leaving out those not installed.
+    """
+
+    versions = {}
+
+    for name in TRACKED:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            pass
+
+    return versions
+
+
+def _readSys(path: str) -> str:
+
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def systemSettings() -> Dict:
+    """Return the settings affecting timings beyond the code measured: CPU affinity, frequency scaling and load.
+
+    Frequencies are in kHz as reported by Linux' cpufreq for the CPUs within the affinity, and missing elsewhere.
+    """
+
+    affinity = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    cpufreq = '/sys/devices/system/cpu/cpu{}/cpufreq/'
+
+    def values(name):
+        return [value for value in (_readSys(cpufreq.format(cpu) + name) for cpu in affinity) if value is not None]
+
+    freqs = {name: [int(value) for value in values('scaling_' + name + '_freq')] for name in ('min', 'max', 'cur')}
+
+    return {
+        'affinity': affinity,
+        'governors': sorted(set(values('scaling_governor'))),
+        'min_freq': min(freqs['min'], default=None),
+        'max_freq': max(freqs['max'], default=None),
+        'cur_freq': [min(freqs['cur'], default=None), max(freqs['cur'], default=None)],
+        # intel_pstate reports no_turbo, acpi-cpufreq boost
+        'no_turbo': _readSys('/sys/devices/system/cpu/intel_pstate/no_turbo'),
+        'boost': _readSys('/sys/devices/system/cpu/cpufreq/boost'),
+        'loadavg': list(os.getloadavg()) if hasattr(os, 'getloadavg') else None
+    }
+
+
+def _gitCommit() -> str:
+
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class BenchmarkStore:
+    """SQLite store of benchmark runs and their results.
+
+    Parameters
+    ----------
+    path : str, optional
+        Defaults to mapcompare/outputs/benchmarks.sqlite.
+    """
+
+    def __init__(self, path: str=None):
+
+        self.path = path or storepath
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        self.con = sqlite3.connect(self.path)
+        self.con.executescript(_schema)
+
+        # stores created before settings were recorded
+        if 'settings' not in [row[1] for row in self.con.execute("PRAGMA table_info(runs)")]:
+            self.con.execute("ALTER TABLE runs ADD COLUMN settings TEXT")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.con.close()
+
+    def addRun(self, label: str=None) -> int:
+        """Record a new run with the current environment and library versions, returning its id.
+        """
+
+        with self.con:
+            cursor = self.con.execute(
+                "INSERT INTO runs (started, label, host, platform, python, cpu_count, git_commit, versions, settings) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (datetime.now().isoformat(timespec='seconds'), label, socket.gethostname(), platform.platform(),
+                 platform.python_version(), os.cpu_count(), _gitCommit(), json.dumps(libraryVersions()), json.dumps(systemSettings())))
+
+        return cursor.lastrowid
+
+    def addResults(self, run_id: int, results: pd.DataFrame) -> int:
+        """Record a results table, one row per job and sample as returned by runMatrix(), returning the number of values.
+
+        Metrics missing from the table, or missing for a job, e.g. as it failed, are left out.
+        """
+
+        rows = []
+
+        # plus the metrics of the figures rendered, see figmetrics.py
+        metrics = METRICS + [column for column in results.columns if column.startswith('fig_')]
+
+        for _, row in results.iterrows():
+            for metric in metrics:
+                if metric in row and pd.notna(row[metric]):
+                    rows.append((run_id, row['lib'], row['db'], _flag(row.get('basemap')), _flag(row.get('savefig')),
+                                 str(row.get('options') or ''), int(row.get('sample', 0)), row.get('status', 'ok'), metric, float(row[metric])))
+
+        with self.con:
+            self.con.executemany("INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+        return len(rows)
+
+    def runs(self) -> pd.DataFrame:
+
+        return pd.read_sql("SELECT * FROM runs ORDER BY run_id", self.con, index_col='run_id')
+
+    def results(self, run_id: int) -> pd.DataFrame:
+        """Return a run's successful results, one row per job, sample and metric.
+        """
+
+        return pd.read_sql("SELECT * FROM results WHERE run_id = ? AND status = 'ok'", self.con, params=(run_id,))
+
+    def versions(self, run_id: int) -> Dict[str, str]:
+
+        return json.loads(self.con.execute("SELECT versions FROM runs WHERE run_id = ?", (run_id,)).fetchone()[0])
+
+    def latestRuns(self, n: int=2) -> List[int]:
+        """Return the ids of the n latest runs, oldest first.
+        """
+
+        return [row[0] for row in self.con.execute("SELECT run_id FROM runs ORDER BY run_id DESC LIMIT ?", (n,))][::-1]
+
+
+def _flag(value) -> int:
+
+    return None if value is None or pd.isna(value) else int(value in (True, 'True', 1))
+
+
+def recordResults(results: pd.DataFrame, label: str=None, path: str=None) -> int:
+    """Record a results table as a new run, returning its id.
+    """
+
+    with BenchmarkStore(path) as store:
+        run_id = store.addRun(label)
+        store.addResults(run_id, results)
+
+    return run_id
+
+
+def profileTimes(profiledir: str) -> pd.DataFrame:
+    """Return each cProfile's total cumulative time in a profile directory, one row per lib and run.
+
+    Profiles are named '[lib] ([db_name]) run [i].prof' by to_cProfile(), with basemap=False and savefig=False.
+    """
+
+    rows = []
+
+    for f in sorted(glob.glob(os.path.join(profiledir, '*.prof'))):
+        lib, _, rest = os.path.basename(f).partition(' (')
+        stats = pstats.Stats(f, stream=io.StringIO())
+        rows.append(dict(lib=lib, sample=int(rest.rsplit('run ', 1)[-1][:-len('.prof')]),
+                         secs=max(ct for _, _, _, ct, _ in stats.stats.values())))
+
+    return pd.DataFrame(rows, columns=['lib', 'sample', 'secs'])
+
+
+def recordProfiles(profiledir: str, db_name: str, label: str=None, path: str=None) -> int:
+    """Record the cProfiles of a profile directory as a new run, taking each profile's total cumulative time as a render sample.
+    """
+
+    results = profileTimes(profiledir).rename(columns={'secs': 'render'})
+    results = results.assign(db=db_name, basemap=False, savefig=False, options='', status='ok')
+
+    return recordResults(results, label, path)
+
+
+def permutationTest(a: np.ndarray, b: np.ndarray, permutations: int=10000, seed: int=0) -> float:
+    """Return the two-sided p-value of the difference in medians between two samples under random relabelling.
+
+    Exact for small samples, where all relabellings are fewer than `permutations`.
+    """
+
+    a, b = np.asarray(a, dtype=float), np.asarray(b, dtype=float)
+    pooled = np.concatenate([a, b])
+    observed = abs(np.median(b) - np.median(a))
+
+    exact = comb(len(pooled), len(a)) <= permutations
+
+    if exact:
+        splits = [np.array(idx) for idx in combinations(range(len(pooled)), len(a))]
+    else:
+        rng = np.random.default_rng(seed)
+        splits = [rng.permutation(len(pooled))[:len(a)] for _ in range(permutations)]
+
+    diffs = np.empty(len(splits))
+    for i, idx in enumerate(splits):
+        mask = np.zeros(len(pooled), dtype=bool)
+        mask[idx] = True
+        diffs[i] = abs(np.median(pooled[~mask]) - np.median(pooled[mask]))
+
+    extreme = np.sum(diffs >= observed - 1e-12)
+
+    # random relabellings count the observed one in, as enumerating all of them does
+    return extreme / len(diffs) if exact else (extreme + 1) / (len(diffs) + 1)
+
+
+def minRepeat(alpha: float=0.05) -> int:
+    """Return the fewest samples per run at which permutationTest() can find a change significant at alpha.
+
+    The smallest attainable p-value of n against n samples is 2 / comb(2n, n), from the two most extreme relabellings,
+    e.g. 0.1 for n=3 and 0.029 for n=4.
+    """
+
+    n = 1
+    while 2 / comb(2 * n, n) > alpha:
+        n += 1
+
+    return n
+
+
+def compareRuns(base: int, new: int, metrics: Tuple[str, ...]=('render', 'load', 'max_rss_mb'), alpha: float=0.05,
+                threshold: float=0.05, path: str=None) -> pd.DataFrame:
+    """Compare the jobs two runs have in common, metric by metric.
+
+    Parameters
+    ----------
+    base, new : int
+        Run ids.
+    alpha : float
+        Significance level of the permutation test.
+    threshold : float
+        Relative change of the median below which changes are not flagged, e.g. 0.05 for 5%.
+
+    Returns
+    ----------
+        One row per job and metric with both medians, the relative change, the p-value, the p-value adjusted by Holm's
+        method across all tested rows and a flag, 'regression' or 'improvement' if the change is both above the threshold
+        and significant after adjustment. If the samples are too few for the test to ever reach alpha, e.g. fewer than
+        minRepeat(alpha) per run, p_value is NaN, tested is False and changes above the threshold are flagged 'untested'.
+    """
+
+    from mapcompare.benchstats import holm
+
+    with BenchmarkStore(path) as store:
+        base_results, new_results = store.results(base), store.results(new)
+
+    keys = KEYS + ['metric']
+    rows = []
+
+    for key, new_group in new_results[new_results['metric'].isin(metrics)].groupby(keys, dropna=False):
+        base_group = base_results.merge(pd.DataFrame([key], columns=keys), on=keys)
+
+        if base_group.empty:
+            continue
+
+        a, b = base_group['value'].values, new_group['value'].values
+        change = np.median(b) / np.median(a) - 1 if np.median(a) else np.nan
+        # the smallest attainable p-value, see minRepeat()
+        tested = 2 / comb(len(a) + len(b), len(a)) <= alpha
+        p_value = permutationTest(a, b) if tested else np.nan
+
+        rows.append(dict(zip(keys, key), base_median=np.median(a), new_median=np.median(b), change=change,
+                         p_value=p_value, n_base=len(a), n_new=len(b), tested=tested))
+
+    table = pd.DataFrame(rows, columns=keys + ['base_median', 'new_median', 'change', 'p_value', 'p_adjusted', 'n_base', 'n_new', 'tested', 'flag'])
+
+    tested = table['tested'].astype(bool)
+    table.loc[tested, 'p_adjusted'] = holm(table.loc[tested, 'p_value'].values)
+
+    above = table['change'].abs() > threshold
+    significant = tested & (table['p_adjusted'] <= alpha)
+
+    table['flag'] = ''
+    table.loc[above & significant, 'flag'] = np.where(table.loc[above & significant, 'change'] > 0, 'regression', 'improvement')
+    table.loc[above & ~tested, 'flag'] = 'untested'
+
+    return table
+
+
+def versionChanges(base: int, new: int, path: str=None) -> Dict[str, Tuple[str, str]]:
+    """Return the tracked libraries whose versions differ between two runs, as {name: (base version, new version)}.
+    """
+
+    with BenchmarkStore(path) as store:
+        a, b = store.versions(base), store.versions(new)
+
+    return {name: (a.get(name), b.get(name)) for name in sorted(set(a) | set(b)) if a.get(name) != b.get(name)}
@@ -1,6 +1,8 @@
 """Defines the to_cProfile() decorator applied to renderFigure() in the executables for each visualisation library.
 
 cProfiles are only created for decorated functions, if basemap=False and savefig=False to not skew results due to tile fetching or writing to disk.
+With MAPCOMPARE_PROFILE=False, as set for the render matrix and the worker, the function is called once without profiling.
+With the figure_metrics input set, structural metrics of the rendered figure are recorded next to the profiles, see figmetrics.py.
 """
 
 import wrapt
@@ -8,32 +10,71 @@ import os
 import re
 import inspect
 import cProfile
+from mapcompare import figmetrics
+from mapcompare.inputs import override
 
 # INPUT
 num_times = 10 # number of runs when benchmarking
 
+def _profileNames(func):
+    """Return db_name, the profile directory and the module name of a decorated function.
+    """
+
+    db_name = re.findall(r"'(.*?)'", str(inspect.signature(func).parameters['db_name']).split('=')[1])[0]
+        
+    viz_type = re.findall(r"'(.*?)'", str(inspect.signature(func).parameters['viz_type']).split('=')[1])[0]
+
+    profiledir = 'mapcompare/profiles/' + viz_type + db_name + "/"
+
+    mod_name = os.path.basename(inspect.getmodule(func).__file__)
+
+    # scripts offering an alternative rendering path, e.g. carto.py with prepath=True,
+    # set a profile_suffix to keep their profiles apart from the default path
+    mod_name = mod_name[:-3] + getattr(inspect.getmodule(func), 'profile_suffix', '') + '.py'
+
+    return db_name, profiledir, mod_name
+
+
 @wrapt.decorator
 def to_cProfile(func, instance, args, kwargs):
-    """Create cProfile of the wrapped function only if no basemap is added.
+    """Create cProfile of the wrapped function only if no basemap is added, and capture the figure rendered if figure_metrics is set.
     
     This is to avoid tile loading affecting performance measurement of the core rendering functionality.
-    """    
-    
-    db_name = re.findall(r"'(.*?)'", str(inspect.signature(func).parameters['db_name']).split('=')[1])[0]
-        
-    viz_type = re.findall(r"'(.*?)'", str(inspect.signature(func).parameters['viz_type']).split('=')[1])[0]
+    Metrics are measured after the call, or after timedMain()'s timed call, see figmetrics.py.
+    """
+
+    if not figmetrics.enabled():
+        return _profile(func, args, kwargs)
+
+    with figmetrics.captureFigures(inspect.getmodule(func)) as captured:
+        value = _profile(func, args, kwargs)
+
+    db_name, profiledir, mod_name = _profileNames(func)
+    figmetrics.pending.append((captured, profiledir + mod_name[:-3] + ' (' + db_name + ")" + " metrics.json"))
+
+    if not figmetrics.defer:
+        figmetrics.flush()
+
+    return value
+
+
+def _profile(func, args, kwargs):
+    """Profile the wrapped function as described by to_cProfile().
+    """
+
+    # read per call, as the module is reloaded by the scripts
+    if not override('profile', True):
+        return func(*args, **kwargs)
+
+    db_name, profiledir, mod_name = _profileNames(func)
 
     basemap_val = str(inspect.signature(func).parameters['basemap'])[-5:]
 
     savefig_val = str(inspect.signature(func).parameters['savefig'])[-5:]
 
-    profiledir = 'mapcompare/profiles/' + viz_type + db_name + "/"
-
     if not os.path.exists(profiledir):
         os.makedirs(profiledir)
 
-    mod_name = os.path.basename(inspect.getmodule(func).__file__)
-
     """The below if and elif block make performance benchmarking for successive runs
     manual except for the 'out of competition' runs of datashader.
     This is to keep approaches like reuse of already drawn canvases from skewing results.
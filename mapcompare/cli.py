@@ -0,0 +1,355 @@
+"""The mapcompare command: run any of the scripts with its inputs given as options rather than edited in the script.
+
+    mapcompare list
+    mapcompare render --lib gpd --db dd --basemap --savefig
+    mapcompare render --lib carto --db dd_subset --set prepath=True
+    mapcompare worker --preload gpd --preload ds
+    mapcompare render --lib ds --db dd --savefig --output /tmp/maps --worker
+    mapcompare matrix --db dd_subset --workers 4 --mem-mb 8000
+    mapcompare matrix --lib bkh --db dd_subset --repeat 5 --label "bokeh upgrade"
+    mapcompare compare --metric render --metric max_rss_mb
+    mapcompare warmup --repeat 3
+    mapcompare tiles --port 8002
+    mapcompare tiles --pyramid dd --port 8001
+
+Only the chosen script, and hence only its visualisation library, is imported. Import time of the script, time spent
+querying and preparing the layers, and render time of renderFigure() are reported separately. Inputs are passed as
+environment variables read by the scripts' override() calls (see inputs.py), so that profiles are named as before.
+
+Run from within the repository, as the scripts are not part of the package and write to mapcompare/outputs/ and mapcompare/profiles/.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import functools
+import importlib.util
+from typing import Dict, List
+from mapcompare.inputs import envName
+
+scriptsdir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts') + os.sep
+
+# --lib choices by script, all exposing main()
+LIBS = {
+    'alt': 'Altair + Vega-Lite',
+    'bkh': 'Bokeh',
+    'carto': 'Cartopy + Matplotlib',
+    'ds': 'datashader',
+    'ds_tiles': 'datashader XYZ tile pyramid',
+    'gpd': 'GeoPandas + Matplotlib',
+    'gplt': 'geoplot + Matplotlib',
+    'gv': 'GeoViews + Bokeh/Matplotlib',
+    'gv_ds': 'GeoViews + datashader + Bokeh',
+    'hv_plot': 'hvPlot',
+    'mpl_pc': 'flattened PathCollection + Matplotlib',
+    'osm_tiles': 'OSM basemap tile prefetch',
+    'output_comp': 'write time and file size of the savefig output strategies',
+    'plotly_gl': 'Plotly WebGL triangle meshes',
+    'plotly_py': 'Plotly',
+    'snapshot': 'Arrow IPC snapshot export',
+    'tiled': 'tiled poster rendering'
+}
+
+
+def loadScript(lib: str):
+    """Import a script as a module, without running its main(), and return it.
+    """
+
+    path = scriptsdir + lib + '.py'
+
+    spec = importlib.util.spec_from_file_location('mapcompare_' + lib, path)
+    module = importlib.util.module_from_spec(spec)
+
+    # registered so that to_cProfile() can resolve the module of renderFigure()
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def _setInputs(args: argparse.Namespace) -> None:
+
+    if args.db is not None:
+        os.environ[envName('db_name')] = args.db
+
+    if args.basemap is not None:
+        os.environ[envName('basemap')] = str(args.basemap)
+
+    if args.savefig is not None:
+        os.environ[envName('savefig')] = str(args.savefig)
+
+    for item in args.set:
+        name, _, value = item.partition('=')
+        os.environ[envName(name)] = value
+
+
+def timedMain(module) -> Dict[str, float]:
+    """Run a loaded script's main(), timing renderFigure() separately from querying and preparing the layers.
+
+    Returns
+    ----------
+        load, render and write time in secs, the latter part of render time, the bytes written, see writers.py,
+        and with the figure_metrics input set, the metrics of the figure rendered prefixed with 'fig_', see figmetrics.py
+    """
+
+    from mapcompare import figmetrics
+
+    render_times = []
+    metric_times = []
+    metrics = {}
+    writers = sys.modules.get('mapcompare.writers')
+    first_write = len(writers.writes) if writers else 0
+
+    if hasattr(module, 'renderFigure'):
+        renderFigure = module.renderFigure
+
+        # main() looks renderFigure up as a module global, hence replacing it times every call
+        @functools.wraps(renderFigure)
+        def timedRenderFigure(*func_args, **func_kwargs):
+            render_start = time.perf_counter()
+            value = renderFigure(*func_args, **func_kwargs)
+            render_times.append(time.perf_counter() - render_start)
+            # measured outside the timed call
+            metrics_start = time.perf_counter()
+            for name, metric in figmetrics.flush().items():
+                metrics[name] = max(metrics.get(name, 0), metric)
+            metric_times.append(time.perf_counter() - metrics_start)
+            return value
+
+        module.renderFigure = timedRenderFigure
+
+    figmetrics.defer = True
+    start_time = time.perf_counter()
+
+    try:
+        module.main()
+    finally:
+        figmetrics.defer = False
+        # not wrapped again when the worker reuses the module, see worker.py
+        if hasattr(module, 'renderFigure'):
+            module.renderFigure = renderFigure
+
+    # less the time spent measuring the metrics, neither load nor render time
+    total_time = time.perf_counter() - start_time - sum(metric_times)
+
+    writes = writers.writes[first_write:] if writers else []
+
+    timings = {'load': total_time - sum(render_times), 'render': sum(render_times),
+               'write': sum(write['secs'] for write in writes), 'written_bytes': sum(write['bytes'] for write in writes)}
+
+    timings.update({'fig_' + name: value for name, value in metrics.items()})
+
+    return timings
+
+
+def render(args: argparse.Namespace) -> None:
+    """Run a script's main() with the given inputs, reporting import, load and render times.
+    """
+
+    if args.worker:
+        from mapcompare.worker import submit
+        timings = submit(dict(lib=args.lib, db=args.db, basemap=args.basemap, savefig=args.savefig,
+                              options=dict(item.partition('=')[::2] for item in args.set), output=args.output,
+                              snapshot=args.snapshot))
+        timings.pop('status', None)
+        print("\n{} ({}) on worker: import {:.2f} secs, load {:.2f} secs, render {:.2f} secs".format(
+            args.lib, LIBS[args.lib], timings['import'], timings['load'], timings['render']))
+
+        if args.timings is not None:
+            with open(args.timings, 'w') as f:
+                json.dump(timings, f)
+        return
+
+    if args.mem_mb is not None or args.cpu_secs is not None or args.core is not None:
+        from mapcompare.matrix import applyLimits
+        applyLimits(args.mem_mb, args.cpu_secs, args.core)
+
+    _setInputs(args)
+
+    # scripts use paths relative to the repository root
+    os.chdir(os.path.dirname(os.path.dirname(scriptsdir)))
+
+    start_time = time.perf_counter()
+    module = loadScript(args.lib)
+    import_time = time.perf_counter() - start_time
+
+    if args.output is not None:
+        module.outputdir = os.path.join(args.output, '')
+
+    if args.snapshot:
+        # same signature as sql2gdf(), exporting the snapshot on first use
+        from mapcompare.snapshot import loadSnapshot
+        module.sql2gdf = loadSnapshot
+
+    timings = dict(timedMain(module), **{'import': import_time})
+
+    print("\n{} ({}): import {:.2f} secs, load {:.2f} secs, render {:.2f} secs".format(
+        args.lib, LIBS[args.lib], timings['import'], timings['load'], timings['render']))
+
+    if args.timings is not None:
+        with open(args.timings, 'w') as f:
+            json.dump(timings, f)
+
+
+def matrix(args: argparse.Namespace) -> None:
+    """Run the render matrix in parallel subprocesses, see matrix.py.
+    """
+
+    from mapcompare.matrix import expandMatrix, runMatrix
+    jobs = expandMatrix(args.lib or None, args.db or None, repeat=args.repeat)
+    runMatrix(jobs, workers=args.workers, mem_mb=args.mem_mb, cpu_secs=args.cpu_secs, timeout=args.timeout,
+              label=args.label, store=args.store, pin=args.pin)
+
+
+def compare(args: argparse.Namespace) -> None:
+    """Compare two runs of the benchmark store, exiting with status 1 if any regression is found, see benchstore.py.
+    """
+
+    import pandas as pd
+    from mapcompare.benchstore import BenchmarkStore, compareRuns, minRepeat, versionChanges
+
+    with BenchmarkStore(args.store) as store:
+        latest = store.latestRuns(2)
+
+    if len(latest) < 2 and (args.base is None or args.new is None):
+        sys.exit("At least two runs are required in the benchmark store")
+
+    base = args.base if args.base is not None else latest[0]
+    new = args.new if args.new is not None else latest[-1]
+
+    print("Run {} vs. run {}".format(base, new))
+    for name, (before, after) in versionChanges(base, new, args.store).items():
+        print("    {}: {} -> {}".format(name, before, after))
+
+    table = compareRuns(base, new, tuple(args.metric or ('render', 'load', 'max_rss_mb')), alpha=args.alpha,
+                        threshold=args.threshold, path=args.store)
+
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(table.to_string(index=False, float_format='{:.3f}'.format))
+
+    if not table['tested'].all():
+        print("Too few samples to test {} of {} changes for significance, those above the threshold flagged as untested. "
+              "Repeat each job at least {} times, e.g. mapcompare matrix --repeat {}".format(
+                  (~table['tested']).sum(), len(table), minRepeat(args.alpha), minRepeat(args.alpha)))
+
+    if (table['flag'] == 'regression').any():
+        sys.exit(1)
+
+
+def firstRun(args: argparse.Namespace) -> None:
+    """Report datashader's first render latency in fresh processes without and with warmup(), see warmup.py.
+    """
+
+    from mapcompare.warmup import compareFirstRun
+    results = compareFirstRun(args.repeat)
+    print(results.groupby('warm')[['import', 'warmup', 'first', 'second']].median().round(3).to_string())
+
+
+def serve(args: argparse.Namespace) -> None:
+    """Start the warm worker daemon, see worker.py.
+    """
+
+    from mapcompare.worker import serve as serveWorker
+    serveWorker(port=args.port, preload=args.preload)
+
+
+def tiles(args: argparse.Namespace) -> None:
+    """Serve the OSM tile cache, or a datashader tile pyramid, to browsers until interrupted, see tilecache.py.
+    """
+
+    from mapcompare.tilecache import TileCache, serveForever
+
+    if args.pyramid:
+        from mapcompare.tilepyramid import pyramiddir
+        cache = TileCache(pyramiddir + args.pyramid + os.sep, offline=True)
+    else:
+        cache = TileCache(offline=args.offline)
+
+    serveForever(cache, host=args.host, port=args.port)
+
+
+def listLibs(args: argparse.Namespace) -> None:
+    """Print the available --lib choices.
+    """
+
+    for lib, description in LIBS.items():
+        print("{:<10} {}".format(lib, description))
+
+
+def parser() -> argparse.ArgumentParser:
+
+    p = argparse.ArgumentParser(prog='mapcompare', description="Render the map template with one of the compared libraries.")
+    sub = p.add_subparsers(dest='command', required=True)
+
+    r = sub.add_parser('render', help="run a script with the given inputs")
+    r.add_argument('--lib', required=True, choices=list(LIBS))
+    r.add_argument('--db', default=None, choices=['dd', 'dd_subset'], help="defaults to the script's INPUTS")
+    # paired flags sharing a dest, as argparse.BooleanOptionalAction requires Python 3.9
+    for name in ('basemap', 'savefig'):
+        r.add_argument('--' + name, dest=name, action='store_true', default=None, help="defaults to the script's INPUTS")
+        r.add_argument('--no-' + name, dest=name, action='store_false', default=None)
+    r.add_argument('--set', action='append', default=[], metavar='NAME=VALUE', help="override any other input read via override()")
+    r.add_argument('--output', default=None, help="directory to save figures to instead of mapcompare/outputs/")
+    r.add_argument('--worker', action='store_true', help="submit the render to a running worker daemon instead")
+    r.add_argument('--snapshot', action='store_true', help="load the layers from the database's Arrow IPC snapshot rather than PostGIS")
+    r.add_argument('--timings', default=None, metavar='PATH', help="also write the timings to a JSON file")
+    r.add_argument('--mem-mb', type=int, default=None, help="address space limit of this process, Unix only")
+    r.add_argument('--cpu-secs', type=int, default=None, help="CPU time limit of this process, Unix only")
+    r.add_argument('--core', type=int, default=None, help="pin this process to a core, Linux only")
+    r.set_defaults(func=render)
+
+    m = sub.add_parser('matrix', help="run every library across databases, basemap and savefig in parallel")
+    m.add_argument('--lib', action='append', default=[], choices=list(LIBS), help="defaults to all renderers")
+    m.add_argument('--db', action='append', default=[], choices=['dd', 'dd_subset'], help="defaults to both")
+    m.add_argument('--workers', type=int, default=None, help="concurrent jobs, defaults to the number of cores")
+    m.add_argument('--mem-mb', type=int, default=None, help="address space limit per job")
+    m.add_argument('--cpu-secs', type=int, default=None, help="CPU time limit per job")
+    m.add_argument('--timeout', type=float, default=None, help="wall time limit per job in secs")
+    m.add_argument('--repeat', type=int, default=1, help="samples per job, at least 4 for compare to test changes for significance")
+    m.add_argument('--pin', action='store_true', help="pin each job to a core of its own")
+    m.add_argument('--label', default=None, help="label of the run in the benchmark store")
+    m.add_argument('--store', default=None, metavar='PATH', help="benchmark store, defaults to mapcompare/outputs/benchmarks.sqlite")
+    m.set_defaults(func=matrix)
+
+    c = sub.add_parser('compare', help="flag significant regressions between two runs of the benchmark store")
+    c.add_argument('--base', type=int, default=None, help="run id, defaults to the second latest run")
+    c.add_argument('--new', type=int, default=None, help="run id, defaults to the latest run")
+    c.add_argument('--metric', action='append', default=[], help="defaults to render, load and max_rss_mb")
+    c.add_argument('--alpha', type=float, default=0.05, help="significance level")
+    c.add_argument('--threshold', type=float, default=0.05, help="relative change of the median to flag, e.g. 0.05")
+    c.add_argument('--store', default=None, metavar='PATH', help="benchmark store, defaults to mapcompare/outputs/benchmarks.sqlite")
+    c.set_defaults(func=compare)
+
+    j = sub.add_parser('warmup', help="time datashader's first render without and with warmup()")
+    j.add_argument('--repeat', type=int, default=3, help="fresh processes each")
+    j.set_defaults(func=firstRun)
+
+    w = sub.add_parser('worker', help="start a worker daemon keeping libraries imported and layers loaded")
+    w.add_argument('--port', type=int, default=None, help="defaults to MAPCOMPARE_WORKER_PORT or 6010")
+    w.add_argument('--preload', action='append', default=[], metavar='LIB', choices=list(LIBS), help="import a script's libraries at startup")
+    w.set_defaults(func=serve)
+
+    t = sub.add_parser('tiles', help="serve the OSM tile cache to browser-based basemaps, see tile_cache in the scripts' INPUTS")
+    t.add_argument('--host', default='localhost', help="e.g. 0.0.0.0 to serve a Bokeh Server's remote clients")
+    t.add_argument('--port', type=int, default=8002, help="point MAPCOMPARE_TILE_URL at it if not 8002")
+    t.add_argument('--offline', action='store_true', help="serve cached tiles only, never fetching from OSM")
+    t.add_argument('--pyramid', default=None, choices=['dd', 'dd_subset'], help="serve the database's tile pyramid written by scripts/ds_tiles.py instead, see pyramid_url in the apps")
+    t.set_defaults(func=tiles)
+
+    ls = sub.add_parser('list', help="list the available libraries")
+    ls.set_defaults(func=listLibs)
+
+    return p
+
+
+def main(argv: List[str]=None) -> None:
+
+    args = parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,284 @@
+"""Incremental sync of the three layers with PostGIS, fetching only the rows of ax_gebaeude and ax_fliessgewaesser changed since.
+
+sql2gdf() refetches all buildings and has PostGIS recompute the 500m buffer classification on every call. Instead, DeltaSync
+    - caches the layers, indexed by gml_id, along with the buffer geometry in mapcompare/temp/deltasync/[db_name].pkl
+    - tracks a high-water mark on the transaction ids in the xmin system column, i.e. the oldest transaction still running
+      at the last sync, and fetches only rows inserted or updated by transactions from then on
+    - finds deleted rows by comparing the gml_ids in the database, fetched without geometries, to the cached ones
+    - classifies changed buildings against the cached buffer locally, and only if rivers have changed recomputes the
+      buffer and reclassifies all cached buildings, still without refetching them
+    - patches the cached layers and returns a ChangeSet of the rows inserted, updated and deleted per layer
+
+The first sync, and any sync after an xmin wraparound, i.e. the current mark falling below the cached one, is a full sync.
+Its ChangeSet carries reset=True and the complete layers instead of row changes, so consumers holding copies of the
+layers must replace them rather than apply changes, as ChangeSet.applyToSource() does for a Bokeh ColumnDataSource.
+"""
+
+import os
+import pickle
+from typing import Dict, Tuple
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from sqlalchemy import create_engine
+from mapcompare.ragged import RaggedGeometry
+
+# relative to the package, as the Bokeh Server apps are run from within apps/
+syncdir = os.path.join(os.path.dirname(__file__), 'temp', 'deltasync') + os.sep
+
+LAYER_NAMES = ('buildings_in', 'buildings_out', 'rivers')
+BUFFER_M = 500
+CRS = 'epsg:25833'
+
+_sql_buildings = "SELECT g.gml_id, g.use, g.wkb_geometry as geom FROM public.ax_gebaeude as g{where};"
+_sql_rivers = "SELECT f.gml_id, f.wkb_geometry as geom FROM public.ax_fliessgewaesser as f{where};"
+_sql_changed = " WHERE {alias}.xmin::text::bigint >= {mark:d}"
+_sql_ids = "SELECT gml_id FROM public.{table};"
+_sql_buffer = "SELECT ST_Union(ST_Buffer(f.wkb_geometry, " + str(BUFFER_M) + ")) as geom FROM public.ax_fliessgewaesser as f;"
+# 32-bit xid of the oldest transaction still running, rows of which may become visible only after this sync
+_sql_mark = "SELECT txid_snapshot_xmin(txid_current_snapshot()) % 4294967296 as mark;"
+
+
+class ChangeSet:
+    """Rows inserted, updated and deleted per layer by a sync, keyed by gml_id.
+
+    A building reclassified into the other layer is deleted from one and inserted into the other.
+
+    Parameters
+    ----------
+    layers : tuple of GeoDataFrame, optional
+        The complete layers after a full sync, setting reset=True: any copy of the layers must then be replaced as a whole.
+    """
+
+    def __init__(self, layers: Tuple[gpd.GeoDataFrame, gpd.GeoDataFrame, gpd.GeoDataFrame]=None):
+
+        empty = gpd.GeoDataFrame(geometry=gpd.GeoSeries([], crs=CRS), crs=CRS).rename_geometry('geom')
+        self.changes = {name: {'insert': empty, 'update': empty, 'delete': pd.Index([], name='gml_id')} for name in LAYER_NAMES}
+        self.reset = layers is not None
+        self.layers = dict(zip(LAYER_NAMES, layers)) if layers is not None else None
+
+    def __bool__(self) -> bool:
+
+        return self.reset or any(len(change[kind]) for change in self.changes.values() for kind in change)
+
+    def summary(self) -> str:
+
+        if self.reset:
+            return "full sync: " + ", ".join("{}: {}".format(name, len(layer)) for name, layer in self.layers.items())
+
+        return ", ".join("{}: +{} ~{} -{}".format(name, len(change['insert']), len(change['update']), len(change['delete']))
+                         for name, change in self.changes.items())
+
+    def applyToSource(self, layer: str, source, epsg: int=3857) -> None:
+        """Apply a layer's changes to a Bokeh ColumnDataSource with 'gml_id', 'xs' and 'ys' columns as drawn by multi_polygons().
+
+        Updates are sent as patch(), inserts as stream(). As a ColumnDataSource cannot drop rows incrementally,
+        deleted rows are patched to empty geometries. After a full sync, i.e. reset=True, source.data is replaced.
+        Call from within the document's lock, e.g. a periodic callback.
+        """
+
+        if self.reset:
+            columns = bokehColumns(self.layers[layer], epsg)
+            source.data = {column: values for column, values in columns.items() if column in source.data}
+            return
+
+        change = self.changes[layer]
+        rows = {gml_id: i for i, gml_id in enumerate(source.data['gml_id'])}
+        patches = {}
+
+        if len(change['update']):
+            columns = bokehColumns(change['update'], epsg)
+            for column in columns:
+                if column != 'gml_id' and column in source.data:
+                    patches[column] = [(rows[gml_id], value) for gml_id, value in zip(columns['gml_id'], columns[column]) if gml_id in rows]
+
+        deleted = [rows[gml_id] for gml_id in change['delete'] if gml_id in rows]
+        for column in ('xs', 'ys'):
+            patches.setdefault(column, []).extend((i, []) for i in deleted)
+
+        patches = {column: values for column, values in patches.items() if values}
+
+        if patches:
+            source.patch(patches)
+
+        if len(change['insert']):
+            columns = bokehColumns(change['insert'], epsg)
+            source.stream({column: values for column, values in columns.items() if column in source.data})
+
+
+def bokehColumns(gdf: gpd.GeoDataFrame, epsg: int=3857) -> Dict[str, list]:
+    """Return the 'gml_id', 'xs' and 'ys' columns, plus any attributes, of a layer indexed by gml_id in multi_polygons() layout.
+    """
+
+    gdf = gdf.to_crs(epsg=epsg)
+    columns = RaggedGeometry.fromShapely(np.asarray(gdf.geometry.values)).toBokeh()
+    columns['gml_id'] = list(gdf.index)
+
+    for column in gdf.columns:
+        if column != gdf.geometry.name:
+            columns[column] = list(gdf[column])
+
+    return columns
+
+
+def _dropUnchanged(layer: gpd.GeoDataFrame, changed: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """Drop fetched rows identical to the cached ones, e.g. rows of transactions still running at the last sync, fetched again.
+    """
+
+    cached = changed.index.intersection(layer.index)
+
+    if not len(cached):
+        return changed
+
+    same = shapely.equals_exact(np.asarray(layer.geometry.loc[cached].values), np.asarray(changed.geometry.loc[cached].values), 0)
+
+    for column in changed.columns:
+        if column != changed.geometry.name:
+            same &= (layer.loc[cached, column].values == changed.loc[cached, column].values)
+
+    return changed.drop(cached[same])
+
+
+def _patch(layer: gpd.GeoDataFrame, changed: gpd.GeoDataFrame, deleted: pd.Index) -> gpd.GeoDataFrame:
+    """Return a layer without its deleted rows, and with changed rows replaced or appended.
+    """
+
+    return pd.concat([layer.drop(deleted.union(changed.index.intersection(layer.index))), changed])
+
+
+def _layerChanges(before: gpd.GeoDataFrame, after: gpd.GeoDataFrame, changed: pd.Index) -> dict:
+    """Return the rows inserted into, updated within and deleted from a layer between two versions of it.
+    """
+
+    return {
+        'insert': after.loc[after.index.difference(before.index)],
+        'update': after.loc[after.index.intersection(before.index).intersection(changed)],
+        'delete': before.index.difference(after.index)
+    }
+
+
+class DeltaSync:
+    """Cached layers of a database, kept in sync with PostGIS incrementally.
+
+    Parameters
+    ----------
+    db_name : {'dd', 'dd_subset'}
+        Source PostGIS database.
+    password : str
+    path : str, optional
+        Cache file, defaulting to mapcompare/temp/deltasync/[db_name].pkl.
+    """
+
+    def __init__(self, db_name: str, password: str, path: str=None):
+
+        self.db_name = db_name
+        self.path = path or syncdir + db_name + '.pkl'
+        self.con = create_engine("postgresql://postgres:" + password + "@localhost:5432/" + db_name)
+        self.layers = None
+        self.buffer = None
+        self.mark = None
+
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+            self.layers, self.buffer, self.mark = state['layers'], state['buffer'], state['mark']
+            shapely.prepare(self.buffer)
+
+    def _save(self) -> None:
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        with open(self.path + '.tmp', 'wb') as f:
+            pickle.dump({'layers': self.layers, 'buffer': self.buffer, 'mark': self.mark}, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(self.path + '.tmp', self.path)
+
+    def _currentMark(self) -> int:
+
+        return int(pd.read_sql(_sql_mark, self.con)['mark'].iloc[0])
+
+    def _fetch(self, sql: str, table_alias: str, mark: int=None) -> gpd.GeoDataFrame:
+
+        where = _sql_changed.format(alias=table_alias, mark=mark) if mark is not None else ''
+        gdf = gpd.GeoDataFrame.from_postgis(sql.format(where=where), self.con, crs=CRS)
+
+        return gdf.set_index('gml_id')
+
+    def _fetchBuffer(self) -> None:
+
+        self.buffer = gpd.GeoDataFrame.from_postgis(_sql_buffer, self.con, crs=CRS).geometry.iloc[0]
+        shapely.prepare(self.buffer)
+
+    def _classify(self, buildings: gpd.GeoDataFrame) -> np.ndarray:
+        """Return whether buildings are within or intersect the buffer, as in sql2gdf()'s queries.
+        """
+
+        return shapely.intersects(self.buffer, np.asarray(buildings.geometry.values))
+
+    def full(self) -> Tuple[gpd.GeoDataFrame, gpd.GeoDataFrame, gpd.GeoDataFrame]:
+        """Fetch all rows and the buffer, and classify all buildings.
+        """
+
+        mark = self._currentMark()
+
+        buildings = self._fetch(_sql_buildings, 'g')
+        rivers = self._fetch(_sql_rivers, 'f')
+        self._fetchBuffer()
+
+        within = self._classify(buildings)
+        self.layers = (buildings[within], buildings[~within], rivers)
+        self.mark = mark
+        self._save()
+
+        return self.layers
+
+    def sync(self) -> ChangeSet:
+        """Fetch the rows changed since the last sync, patch the cached layers and return the changes.
+
+        Returns a ChangeSet with reset=True, holding the complete layers, if a full sync was run instead.
+        """
+
+        if self.layers is None:
+            return ChangeSet(self.full())
+
+        mark = self._currentMark()
+
+        if mark < self.mark:
+            # xid wraparound: marks are no longer comparable
+            return ChangeSet(self.full())
+
+        changes = ChangeSet()
+
+        buildings_in, buildings_out, rivers = self.layers
+
+        # rivers first, as changed rivers change the buffer
+        river_ids = pd.Index(pd.read_sql(_sql_ids.format(table='ax_fliessgewaesser'), self.con)['gml_id'])
+        changed_rivers = _dropUnchanged(rivers, self._fetch(_sql_rivers, 'f', self.mark))
+        new_rivers = _patch(rivers, changed_rivers, rivers.index.difference(river_ids))
+        changes.changes['rivers'] = _layerChanges(rivers, new_rivers, changed_rivers.index)
+
+        building_ids = pd.Index(pd.read_sql(_sql_ids.format(table='ax_gebaeude'), self.con)['gml_id'])
+        cached = pd.concat([buildings_in, buildings_out])
+        changed = _dropUnchanged(cached, self._fetch(_sql_buildings, 'g', self.mark))
+        buildings = _patch(cached, changed, cached.index.difference(building_ids))
+
+        if any(len(rows) for rows in changes.changes['rivers'].values()):
+            # buffer changed: reclassify all buildings, cached ones without refetching them
+            self._fetchBuffer()
+            within = pd.Series(self._classify(buildings), index=buildings.index)
+        else:
+            # otherwise only the changed buildings, the others keeping their layer
+            within = pd.Series(buildings.index.isin(buildings_in.index), index=buildings.index)
+            within[changed.index] = self._classify(changed)
+
+        new_in, new_out = buildings[within.values], buildings[~within.values]
+
+        changes.changes['buildings_in'] = _layerChanges(buildings_in, new_in, changed.index)
+        changes.changes['buildings_out'] = _layerChanges(buildings_out, new_out, changed.index)
+
+        self.layers = (new_in, new_out, new_rivers)
+        self.mark = mark
+        self._save()
+
+        return changes
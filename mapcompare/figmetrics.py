@@ -0,0 +1,230 @@
+"""Structural metrics of the figures rendered by renderFigure(), to relate the cost of each library to what it produces.
+
+captureFigures() records, while renderFigure() runs, the objects it hands to the libraries' display functions, i.e.
+show(), display(), fig.show(), gv.output() and tf.shade(), as well as new matplotlib figures. The functions are
+replaced for the duration of the call only, without tracing, so that profiles are not affected. Afterwards,
+figureMetrics() measures per object:
+    - matplotlib: number of artists and of path vertices
+    - Bokeh: number of models, size of the document JSON as embedded in HTML and of the arrays sent as binary buffers
+      by Bokeh Server
+    - HoloViews/GeoViews/hvPlot: as Bokeh or matplotlib, rendered with the backend the script displayed the object with,
+      i.e. the backend passed to e.g. gv.output(), or else the current backend at the time
+    - Plotly: number of traces and figure JSON size
+    - Altair: Vega-Lite spec size incl. inline data
+    - datashader: aggregate shape, i.e. height, width and, for categorical aggregates, categories
+
+Measuring is opt-in via the figure_metrics input, e.g. `--set figure_metrics=True`, as serialising a Bokeh document of
+144k patches or rendering a HoloViews object a second time costs about as much as the render itself. It happens after
+renderFigure() has returned: to_cProfile() only captures the objects, and flush() measures them, immediately for scripts
+run directly, or after the timed call for scripts run by timedMain(), so that render times exclude it.
+
+Metrics are written next to the profiles as '[lib] ([db_name]) metrics.json', and returned by timedMain() prefixed
+with 'fig_', i.e. reported in the results of `mapcompare matrix`.
+"""
+
+import os
+import sys
+import json
+import contextlib
+from typing import Dict, List
+import numpy as np
+from mapcompare.inputs import override
+
+# latest metrics of this process
+last: Dict[str, float] = {}
+
+# captured objects and the metrics path of each call not measured yet, see flush()
+pending: List[tuple] = []
+
+# set by timedMain() while it runs a script, which then calls flush() after each timed call
+defer = False
+
+# display functions looked up as attributes at call time, by module and attribute name
+_LIBRARY_TARGETS = [('plotly.io', 'show'), ('holoviews', 'output'), ('geoviews', 'output'), ('datashader.transfer_functions', 'shade')]
+_MODULE_TARGETS = ('show', 'display')
+
+
+def enabled() -> bool:
+    """Return the figure_metrics input, read per call as the worker sets inputs per job.
+    """
+
+    return override('figure_metrics', False)
+
+
+@contextlib.contextmanager
+def captureFigures(module):
+    """Record the objects passed to display functions, and new matplotlib figures, within the block.
+
+    Parameters
+    ----------
+    module : module
+        The script, whose show() and display() globals are replaced as well.
+
+    Yields
+    ----------
+        The list of captured objects, each with the HoloViews backend active when captured, complete on exiting the block.
+    """
+
+    captured = []
+    replaced = []
+
+    def capturing(original):
+        def wrapper(*args, **kwargs):
+            captured.append((args[0] if args else kwargs.get('obj'), kwargs.get('backend') or _currentBackend()))
+            return original(*args, **kwargs)
+        return wrapper
+
+    targets = [(module, name) for name in _MODULE_TARGETS if callable(getattr(module, name, None))]
+    targets += [(sys.modules[name], attr) for name, attr in _LIBRARY_TARGETS if name in sys.modules and hasattr(sys.modules[name], attr)]
+
+    for owner, attr in targets:
+        original = getattr(owner, attr)
+        replaced.append((owner, attr, original))
+        setattr(owner, attr, capturing(original))
+
+    plt = sys.modules.get('matplotlib.pyplot')
+    figures_before = set(plt.get_fignums()) if plt else set()
+
+    try:
+        yield captured
+    finally:
+        for owner, attr, original in replaced:
+            setattr(owner, attr, original)
+
+        plt = sys.modules.get('matplotlib.pyplot')
+        if plt:
+            captured.extend((plt.figure(num), None) for num in plt.get_fignums() if num not in figures_before)
+
+
+def _currentBackend() -> str:
+    """Return HoloViews' current backend, None if HoloViews has not been imported.
+    """
+
+    hv = sys.modules.get('holoviews')
+
+    return hv.Store.current_backend if hv is not None else None
+
+
+def _matplotlibMetrics(fig) -> Dict[str, float]:
+
+    from matplotlib.collections import Collection
+    from matplotlib.lines import Line2D
+    from matplotlib.patches import Patch
+
+    artists = fig.findobj()
+    vertices = 0
+
+    for artist in artists:
+        if isinstance(artist, Collection):
+            vertices += sum(len(path.vertices) for path in artist.get_paths())
+        elif isinstance(artist, Patch):
+            vertices += len(artist.get_path().vertices)
+        elif isinstance(artist, Line2D):
+            vertices += len(artist.get_xydata())
+
+    return {'mpl_artists': len(artists), 'mpl_vertices': vertices}
+
+
+def _bokehMetrics(model) -> Dict[str, float]:
+
+    from bokeh.embed import json_item
+    from bokeh.models import ColumnDataSource
+
+    models = model.references()
+    buffers = sum(value.nbytes for source in models if isinstance(source, ColumnDataSource)
+                  for value in source.data.values() if isinstance(value, np.ndarray))
+
+    return {'bokeh_models': len(models), 'bokeh_json_bytes': len(json.dumps(json_item(model))), 'bokeh_buffer_bytes': buffers}
+
+
+def figureMetrics(obj, backend: str=None) -> Dict[str, float]:
+    """Return the structural metrics of a figure, keyed by library and metric, empty for unknown objects.
+
+    Parameters
+    ----------
+    obj : object
+        Figure, e.g. a matplotlib Figure, Bokeh model or HoloViews object.
+    backend : str, optional
+        HoloViews backend to render HoloViews objects with, e.g. 'matplotlib', defaulting to the current backend.
+    """
+
+    module = type(obj).__module__.split('.')[0]
+
+    if module == 'matplotlib':
+        from matplotlib.figure import Figure
+        return _matplotlibMetrics(obj) if isinstance(obj, Figure) else {}
+
+    if module == 'bokeh':
+        from bokeh.model import Model
+        return _bokehMetrics(obj) if isinstance(obj, Model) else {}
+
+    if module in ('holoviews', 'geoviews'):
+        import holoviews as hv
+        return figureMetrics(hv.render(obj, backend=backend or hv.Store.current_backend))
+
+    if module == 'plotly':
+        return {'plotly_traces': len(obj.data), 'plotly_json_bytes': len(obj.to_json())}
+
+    if module == 'altair':
+        return {'vegalite_json_bytes': len(obj.to_json())}
+
+    if module == 'xarray':
+        # (y, x), plus category for ds.by()
+        metrics = {'ds_agg_height': obj.shape[0], 'ds_agg_width': obj.shape[1]}
+        if obj.ndim > 2:
+            metrics['ds_agg_categories'] = obj.shape[2]
+        return metrics
+
+    return {}
+
+
+def collectMetrics(captured: List) -> Dict[str, float]:
+    """Return the metrics of the captured objects, also kept as `last`.
+
+    Objects captured repeatedly, e.g. ds.py's aggregate of each of its profiled runs, are the same figure, hence
+    the largest value of each metric is kept rather than their sum.
+    """
+
+    metrics = {}
+    seen = set()
+
+    for obj, backend in captured:
+        if obj is None or id(obj) in seen:
+            continue
+        seen.add(id(obj))
+
+        for name, value in figureMetrics(obj, backend).items():
+            metrics[name] = max(metrics.get(name, 0), value)
+
+    last.clear()
+    last.update(metrics)
+
+    return metrics
+
+
+def writeMetrics(metrics: Dict[str, float], path: str) -> None:
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, 'w') as f:
+        json.dump(metrics, f, indent=2)
+
+
+def flush() -> Dict[str, float]:
+    """Measure the pending captures and write their metrics, returning the largest value of each metric.
+    """
+
+    combined = {}
+
+    while pending:
+        captured, path = pending.pop(0)
+        metrics = collectMetrics(captured)
+
+        # none if profiling was complete already and renderFigure() did not run
+        if metrics:
+            writeMetrics(metrics, path)
+
+        for name, value in metrics.items():
+            combined[name] = max(combined.get(name, 0), value)
+
+    return combined
@@ -0,0 +1,214 @@
+"""Convert GeoDataFrame layers into flattened matplotlib Paths, bypassing the one-patch-per-geometry approach
+of GeoPandas' .plot(), cartopy's .add_geometries() and geoplot's polyplot().
+
+All rings of a layer are read from shapely's ragged coordinate buffers and written into a single vertex array
+with a matching array of path codes, so that an entire map is drawn by one PathCollection.
+"""
+
+import os
+import hashlib
+from typing import List, Sequence, Tuple, Union
+import numpy as np
+import shapely
+from matplotlib.path import Path
+from matplotlib.collections import PathCollection
+from geopandas import GeoDataFrame, GeoSeries
+from mapcompare.ragged import RaggedGeometry
+
+cachedir = 'mapcompare/temp/static/paths/'
+
+# pre-projected vertex, code and ring offset arrays by dataset key and target projection, see cachedPaths()
+_path_cache = {}
+
+
+def ragged(geoms: GeoSeries) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return coordinates, ring offsets and polygon offsets of a (Multi)Polygon GeoSeries.
+
+    Polygons are promoted to single-part MultiPolygons so that the offsets are always at the ring and polygon level.
+    """
+
+    geom_type, coords, offsets = shapely.to_ragged_array(np.asarray(geoms.values))
+
+    if geom_type == shapely.GeometryType.POLYGON:
+        ring_offsets, polygon_offsets = offsets
+    elif geom_type == shapely.GeometryType.MULTIPOLYGON:
+        ring_offsets, polygon_offsets, _ = offsets
+    else:
+        raise ValueError("Expected (Multi)Polygon geometries, got " + geom_type.name)
+
+    return coords, ring_offsets, polygon_offsets
+
+
+def orient(coords: np.ndarray, ring_offsets: np.ndarray, polygon_offsets: np.ndarray) -> np.ndarray:
+    """Return coordinates with exterior rings counter-clockwise and interior rings clockwise.
+
+    Matplotlib fills compound paths using the non-zero winding rule, so holes are only left unfilled if they
+    run opposite to their exterior ring. Rings are reversed in place via a single fancy index.
+    """
+
+    starts, ends = ring_offsets[:-1], ring_offsets[1:]
+
+    # shoelace cross products, zeroing the segments that bridge two consecutive rings
+    cross = np.zeros(len(coords))
+    cross[:-1] = coords[:-1, 0] * coords[1:, 1] - coords[1:, 0] * coords[:-1, 1]
+    cross[ends - 1] = 0
+    area = np.add.reduceat(cross, starts) if len(starts) else np.zeros(0)
+
+    # first ring of each polygon, empty polygons having none
+    exterior = np.zeros(len(starts), dtype=bool)
+    exterior[polygon_offsets[:-1][np.diff(polygon_offsets) > 0]] = True
+
+    reverse = np.where(exterior, area < 0, area > 0)
+
+    lengths = ends - starts
+    idx = np.arange(len(coords))
+    reverse_v = np.repeat(reverse, lengths)
+    mirrored = np.repeat(starts + ends - 1, lengths) - idx
+
+    return coords[np.where(reverse_v, mirrored, idx)]
+
+
+def ringCodes(ring_offsets: np.ndarray) -> np.ndarray:
+    """Return matplotlib path codes for consecutive closed rings.
+    """
+
+    codes = np.full(ring_offsets[-1], Path.LINETO, dtype=Path.code_type)
+    codes[ring_offsets[:-1]] = Path.MOVETO
+    codes[ring_offsets[1:] - 1] = Path.CLOSEPOLY
+
+    return codes
+
+
+def layerArrays(geoms: Union[GeoSeries, RaggedGeometry]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return a layer's oriented vertices, path codes and ring offsets, read directly from a RaggedGeometry's arrays if given one.
+    """
+
+    if isinstance(geoms, RaggedGeometry):
+        return geoms.toPathArrays()
+
+    coords, ring_offsets, polygon_offsets = ragged(geoms)
+
+    return orient(coords, ring_offsets, polygon_offsets), ringCodes(ring_offsets), ring_offsets
+
+
+def arrays2paths(vertices: np.ndarray, codes: np.ndarray, ring_offsets: np.ndarray, chunksize: int=10000) -> List[Path]:
+    """Split vertex and code arrays into compound Paths of up to chunksize rings each.
+
+    Chunking keeps individual paths below the complexity at which Agg raises 'Exceeded cell block limit'
+    while still avoiding a Path object per geometry.
+    """
+
+    breaks = ring_offsets[::chunksize]
+    if breaks[-1] != ring_offsets[-1]:
+        breaks = np.append(breaks, ring_offsets[-1])
+
+    return [Path(vertices[i:j], codes[i:j]) for i, j in zip(breaks[:-1], breaks[1:])]
+
+
+def layer2paths(geoms: Union[GeoSeries, RaggedGeometry], chunksize: int=10000) -> List[Path]:
+    """Return a layer's polygons as a short list of compound Paths, each holding up to chunksize rings.
+    """
+
+    return arrays2paths(*layerArrays(geoms), chunksize=chunksize)
+
+
+def cachedPaths(geoms: Union[GeoSeries, RaggedGeometry], key: str, src_crs, tgt_crs, chunksize: int=10000, cachedir: str=cachedir,
+                fingerprint: str=None) -> List[Path]:
+    """Return a layer's polygons as compound Paths already projected to tgt_crs, cached by dataset key and target projection.
+
+    Replaces cartopy's per-geometry project_geometry() and shapely-to-path conversion in GeoAxes.add_geometries().
+    If source and target CRS are identical, e.g. UTM 33 in carto.py, vertices are used as is. Otherwise they are projected
+    in a single vectorised call to transform_points(), without cartopy's cutting of geometries at the projection boundary.
+    Suitable for local datasets only.
+
+    Paths are cached in memory for the lifetime of the process and as a .npz in cachedir
+    for repeated renders across kernel restarts. Cached paths are looked up by key and target projection first, and
+    validated by the source fingerprint if given. Only without one, and only once the paths are not in memory, is the
+    layer hashed to validate the .npz.
+
+    Parameters
+    ----------
+    geoms : GeoSeries or RaggedGeometry
+        (Multi)Polygons of a single layer in src_crs.
+    key : str
+        Identifies the dataset and layer, e.g. 'dd layer 0'.
+    src_crs, tgt_crs : cartopy CRS
+        Source CRS of geoms and projection of the target GeoAxes.
+    chunksize : int
+        Maximum number of rings per compound Path.
+    cachedir : str
+        Folder for the on-disk cache.
+    fingerprint : str, optional
+        Fingerprint of the source data, e.g. sql2gdf.sourceFingerprint(db_name, password), compared to catch changed
+        data. Defaults to a hash of the layer's coordinates and offsets, see RaggedGeometry.fingerprint().
+
+    Returns
+    ----------
+        List of Paths in tgt_crs coordinates to be added via a PathCollection using ax.transData.
+    """
+
+    proj_hash = hashlib.md5(tgt_crs.proj4_init.encode()).hexdigest()[:10]
+    cache_key = key + ' ' + proj_hash
+
+    # without a source fingerprint, paths in memory are trusted by key rather than hashing the layer on every call
+    if cache_key in _path_cache and fingerprint in (None, _path_cache[cache_key][0]):
+        return arrays2paths(*_path_cache[cache_key][1], chunksize=chunksize)
+
+    if fingerprint is None:
+        if not isinstance(geoms, RaggedGeometry):
+            geoms = RaggedGeometry.fromShapely(geoms)
+        fingerprint = geoms.fingerprint()
+
+    cachepath = cachedir + cache_key + '.npz'
+
+    if os.path.exists(cachepath):
+        with np.load(cachepath) as npz:
+            if str(npz['fingerprint']) == fingerprint:
+                arrays = (npz['vertices'], npz['codes'], npz['ring_offsets'])
+                _path_cache[cache_key] = (fingerprint, arrays)
+                return arrays2paths(*arrays, chunksize=chunksize)
+
+    vertices, codes, ring_offsets = layerArrays(geoms)
+
+    if src_crs != tgt_crs:
+        vertices = tgt_crs.transform_points(src_crs, vertices[:, 0], vertices[:, 1])[:, :2]
+
+    if not os.path.exists(cachedir):
+        os.makedirs(cachedir)
+
+    np.savez(cachepath, fingerprint=fingerprint, vertices=vertices, codes=codes, ring_offsets=ring_offsets)
+
+    _path_cache[cache_key] = (fingerprint, (vertices, codes, ring_offsets))
+
+    return arrays2paths(vertices, codes, ring_offsets, chunksize=chunksize)
+
+
+def layers2collection(gdfs: Sequence[GeoDataFrame], styles: Sequence[dict], chunksize: int=10000, **kwargs) -> PathCollection:
+    """Return a single PathCollection drawing all layers in order, one style dict per layer.
+
+    Parameters
+    ----------
+    gdfs : sequence of GeoDataFrames or RaggedGeometry
+        The feature sets to draw, in the same order as successive calls to GeoDataFrame.plot().
+    styles : sequence of dict
+        Per-layer 'facecolor', 'edgecolor' and 'linewidth', with matplotlib's defaults of no edge and a linewidth of 1.
+    chunksize : int
+        Maximum number of rings per compound Path.
+    **kwargs
+        Passed on to PathCollection, e.g. zorder or rasterized.
+
+    Returns
+    ----------
+        A PathCollection to be added via ax.add_collection().
+    """
+
+    paths, facecolors, edgecolors, linewidths = [], [], [], []
+
+    for gdf, style in zip(gdfs, styles):
+        layer_paths = layer2paths(gdf if isinstance(gdf, RaggedGeometry) else gdf.geometry, chunksize=chunksize)
+        paths += layer_paths
+        facecolors += [style.get('facecolor', 'none')] * len(layer_paths)
+        edgecolors += [style.get('edgecolor', 'none')] * len(layer_paths)
+        linewidths += [style.get('linewidth', 1)] * len(layer_paths)
+
+    return PathCollection(paths, facecolors=facecolors, edgecolors=edgecolors, linewidths=linewidths, **kwargs)
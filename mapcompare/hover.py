@@ -0,0 +1,167 @@
+"""Spatially indexed hover hit-testing for the datashader apps, replacing inspect_polygons().
+
+inspect_polygons() searches the spatialpandas frame around the cursor on every hover event.
+Instead, an STRtree over the merged geometries is built once per server process (see sharedIndex() and spatialindex.py). Each hover event is then
+a point query against the tree, refined with an exact point-in-polygon test, and the attributes of the hit are returned.
+Hover latencies are recorded per index so that percentiles can be reported.
+"""
+
+import time
+import threading
+from collections import deque
+from typing import Callable, Dict, Optional, Sequence
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+from mapcompare.spatialindex import buildIndex
+
+# indices by dataset, shared by all sessions of a Bokeh Server process
+_indices = {}
+_indices_lock = threading.Lock()
+
+
+class HoverIndex:
+    """STRtree over the merged layers, queried with the cursor position.
+
+    Parameters
+    ----------
+    merged : GeoPandas, SpatialPandas or Dask SpatialPandas GeoDataFrame
+        All three feature sets with a 'category' column, as produced by the apps' prepGDFs() or loadParquet().
+    order : sequence of str
+        Categories in drawing order, the last drawn on top, e.g. buildings within and outside 500m, then rivers/streams.
+        Row order is no indication, as the Parquet dataset is sorted along a Hilbert curve, see spatialparquet.py.
+    columns : sequence of str
+        Attributes returned for a hit, 'use' being missing (NaN) for rivers/streams.
+    maxlen : int
+        Number of most recent hover latencies kept for percentiles.
+    """
+
+    def __init__(self, merged, order: Sequence[str], columns: Sequence[str]=('category', 'use'), maxlen: int=10000):
+
+        if hasattr(merged, 'compute'):
+            merged = merged.compute()
+
+        if not isinstance(merged, gpd.GeoDataFrame):
+            merged = merged.to_geopandas()
+
+        self.columns = [column for column in columns if column in merged.columns]
+        self.geoms = np.asarray(merged.geometry.values)
+        self.attributes = merged[self.columns].reset_index(drop=True)
+        # position of each feature's category in order, -1 for categories not given, i.e. below all others
+        self.draw_order = pd.Categorical(np.asarray(merged['category']), categories=list(order)).codes
+        self.tree = buildIndex(merged.geometry)
+        self.latencies = deque(maxlen=maxlen)
+
+    def query(self, x: float, y: float) -> Optional[int]:
+        """Return the positional index of the feature under (x, y), or None.
+
+        Of overlapping features, the one of the category drawn last is returned, i.e. the one visible on top,
+        ties broken by row order.
+        """
+
+        start_time = time.perf_counter()
+
+        # the tree's bbox candidates are refined with an exact point-in-polygon test
+        hits = self.tree.query(shapely.Point(x, y), predicate='intersects')
+        hit = int(hits[np.lexsort((hits, self.draw_order[hits]))[-1]]) if len(hits) else None
+
+        self.latencies.append(time.perf_counter() - start_time)
+
+        return hit
+
+    def attributesAt(self, x: float, y: float) -> Optional[Dict[str, object]]:
+        """Return the attributes of the feature under (x, y), e.g. {'category': ..., 'use': ...}, or None.
+        """
+
+        hit = self.query(x, y)
+
+        if hit is None:
+            return None
+
+        return self.attributes.iloc[hit].to_dict()
+
+    def percentiles(self, q: Sequence[float]=(50, 90, 99)) -> Dict[float, float]:
+        """Return hover latency percentiles in milliseconds.
+        """
+
+        if not self.latencies:
+            return {p: np.nan for p in q}
+
+        return dict(zip(q, np.percentile(np.asarray(self.latencies) * 1000, q)))
+
+    def report(self) -> str:
+        """Return a one-line summary of the recorded hover latencies.
+        """
+
+        return "{} hover queries, latency ".format(len(self.latencies)) + ", ".join(
+            "p{:g} {:.3f} ms".format(p, ms) for p, ms in self.percentiles().items())
+
+
+def sharedIndex(key: str, merged, order: Sequence[str], **kwargs) -> HoverIndex:
+    """Return the process-wide HoverIndex of a dataset, built from merged on first use.
+
+    Parameters
+    ----------
+    key : str
+        Identifies the dataset and how it was read, e.g. db_name + ' parquet'.
+    merged, order, **kwargs
+        Passed to HoverIndex() if not built yet.
+    """
+
+    with _indices_lock:
+        if key not in _indices:
+            _indices[key] = HoverIndex(merged, order, **kwargs)
+
+    return _indices[key]
+
+
+def _polygonPaths(geom, attributes: Dict[str, object]) -> list:
+    """Return a (Multi)Polygon as HoloViews' list of dicts with 'x', 'y', 'holes' and attribute keys.
+    """
+
+    paths = []
+
+    for part in shapely.get_parts(geom):
+        exterior = np.asarray(part.exterior.coords) if hasattr(part, 'exterior') else np.asarray(part.coords)
+        holes = [np.asarray(ring.coords) for ring in getattr(part, 'interiors', [])]
+        path = dict(x=exterior[:, 0], y=exterior[:, 1], holes=[holes])
+        path.update({k: ('' if pd.isna(v) else v) for k, v in attributes.items()})
+        paths.append(path)
+
+    return paths
+
+
+def hoverLayer(index: HoverIndex, polygons: Callable):
+    """Return a DynamicMap highlighting the feature under the cursor, with its attributes in the hover tooltip.
+
+    Subscribes to the same PointerXY stream that inspect_polygons() uses.
+
+    Parameters
+    ----------
+    index : HoverIndex
+        Index over the features drawn by the datashaded layer.
+    polygons : callable
+        Polygons element class matching the app, e.g. hv.Polygons or partial(gv.Polygons, crs=ccrs.GOOGLE_MERCATOR).
+
+    Returns
+    ----------
+        DynamicMap of Polygons, empty if there is no feature under the cursor.
+    """
+
+    import holoviews as hv
+    from holoviews.streams import PointerXY
+
+    def highlight(x, y):
+
+        if x is None or y is None:
+            return polygons([], vdims=index.columns)
+
+        hit = index.query(x, y)
+
+        if hit is None:
+            return polygons([], vdims=index.columns)
+
+        return polygons(_polygonPaths(index.geoms[hit], index.attributes.iloc[hit].to_dict()), vdims=index.columns)
+
+    return hv.DynamicMap(highlight, streams=[PointerXY(x=None, y=None)])
@@ -0,0 +1,43 @@
+"""Command-line overrides for the # INPUTS module globals of the scripts.
+
+Each script still declares its inputs and their defaults at the top, e.g. db_name = override('db_name', 'dd_subset').
+The mapcompare command (see cli.py) passes its options as MAPCOMPARE_<NAME> environment variables before importing
+the script, so that renderFigure()'s default arguments, which to_cProfile() reads, reflect the options given.
+"""
+
+import os
+from typing import Callable
+
+PREFIX = 'MAPCOMPARE_'
+
+
+def envName(name: str) -> str:
+    """Return the environment variable overriding an input, e.g. MAPCOMPARE_DB_NAME for db_name.
+    """
+
+    return PREFIX + name.upper()
+
+
+def override(name: str, default, convert: Callable=None):
+    """Return an input's value from the environment if set, otherwise its default, converted to the default's type.
+
+    convert is used instead where the default's type does not apply, e.g. override('decimals', None, int).
+    """
+
+    value = os.environ.get(envName(name))
+
+    if value is None:
+        return default
+
+    if convert is not None:
+        return convert(value)
+
+    if isinstance(default, bool):
+        if value.lower() not in ('1', '0', 'true', 'false', 'yes', 'no'):
+            raise ValueError("Expected a boolean for " + envName(name) + ", got " + repr(value))
+        return value.lower() in ('1', 'true', 'yes')
+
+    if isinstance(default, (int, float)):
+        return type(default)(value)
+
+    return value
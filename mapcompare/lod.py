@@ -0,0 +1,152 @@
+"""Zoom-dependent level of detail for the datashader apps: datashaded raster when zoomed out, vector polygons when zoomed in.
+
+The features intersecting the viewport are counted with an STRtree over the merged layers (see spatialindex.py).
+Above a threshold the viewport is datashaded as before. Below it, only the visible features are sent to the browser
+as real Bokeh polygons with crisp outlines and native hover, so that both server CPU and browser payload stay bounded at every zoom level.
+
+As a DynamicMap must always return the same element type, the raster and the vector layer are separate DynamicMaps
+subscribing to the same range stream, each returning an empty element while the other one is shown.
+"""
+
+import threading
+from typing import Callable, Sequence
+import numpy as np
+import geopandas as gpd
+from mapcompare.spatialindex import buildIndex, bboxQuery
+
+# by dataset and threshold, shared by all sessions of a Bokeh Server process
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+class LevelOfDetail:
+    """Viewport culling and raster/vector switching over the merged layers.
+
+    Parameters
+    ----------
+    merged : GeoPandas, SpatialPandas or Dask SpatialPandas GeoDataFrame
+        All three feature sets with a 'category' column, as produced by the apps' prepGDFs() or loadParquet().
+    threshold : int
+        Maximum number of visible features drawn as vector polygons.
+    columns : sequence of str
+        Attributes sent along with the vector polygons for the hover tooltip.
+    """
+
+    def __init__(self, merged, threshold: int=20000, columns: Sequence[str]=('category', 'use')):
+
+        if hasattr(merged, 'compute'):
+            merged = merged.compute()
+
+        if not isinstance(merged, gpd.GeoDataFrame):
+            merged = merged.to_geopandas()
+
+        self.columns = [column for column in columns if column in merged.columns]
+        self.frame = merged[self.columns + [merged.geometry.name]].reset_index(drop=True)
+        self.tree = buildIndex(merged.geometry)
+        self.threshold = threshold
+        self._last = (None, None)
+
+    def visible(self, x_range, y_range) -> np.ndarray:
+        """Return positional indices of the features whose bounds intersect the viewport, memoising the last viewport.
+        """
+
+        key = (tuple(x_range), tuple(y_range))
+        # read once, as sessions and the scheduler's pool threads share the instance
+        last = self._last
+
+        if last[0] != key:
+            last = (key, bboxQuery(self.tree, (x_range[0], x_range[1], y_range[0], y_range[1])))
+            self._last = last
+
+        return last[1]
+
+    def isVector(self, x_range, y_range) -> bool:
+        """Return whether a viewport is drawn as vector polygons, i.e. shows at most threshold features.
+        """
+
+        if x_range is None or y_range is None:
+            return False
+
+        return len(self.visible(x_range, y_range)) <= self.threshold
+
+    def vectorLayer(self, polygons: Callable):
+        """Return a DynamicMap of the visible features as polygons, empty while the viewport is datashaded.
+
+        Parameters
+        ----------
+        polygons : callable
+            Polygons element class matching the app, e.g. hv.Polygons or partial(gv.Polygons, crs=ccrs.GOOGLE_MERCATOR).
+        """
+
+        import holoviews as hv
+        from holoviews.streams import RangeXY
+        from spatialpandas import GeoDataFrame
+
+        def draw(x_range, y_range):
+
+            if not self.isVector(x_range, y_range):
+                return polygons([], vdims=self.columns)
+
+            subset = self.frame.iloc[self.visible(x_range, y_range)]
+
+            if not len(subset):
+                return polygons([], vdims=self.columns)
+
+            return polygons(GeoDataFrame(subset), vdims=self.columns)
+
+        return hv.DynamicMap(draw, streams=[RangeXY()])
+
+    def rasterLayer(self, element, rgb: Callable, cache=None, **kwargs):
+        """Return a DynamicMap datashading the element, transparent while the viewport is drawn as vector polygons.
+
+        Parameters
+        ----------
+        element : Polygons
+            HoloViews or GeoViews element to datashade.
+        rgb : callable
+            RGB element class matching the datashaded output, e.g. hv.RGB or partial(gv.RGB, crs=ccrs.GOOGLE_MERCATOR).
+        cache : ViewCache, optional
+            Render viewports through a view cache shared across sessions, see viewcache.py.
+        **kwargs
+            Passed to datashade(), e.g. color_key and aggregator.
+        """
+
+        import holoviews as hv
+        from holoviews.streams import RangeXY, PlotSize
+        from holoviews.operation.datashader import datashade
+
+        def render(x_range, y_range, width, height):
+            return datashade(element, dynamic=False, x_range=x_range, y_range=y_range, width=width, height=height, **kwargs)
+
+        if cache is not None:
+            render = cache.cached(render, kwargs.get('color_key', {}))
+
+        def shade(x_range, y_range, width, height):
+
+            if self.isVector(x_range, y_range):
+                return rgb(np.zeros((2, 2, 4), dtype=np.uint8), bounds=(x_range[0], y_range[0], x_range[1], y_range[1]))
+
+            if x_range is None or y_range is None or not width or not height:
+                return datashade(element, dynamic=False, width=width or 400, height=height or 400, **kwargs)
+
+            return render(x_range, y_range, width, height)
+
+        return hv.DynamicMap(shade, streams=[RangeXY(), PlotSize()])
+
+
+def sharedLevelOfDetail(key: str, merged, threshold: int=20000, **kwargs) -> LevelOfDetail:
+    """Return the process-wide LevelOfDetail of a dataset, built from merged on first use.
+
+    Parameters
+    ----------
+    key : str
+        Identifies the dataset and how it was read, e.g. db_name + ' parquet'.
+    merged, threshold, **kwargs
+        Passed to LevelOfDetail() if not built yet.
+    """
+
+    with _instances_lock:
+        if (key, threshold) not in _instances:
+            _instances[(key, threshold)] = LevelOfDetail(merged, threshold=threshold, **kwargs)
+
+    return _instances[(key, threshold)]
@@ -0,0 +1,266 @@
+"""Run the comparison matrix, i.e. every library across {dd, dd_subset} x {basemap, no basemap} x {savefig, no savefig}.
+
+Each job is a separate `mapcompare render` subprocess, so that jobs neither share module globals, pyplot state nor
+imported libraries, and can be limited individually:
+    - mem_mb caps the address space (RLIMIT_AS), cpu_secs the CPU time (RLIMIT_CPU), timeout the wall time,
+      the former two, like pinning, applied by each job ahead of importing its script and only where supported
+    - renderFigure() runs once per job without cProfile, so that timings neither include the profiler's overhead nor
+      depend on profiles left by earlier or concurrent jobs
+    - numba, OpenMP and BLAS are limited to one thread per job, so that concurrent jobs do not oversubscribe the cores
+    - with pin=True, each job is pinned to a core of its own, so that jobs neither migrate between cores nor share one
+    - each job saves its figures to its own output directory, of which the size is reported
+
+Jobs run `workers` at a time, defaulting to the number of cores, so the matrix' wall time scales with the number of
+cores rather than the number of jobs. Rather than each job querying PostGIS, the layers are exported once per database,
+or again once stale, to an Arrow IPC snapshot (see snapshot.py) that all jobs open memory-mapped, sharing its pages
+via the OS page cache.
+
+Results are written to mapcompare/outputs/matrix/[timestamp]/results.csv, alongside each job's output and log, and
+recorded as a run in the benchmark store, see benchstore.py. Jobs can be repeated to obtain several samples per job.
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import itertools
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Sequence
+import pandas as pd
+
+# the scripts registered in setup.py rendering the map template
+RENDERERS = ['alt', 'bkh', 'carto', 'ds', 'gpd', 'gplt', 'gv', 'gv_ds', 'hv_plot', 'mpl_pc', 'plotly_gl', 'plotly_py']
+
+matrixdir = 'mapcompare/outputs/matrix/'
+
+
+def expandMatrix(libs: Sequence[str]=None, dbs: Sequence[str]=None, basemaps: Sequence[bool]=(True, False),
+                 savefigs: Sequence[bool]=(True, False), repeat: int=1) -> List[dict]:
+    """Return one job per combination of library, database, basemap and savefig, `repeat` times over, numbered by sample.
+    """
+
+    return [dict(lib=lib, db=db, basemap=basemap, savefig=savefig, sample=sample)
+            for sample in range(repeat)
+            for lib, db, basemap, savefig in itertools.product(libs or RENDERERS, dbs or ('dd', 'dd_subset'), basemaps, savefigs)]
+
+
+def jobName(job: dict) -> str:
+
+    options = ''.join(' {}={}'.format(name, value) for name, value in (job.get('options') or {}).items())
+
+    return "{lib} ({db}) basemap={basemap} savefig={savefig}".format(**job) + options
+
+
+def applyLimits(mem_mb: int=None, cpu_secs: int=None, core: int=None) -> None:
+    """Apply the resource limits and CPU affinity to this process, called by each job before importing its script.
+
+    Applied by the job itself, via `mapcompare render --mem-mb/--cpu-secs/--core`, rather than by a preexec_fn, which
+    is unsafe with the threads of the pool running the jobs, or by prlimit() once spawned, i.e. after the job has started.
+    Limits unsupported by the platform, e.g. all of them on Windows, are skipped with a warning.
+    """
+
+    try:
+        import resource
+    except ImportError:
+        resource = None
+
+    if core is not None:
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, {core})
+        else:
+            print("Warning: CPU affinity not supported on this platform, job not pinned")
+
+    if mem_mb is not None or cpu_secs is not None:
+        if resource is None:
+            print("Warning: resource limits not supported on this platform, job not limited")
+            return
+
+    if mem_mb is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (mem_mb * 2**20, mem_mb * 2**20))
+
+    if cpu_secs is not None:
+        # SIGXCPU at the soft limit, SIGKILL a second later should the job ignore it
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_secs, cpu_secs + 1))
+
+
+def _exitCode(status: int) -> int:
+    """Return a wait status as Popen.returncode, i.e. negative for a signal, as os.waitstatus_to_exitcode() of Python 3.9.
+    """
+
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+
+    return os.WEXITSTATUS(status)
+
+
+def _wait(proc: subprocess.Popen, timeout: float=None, interval: float=0.05):
+    """Wait for a process, killing it after timeout secs, returning its exit status, resource usage and whether it timed out.
+
+    Polled via wait4() where available rather than wait() to obtain the job's own resource usage. As the process is
+    only reaped here, killing it on timeout cannot hit another process reusing its pid. Elsewhere, e.g. on Windows,
+    Popen.wait() is used and the resource usage is None.
+    """
+
+    if not hasattr(os, 'wait4'):
+        try:
+            return proc.wait(timeout), None, False
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            return proc.wait(), None, True
+
+    deadline = time.perf_counter() + timeout if timeout is not None else None
+
+    while True:
+        pid, status, usage = os.wait4(proc.pid, os.WNOHANG if deadline is not None else 0)
+
+        if pid:
+            proc.returncode = _exitCode(status)
+            return proc.returncode, usage, False
+
+        if time.perf_counter() >= deadline:
+            proc.kill()
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = _exitCode(status)
+            return proc.returncode, usage, True
+
+        time.sleep(interval)
+
+
+def _directorySize(path: str) -> int:
+
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def runJob(job: dict, jobdir: str, mem_mb: int=None, cpu_secs: int=None, timeout: float=None, core: int=None) -> Dict:
+    """Render a single job in a subprocess, returning its timings, peak memory and output size.
+
+    Jobs may carry further inputs as a dict of options, passed via --set, e.g. {'output_format': 'png'}.
+    """
+
+    outputdir = os.path.join(jobdir, 'outputs')
+    timings_path = os.path.join(jobdir, 'timings.json')
+    os.makedirs(outputdir, exist_ok=True)
+
+    cmd = [sys.executable, '-m', 'mapcompare.cli', 'render', '--lib', job['lib'], '--db', job['db'],
+           '--basemap' if job['basemap'] else '--no-basemap', '--savefig' if job['savefig'] else '--no-savefig',
+           '--output', outputdir, '--timings', timings_path, '--snapshot']
+
+    for name, value in (job.get('options') or {}).items():
+        cmd += ['--set', name + '=' + str(value)]
+
+    for option, value in (('--mem-mb', mem_mb), ('--cpu-secs', cpu_secs), ('--core', core)):
+        if value is not None:
+            cmd += [option, str(value)]
+
+    # renderFigure() called once and unprofiled, see cProfile_viz.py, as concurrent jobs would share the profiles
+    env = dict(os.environ, MPLBACKEND='Agg', BOKEH_BROWSER='none', MAPCOMPARE_PROFILE='False',
+               NUMBA_NUM_THREADS='1', OMP_NUM_THREADS='1', OPENBLAS_NUM_THREADS='1', MKL_NUM_THREADS='1')
+
+    start_time = time.perf_counter()
+
+    with open(os.path.join(jobdir, 'log.txt'), 'w') as log:
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, env=env)
+        returncode, usage, timed_out = _wait(proc, timeout)
+
+    result = dict(job, options=str(job.get('options') or ''), core=core, status='ok', wall=time.perf_counter() - start_time,
+                  max_rss_mb=usage.ru_maxrss / 2**10 if usage is not None else None, output_bytes=_directorySize(outputdir))
+
+    # a SIGKILL is only due to the CPU limit if not sent on timeout, after using up the CPU time
+    cpu_limited = cpu_secs is not None and usage is not None and (returncode == -signal.SIGXCPU or (
+        returncode == -signal.SIGKILL and usage.ru_utime + usage.ru_stime >= cpu_secs))
+
+    if returncode == 0 and os.path.exists(timings_path):
+        with open(timings_path) as f:
+            result.update(json.load(f))
+    elif timed_out:
+        result['status'] = 'timeout'
+    elif cpu_limited:
+        result['status'] = 'cpu limit'
+    else:
+        result['status'] = 'error ' + str(returncode)
+
+    return result
+
+
+def _ensureSnapshots(dbs: Sequence[str], importance: bool=False) -> None:
+    """Export the snapshot of each database not exported yet or stale, so that concurrent jobs do not each export it.
+
+    With importance=True, e.g. for jobs simplifying, snapshots are exported with their vertex importance.
+    """
+
+    from mapcompare.snapshot import ensureSnapshot
+    from mapcompare.sql2gdf import sourceFingerprint
+    from mapcompare.misc.pw import password
+
+    for db in dbs:
+        ensureSnapshot(db, password, sourceFingerprint(db, password), importance)
+
+
+def runMatrix(jobs: List[dict], workers: int=None, mem_mb: int=None, cpu_secs: int=None, timeout: float=None,
+              label: str=None, store: str=None, pin: bool=False) -> pd.DataFrame:
+    """Run the jobs `workers` at a time and write the results table.
+
+    Parameters
+    ----------
+    jobs : list of dict
+        As returned by expandMatrix().
+    workers : int, optional
+        Concurrent jobs, defaulting to the number of cores.
+    mem_mb, cpu_secs, timeout : optional
+        Per job address space limit in MB, CPU time limit in secs and wall time limit in secs.
+    label : str, optional
+        Label of the run in the benchmark store, e.g. the library upgraded.
+    store : str, optional
+        Path of the benchmark store, defaulting to mapcompare/outputs/benchmarks.sqlite.
+    pin : bool
+        Pin each running job to a core of its own among the cores available to this process, at most one job per core.
+
+    Returns
+    ----------
+        The results, one row per job.
+    """
+
+    # scripts use paths relative to the repository root
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    _ensureSnapshots(sorted({job['db'] for job in jobs}), importance=any('simplify_px' in (job.get('options') or {}) for job in jobs))
+
+    rundir = matrixdir + datetime.now().strftime('%Y-%m-%d %H-%M-%S') + '/'
+
+    cores = queue.Queue()
+
+    if pin:
+        available = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+        workers = min(workers or len(available), len(available))
+        for core in available[:workers]:
+            cores.put(core)
+
+    def run(i_job):
+        i, job = i_job
+        core = cores.get() if pin else None
+        try:
+            result = runJob(job, rundir + str(i), mem_mb, cpu_secs, timeout, core)
+        finally:
+            if pin:
+                cores.put(core)
+        print("{:>3}/{} {}: {} in {:.1f} secs".format(i + 1, len(jobs), jobName(job), result['status'], result['wall']))
+        return result
+
+    start_time = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        results = pd.DataFrame(list(pool.map(run, enumerate(jobs))))
+
+    results.to_csv(rundir + 'results.csv', index=False)
+
+    from mapcompare.benchstore import recordResults
+    run_id = recordResults(results, label, store)
+
+    print("\nFinished {} jobs in {:.1f} secs, results in {}, recorded as run {}".format(
+        len(jobs), time.perf_counter() - start_time, rundir + 'results.csv', run_id))
+
+    return results
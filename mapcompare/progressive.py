@@ -0,0 +1,192 @@
+"""Progressive loading of the layers into Bokeh Server sessions, for a first meaningful paint before all buildings have arrived.
+
+Instead of one document holding all three layers, the session's initial document holds only the rivers and a coarse
+overview image of the buildings. Once the browser has rendered it, the buildings are streamed in chunks via
+ColumnDataSource.stream(), one chunk per event loop tick:
+    - from one queue across all streamed layers, each feature tagged with the source it is streamed into
+    - ordered viewport first, i.e. features whose centre lies within the current view, then along a Hilbert curve,
+      so that each chunk fills a compact area rather than scattering over the city
+    - re-prioritised whenever the view changes, so that panning or zooming in while streaming fetches the new view next
+
+Time to first meaningful paint is measured from the start of the session to Bokeh's DocumentReady event, sent by the
+browser once the initial document has been rendered. See apps/bkh_stream/.
+"""
+
+import time
+from typing import Callable, List, Sequence
+import numpy as np
+from bokeh.events import DocumentReady
+from mapcompare.ragged import RaggedGeometry
+
+
+def hilbertDistance(x: np.ndarray, y: np.ndarray, extent: Sequence[float], order: int=16) -> np.ndarray:
+    """Return the distance along a Hilbert curve of order `order` over an extent (x0, x1, y0, y1) for each point.
+    """
+
+    n = 2**order
+    x0, x1, y0, y1 = extent
+
+    xi = np.clip(((x - x0) / (x1 - x0) * (n - 1)).astype(np.int64), 0, n - 1)
+    yi = np.clip(((y - y0) / (y1 - y0) * (n - 1)).astype(np.int64), 0, n - 1)
+    d = np.zeros(len(xi), dtype=np.int64)
+
+    s = n // 2
+    while s > 0:
+        rx = (xi & s) > 0
+        ry = (yi & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+
+        # rotate the quadrant, as in the classic xy2d()
+        flip = ~ry & rx
+        xi = np.where(flip, n - 1 - xi, xi)
+        yi = np.where(flip, n - 1 - yi, yi)
+        swap = ~ry
+        xi, yi = np.where(swap, yi, xi), np.where(swap, xi, yi)
+
+        s //= 2
+
+    return d
+
+
+def _centres(layer: RaggedGeometry) -> np.ndarray:
+
+    return np.column_stack([(layer.bounds[:, 0] + layer.bounds[:, 2]) / 2, (layer.bounds[:, 1] + layer.bounds[:, 3]) / 2])
+
+
+def _inView(centres: np.ndarray, viewport: Sequence[float]) -> np.ndarray:
+
+    x0, x1, y0, y1 = viewport
+
+    return (centres[:, 0] >= x0) & (centres[:, 0] <= x1) & (centres[:, 1] >= y0) & (centres[:, 1] <= y1)
+
+
+def streamOrder(centres: np.ndarray, viewport: Sequence[float], extent: Sequence[float]) -> np.ndarray:
+    """Return the positions of features by their centres, those within the viewport first, each group in Hilbert order.
+    """
+
+    hilbert = hilbertDistance(centres[:, 0], centres[:, 1], extent)
+
+    return np.lexsort((hilbert, ~_inView(centres, viewport)))
+
+
+def overviewImage(layers: Sequence[RaggedGeometry], colors: Sequence[Sequence[int]], extent: Sequence[float], width: int=256) -> np.ndarray:
+    """Return a coarse RGBA image of the layers' feature centres for Bokeh's image_rgba(), drawn in order.
+
+    Parameters
+    ----------
+    colors : sequence of (r, g, b)
+        One colour per layer.
+    extent : sequence of float
+        (x0, x1, y0, y1), of which the aspect ratio determines the image height.
+    """
+
+    x0, x1, y0, y1 = extent
+    height = max(1, int(round(width * (y1 - y0) / (x1 - x0))))
+
+    image = np.zeros((height, width, 4), dtype=np.uint8)
+
+    for layer, color in zip(layers, colors):
+        centres = _centres(layer)
+        counts, _, _ = np.histogram2d(centres[:, 1], centres[:, 0], bins=(height, width), range=((y0, y1), (x0, x1)))
+        image[counts > 0] = list(color) + [255]
+
+    return image.view(dtype=np.uint32).reshape(height, width)
+
+
+class ProgressiveStream:
+    """Stream layers into a Bokeh document chunk by chunk once the browser has rendered the initial document.
+
+    Parameters
+    ----------
+    doc : bokeh.document.Document
+        The session's document, i.e. curdoc().
+    chunk_size : int
+        Features per stream() call.
+    """
+
+    def __init__(self, doc, chunk_size: int=5000):
+
+        self.doc = doc
+        self.chunk_size = chunk_size
+        self.targets = []
+        # per queued feature, the target it is streamed into and its position within the target's layer
+        self.target = np.zeros(0, dtype=np.int64)
+        self.position = np.zeros(0, dtype=np.int64)
+        self.centres = np.zeros((0, 2))
+        self.queue = np.zeros(0, dtype=np.int64)
+        self.on_complete: List[Callable[[], None]] = []
+
+        self.start_time = time.perf_counter()
+        self.first_paint = None
+        self.complete = None
+        self.chunks = 0
+
+        doc.on_event(DocumentReady, self._ready)
+
+    def add(self, source, layer: RaggedGeometry, attributes: Sequence[str]=()) -> None:
+        """Queue a layer to be streamed into a ColumnDataSource with 'xs' and 'ys' columns as drawn by multi_polygons().
+
+        Features are appended to the queue as added, call order() once all layers have been added.
+        """
+
+        self.targets.append({'source': source, 'layer': layer, 'attributes': attributes})
+
+        self.target = np.concatenate([self.target, np.full(len(layer), len(self.targets) - 1)])
+        self.position = np.concatenate([self.position, np.arange(len(layer))])
+        self.centres = np.concatenate([self.centres, _centres(layer)])
+        self.queue = np.arange(len(self.target))
+
+    def order(self, viewport: Sequence[float], extent: Sequence[float]) -> None:
+        """Order the queue across all layers, features within the viewport first, each group in Hilbert order.
+        """
+
+        self.queue = streamOrder(self.centres, viewport, extent)
+
+    def prioritise(self, viewport: Sequence[float]) -> None:
+        """Move the queued features within the viewport to the front, keeping their order otherwise.
+        """
+
+        in_view = _inView(self.centres[self.queue], viewport)
+        self.queue = np.concatenate([self.queue[in_view], self.queue[~in_view]])
+
+    def _ready(self, event) -> None:
+
+        self.first_paint = time.perf_counter() - self.start_time
+        self.doc.add_next_tick_callback(self._next)
+
+    def _next(self) -> None:
+
+        if not len(self.queue):
+            self.complete = time.perf_counter() - self.start_time
+            for callback in self.on_complete:
+                callback()
+            return
+
+        features, self.queue = self.queue[:self.chunk_size], self.queue[self.chunk_size:]
+
+        # a chunk may span several layers, each streamed into its own source
+        for i, entry in enumerate(self.targets):
+            positions = self.position[features[self.target[features] == i]]
+
+            if not len(positions):
+                continue
+
+            chunk = entry['layer'].take(positions)
+            columns = chunk.toBokeh()
+            for attribute in entry['attributes']:
+                columns[attribute] = list(chunk.attributes[attribute])
+
+            entry['source'].stream(columns)
+
+        self.chunks += 1
+
+        # one chunk per tick, leaving the event loop free for pans, zooms and the next chunk to be sent
+        self.doc.add_next_tick_callback(self._next)
+
+    def report(self) -> str:
+
+        def secs(value):
+            return "{:.2f} secs".format(value) if value is not None else "n/a"
+
+        return "Progressive stream: first meaningful paint {}, complete {} after {} chunks".format(
+            secs(self.first_paint), secs(self.complete), self.chunks)
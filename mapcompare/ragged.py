@@ -0,0 +1,341 @@
+"""GeoArrow-style ragged coordinate arrays as the common in-memory geometry format of a layer.
+
+A RaggedGeometry holds all (Multi)Polygons of a layer as
+    - one contiguous float64 array of x/y coordinates,
+    - ring offsets into the coordinates, part (polygon) offsets into the rings and geometry offsets into the parts,
+    - per-feature bounds and the non-spatial attributes,
+i.e. the MultiPolygon layout of shapely.to_ragged_array() and GeoArrow. Compared to a GeoSeries of shapely objects,
+this avoids one Python object per feature (144k for 'dd') and several times the memory per layer.
+
+sql2gdf(..., ragged=True) builds layers from one WKB value per feature, decoded straight into the arrays by wkb.py,
+i.e. without a GeoDataFrame or any shapely object. Converters to each renderer's input work on the arrays in bulk.
+"""
+
+import hashlib
+from typing import Dict, Sequence, Tuple
+import numpy as np
+import pandas as pd
+import shapely
+
+
+class RaggedGeometry:
+    """A layer of (Multi)Polygons as flat coordinate and offset arrays.
+
+    Parameters
+    ----------
+    coords : np.ndarray
+        (n, 2) float64 vertex coordinates, rings closed.
+    ring_offsets, part_offsets, geom_offsets : np.ndarray
+        Offsets of rings into coords, of polygon parts into rings and of features into parts, each starting at 0.
+    attributes : pd.DataFrame, optional
+        One row per feature, e.g. the 'use' column of the building layers.
+    crs : str, optional
+        CRS of the coordinates, e.g. 'epsg:25833'.
+    importance : np.ndarray, optional
+        Visvalingam-Whyatt effective area per vertex, see simplify.py.
+    """
+
+    def __init__(self, coords: np.ndarray, ring_offsets: np.ndarray, part_offsets: np.ndarray, geom_offsets: np.ndarray,
+                 attributes: pd.DataFrame=None, crs: str=None, importance: np.ndarray=None):
+
+        self.coords = np.ascontiguousarray(coords, dtype=np.float64)
+        self.ring_offsets = np.asarray(ring_offsets, dtype=np.int64)
+        self.part_offsets = np.asarray(part_offsets, dtype=np.int64)
+        self.geom_offsets = np.asarray(geom_offsets, dtype=np.int64)
+        self.attributes = attributes if attributes is not None else pd.DataFrame(index=pd.RangeIndex(len(self.geom_offsets) - 1))
+        self.crs = crs
+        self.importance = importance
+        self.bounds = self._featureBounds()
+
+    def __len__(self) -> int:
+        return len(self.geom_offsets) - 1
+
+    @property
+    def vertex_offsets(self) -> np.ndarray:
+        """Offsets of features into coords.
+        """
+
+        return self.ring_offsets[self.part_offsets[self.geom_offsets]]
+
+    @property
+    def nbytes(self) -> int:
+        return self.coords.nbytes + self.ring_offsets.nbytes + self.part_offsets.nbytes + self.geom_offsets.nbytes + self.bounds.nbytes
+
+    def fingerprint(self) -> str:
+        """Return a hash of the coordinate and offset arrays, changing with any vertex or the structure of any feature.
+        """
+
+        digest = hashlib.blake2b(digest_size=16)
+
+        for array in (self.coords, self.ring_offsets, self.part_offsets, self.geom_offsets):
+            digest.update(np.ascontiguousarray(array).tobytes())
+
+        return digest.hexdigest()
+
+    @property
+    def total_bounds(self) -> np.ndarray:
+        """Combined bounds (minx, miny, maxx, maxy), as GeoPandas' total_bounds.
+        """
+
+        return np.array([self.coords[:, 0].min(), self.coords[:, 1].min(), self.coords[:, 0].max(), self.coords[:, 1].max()])
+
+    def _featureBounds(self) -> np.ndarray:
+        """Return (minx, miny, maxx, maxy) per feature via reduceat over the vertex offsets.
+        """
+
+        if not len(self) or not len(self.coords):
+            return np.zeros((len(self), 4))
+
+        starts = self.vertex_offsets[:-1]
+        # reduceat requires valid start indices, empty features are masked afterwards
+        valid = starts < len(self.coords)
+        mins = np.minimum.reduceat(self.coords, np.minimum(starts, len(self.coords) - 1), axis=0)
+        maxs = np.maximum.reduceat(self.coords, np.minimum(starts, len(self.coords) - 1), axis=0)
+
+        bounds = np.hstack([mins, maxs])
+        bounds[~valid | (np.diff(self.vertex_offsets) == 0)] = np.nan
+
+        return bounds
+
+    # Constructors
+
+    @classmethod
+    def fromShapely(cls, geoms, attributes: pd.DataFrame=None, crs: str=None) -> 'RaggedGeometry':
+        """Build from a GeoSeries or array of (Multi)Polygons, promoting Polygons to single-part MultiPolygons.
+        """
+
+        geom_type, coords, offsets = shapely.to_ragged_array(np.asarray(getattr(geoms, 'values', geoms)))
+
+        if geom_type == shapely.GeometryType.POLYGON:
+            ring_offsets, part_offsets = offsets
+            geom_offsets = np.arange(len(part_offsets))
+        elif geom_type == shapely.GeometryType.MULTIPOLYGON:
+            ring_offsets, part_offsets, geom_offsets = offsets
+        else:
+            raise ValueError("Expected (Multi)Polygon geometries, got " + geom_type.name)
+
+        return cls(coords, ring_offsets, part_offsets, geom_offsets, attributes, crs)
+
+    @classmethod
+    def fromGeoDataFrame(cls, gdf) -> 'RaggedGeometry':
+        """Build from a GeoDataFrame, keeping its non-geometry columns and CRS.
+        """
+
+        crs = gdf.crs.to_string() if gdf.crs is not None else None
+
+        return cls.fromShapely(gdf.geometry, gdf.drop(columns=gdf.geometry.name).reset_index(drop=True), crs)
+
+    # Converters
+
+    def toShapely(self) -> np.ndarray:
+        """Return an array of shapely MultiPolygons.
+        """
+
+        return shapely.from_ragged_array(shapely.GeometryType.MULTIPOLYGON, self.coords,
+                                         (self.ring_offsets, self.part_offsets, self.geom_offsets))
+
+    def toGeoDataFrame(self):
+        """Return a GeoPandas GeoDataFrame with the attributes and a 'geom' column, as returned by sql2gdf().
+        """
+
+        import geopandas as gpd
+
+        return gpd.GeoDataFrame(self.attributes.copy(), geometry=gpd.GeoSeries(self.toShapely(), crs=self.crs), crs=self.crs).rename_geometry('geom')
+
+    def toSpatialPandas(self, orient: bool=True):
+        """Return a spatialpandas MultiPolygonArray sharing the coordinate buffer layout, i.e. without any geometry objects.
+
+        spatialpandas stores interleaved x/y values, so its innermost offsets count values rather than vertices.
+        """
+
+        import pyarrow as pa
+        from spatialpandas.geometry import MultiPolygonArray
+
+        rings = pa.ListArray.from_arrays(pa.array((self.ring_offsets * 2).astype(np.int32)), pa.array(self.coords.ravel()))
+        polys = pa.ListArray.from_arrays(pa.array(self.part_offsets.astype(np.int32)), rings)
+        multipolys = pa.ListArray.from_arrays(pa.array(self.geom_offsets.astype(np.int32)), polys)
+
+        array = MultiPolygonArray(multipolys)
+
+        return array.oriented() if orient else array
+
+    def toBokeh(self) -> Dict[str, list]:
+        """Return 'xs' and 'ys' columns in Bokeh's multi_polygons() layout, i.e. per feature, part and ring.
+
+        The nesting is built from array slices (views) rather than from per-geometry objects.
+        """
+
+        ring_bounds = self.ring_offsets[1:-1]
+        rings_x = np.split(self.coords[:, 0], ring_bounds)
+        rings_y = np.split(self.coords[:, 1], ring_bounds)
+
+        # one flat pass per nesting level, slicing the lists of rings by the part offsets, then of parts by the geometry offsets
+        xs = _nest(_nest(rings_x, self.part_offsets), self.geom_offsets)
+        ys = _nest(_nest(rings_y, self.part_offsets), self.geom_offsets)
+
+        return dict(xs=xs, ys=ys)
+
+    def toPatches(self) -> Dict[str, list]:
+        """Return 'xs' and 'ys' columns for Bokeh's patches(), one NaN-separated array per feature.
+
+        patches() cannot draw holes, so interior rings are drawn as filled rings on top, as with GeoJSONDataSource.
+        """
+
+        coords = np.insert(self.coords, self.ring_offsets[1:-1], np.nan, axis=0)
+        # every preceding ring boundary shifts a feature's start by one inserted NaN
+        starts = self.vertex_offsets + self.part_offsets[self.geom_offsets]
+        pieces = np.split(coords, starts[1:-1])
+        # drop the NaN separating a feature from the next one
+        pieces = [piece[:-1] for piece in pieces[:-1]] + pieces[-1:]
+
+        return dict(xs=[p[:, 0] for p in pieces], ys=[p[:, 1] for p in pieces])
+
+    def toPathArrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Return oriented vertices, path codes and ring offsets for matplotlib, see flatpaths.layerArrays().
+        """
+
+        from mapcompare.flatpaths import orient, ringCodes
+
+        return orient(self.coords, self.ring_offsets, self.part_offsets), ringCodes(self.ring_offsets), self.ring_offsets
+
+    def take(self, indices: Sequence[int]) -> 'RaggedGeometry':
+        """Return the features at the given positions, e.g. the result of a spatial index query.
+        """
+
+        indices = np.asarray(indices, dtype=np.int64)
+
+        part_counts = np.diff(self.geom_offsets)[indices]
+        part_idx = _ranges(self.geom_offsets[indices], part_counts)
+        ring_counts = np.diff(self.part_offsets)[part_idx]
+        ring_idx = _ranges(self.part_offsets[part_idx], ring_counts)
+        vertex_counts = np.diff(self.ring_offsets)[ring_idx]
+        vertex_idx = _ranges(self.ring_offsets[ring_idx], vertex_counts)
+
+        return RaggedGeometry(self.coords[vertex_idx], _offsets(vertex_counts), _offsets(ring_counts), _offsets(part_counts),
+                              self.attributes.iloc[indices].reset_index(drop=True), self.crs,
+                              self.importance[vertex_idx] if self.importance is not None else None)
+
+    def withImportance(self, importance: np.ndarray) -> 'RaggedGeometry':
+        """Return the layer sharing its arrays, with the effective area per vertex as computed by simplify.vertexImportance().
+        """
+
+        return RaggedGeometry(self.coords, self.ring_offsets, self.part_offsets, self.geom_offsets, self.attributes, self.crs, importance)
+
+    def simplify(self, tolerance: float) -> 'RaggedGeometry':
+        """Return the layer simplified by Visvalingam-Whyatt to a tolerance in CRS units, via a single mask over its vertices.
+
+        Keeps the vertices with an effective area of at least tolerance**2. Ring offsets are recounted from the mask,
+        part and geometry offsets are unchanged as rings never collapse, see simplify.py.
+        """
+
+        if self.importance is None:
+            raise ValueError("No vertex importance, see simplify.vertexImportance() or RaggedGeometry.withImportance().")
+
+        keep = self.importance >= tolerance ** 2
+        kept = np.concatenate([[0], np.cumsum(keep)])
+
+        return RaggedGeometry(self.coords[keep], kept[self.ring_offsets], self.part_offsets, self.geom_offsets, self.attributes, self.crs,
+                              self.importance[keep])
+
+    def toCrs(self, crs: str) -> 'RaggedGeometry':
+        """Return the layer reprojected, transforming the coordinate array in one call rather than geometry by geometry.
+
+        Vertex importance is kept as is, i.e. in units of the original CRS, so simplify before reprojecting.
+        """
+
+        from pyproj import Transformer
+
+        transformer = Transformer.from_crs(self.crs, crs, always_xy=True)
+        x, y = transformer.transform(self.coords[:, 0], self.coords[:, 1])
+
+        return RaggedGeometry(np.column_stack([x, y]), self.ring_offsets, self.part_offsets, self.geom_offsets, self.attributes, crs,
+                              self.importance)
+
+
+def _nest(items: list, offsets: np.ndarray) -> list:
+    """Return the items grouped into consecutive sublists by offsets, i.e. one list slice per group.
+    """
+
+    offsets = offsets.tolist()
+
+    return [items[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _offsets(counts: np.ndarray) -> np.ndarray:
+    return np.concatenate([[0], np.cumsum(counts)])
+
+
+def _ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Return the concatenation of range(start, start + count) for each pair, vectorised.
+    """
+
+    if not len(counts) or not counts.sum():
+        return np.zeros(0, dtype=np.int64)
+
+    offsets = _offsets(counts)
+    return np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])
+
+
+def raggedQuery(sql: str, con, columns: Sequence[str]=(), crs: str=None) -> RaggedGeometry:
+    """Run a query returning a 'geom' column and build a RaggedGeometry from its WKB, without a GeoDataFrame.
+
+    Parameters
+    ----------
+    sql : str
+        Query as used with GeoDataFrame.from_postgis(), e.g. one of sql2gdf()'s.
+    con : sqlalchemy engine
+        Database connection.
+    columns : sequence of str
+        Non-geometry columns of the query kept as attributes, e.g. ['use'].
+    crs : str, optional
+        CRS of the geometries, e.g. 'epsg:25833'.
+    """
+
+    attribute_cols = ''.join('q.' + column + ', ' for column in columns)
+
+    # one row per feature, decoded in bulk by wkb.py rather than one row per vertex via ST_DumpPoints()
+    wkb = """SELECT {attribute_cols}ST_AsBinary(ST_Multi(q.geom), 'NDR') AS wkb
+    FROM ({sql}) q;""".format(sql=sql.strip().rstrip(';'), attribute_cols=attribute_cols)
+
+    rows = pd.read_sql(wkb, con)
+
+    from mapcompare.wkb import decodeMultiPolygons
+
+    return RaggedGeometry(*decodeMultiPolygons(rows['wkb']), rows[list(columns)].reset_index(drop=True), crs)
+
+
+def concatenate(layers: Sequence[RaggedGeometry]) -> RaggedGeometry:
+    """Return the layers as one, shifting their offsets rather than copying any geometry objects.
+
+    Attributes are concatenated by column name, missing columns being NaN, e.g. 'use' of the rivers/streams.
+    """
+
+    def shifted(offsets: Sequence[np.ndarray]) -> np.ndarray:
+        # each layer's offsets continue from where the previous layer's ended
+        shifts = np.cumsum([0] + [o[-1] for o in offsets[:-1]])
+        return np.concatenate([[0]] + [o[1:] + shift for o, shift in zip(offsets, shifts)])
+
+    coords = np.concatenate([layer.coords for layer in layers])
+    ring_offsets = shifted([layer.ring_offsets for layer in layers])
+    part_offsets = shifted([layer.part_offsets for layer in layers])
+    geom_offsets = shifted([layer.geom_offsets for layer in layers])
+    attributes = pd.concat([layer.attributes for layer in layers], ignore_index=True)
+
+    return RaggedGeometry(coords, ring_offsets, part_offsets, geom_offsets, attributes, layers[0].crs)
+
+
+def spatialFrame(layers: Sequence[RaggedGeometry], categories: Sequence[str], geometry: str='geom'):
+    """Return the layers merged into one spatialpandas GeoDataFrame with a categorical 'category' column, one category per layer.
+
+    Equivalent to the apps' prepGDFs() on GeoDataFrames, but built from the coordinate arrays, without any shapely objects.
+    """
+
+    from spatialpandas import GeoDataFrame, GeoSeries
+
+    merged = concatenate(layers)
+
+    frame = merged.attributes.copy()
+    frame['category'] = pd.Categorical(np.repeat(list(categories), [len(layer) for layer in layers]), categories=list(categories))
+    frame[geometry] = GeoSeries(merged.toSpatialPandas())
+
+    return GeoDataFrame(frame, geometry=geometry)
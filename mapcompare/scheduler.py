@@ -0,0 +1,218 @@
+"""Debounced, off-loop datashading for the Bokeh Server apps.
+
+By default, every RangeXY event of a drag triggers a full datashade() on the Tornado event loop, so intermediate
+viewports queue up and block all other sessions served by the same process. Instead, the render scheduler
+    - debounces range updates, only rendering once the viewport has been still for a short delay,
+    - runs the aggregation in a thread pool shared by all sessions of the server process,
+    - drops superseded requests, both before they start and once they finish, as running datashader aggregations cannot be interrupted,
+    - and pushes only the newest frame to the session's document via add_next_tick_callback().
+
+Threads rather than processes are used, as the aggregation's input is the app's (large) spatialpandas frame,
+and datashader's numba kernels release the GIL for most of their runtime.
+"""
+
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Sequence
+import numpy as np
+
+# shared by all sessions, as the app script is executed again for every session
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def sharedPool(workers: int=None) -> ThreadPoolExecutor:
+    """Return the process-wide aggregation pool, created on first use.
+    """
+
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='datashade')
+
+    return _pool
+
+
+class RenderScheduler:
+    """Per-session scheduler turning viewport changes into at most one running and one pending aggregation.
+
+    Parameters
+    ----------
+    render : callable
+        Called with x_range, y_range, width and height in a pool thread, returning the element to display.
+    push : callable
+        Called with the rendered element on the document's event loop, e.g. a Pipe's send().
+    doc : bokeh.document.Document
+        The session's document, i.e. curdoc() while the app script runs.
+    delay : int
+        Debounce delay in milliseconds.
+    maxlen : int
+        Number of most recent request-to-frame latencies kept for percentiles.
+    """
+
+    def __init__(self, render: Callable, push: Callable, doc, delay: int=150, maxlen: int=1000):
+
+        self.render = render
+        self.push = push
+        self.doc = doc
+        self.delay = delay
+        self.generation = 0
+        self.requested = None
+        self.timeout = None
+        self.dropped = 0
+        self.latencies = deque(maxlen=maxlen)
+        # generation and dropped are shared by the event loop and the pool threads
+        self.lock = threading.Lock()
+
+    def request(self, x_range, y_range, width, height) -> None:
+        """Schedule a render of a viewport, superseding any earlier request. Called on the event loop.
+        """
+
+        viewport = (tuple(x_range), tuple(y_range), width, height)
+
+        if viewport == self.requested:
+            return
+
+        self.requested = viewport
+
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+
+        if self.timeout is not None:
+            self.doc.remove_timeout_callback(self.timeout)
+
+        requested_at = time.perf_counter()
+        self.timeout = self.doc.add_timeout_callback(lambda: self._submit(generation, viewport, requested_at), self.delay)
+
+    def _submit(self, generation: int, viewport: tuple, requested_at: float) -> None:
+
+        self.timeout = None
+        sharedPool().submit(self._run, generation, viewport, requested_at)
+
+    def _superseded(self, generation: int) -> bool:
+        """Return whether a newer request has been made, counting the request as dropped if so.
+        """
+
+        with self.lock:
+            if generation != self.generation:
+                self.dropped += 1
+                return True
+
+        return False
+
+    def _run(self, generation: int, viewport: tuple, requested_at: float) -> None:
+
+        # superseded while queued behind other sessions' aggregations
+        if self._superseded(generation):
+            return
+
+        try:
+            frame = self.render(*viewport)
+        except Exception as e:
+            print("Render of {} failed: {!r}".format(viewport, e))
+            self.doc.add_next_tick_callback(lambda: self._failed(generation))
+            return
+
+        # superseded while aggregating
+        if self._superseded(generation):
+            return
+
+        self.doc.add_next_tick_callback(lambda: self._push(generation, frame, requested_at))
+
+    def _failed(self, generation: int) -> None:
+
+        # so that requesting the same viewport again retries it, unless superseded meanwhile
+        with self.lock:
+            if generation == self.generation:
+                self.requested = None
+
+    def _push(self, generation: int, frame, requested_at: float) -> None:
+
+        if self._superseded(generation):
+            return
+
+        self.push(frame)
+        self.latencies.append(time.perf_counter() - requested_at)
+
+    def percentiles(self, q: Sequence[float]=(50, 90, 99)) -> Dict[float, float]:
+        """Return request-to-frame latency percentiles in milliseconds, including the debounce delay.
+        """
+
+        if not self.latencies:
+            return {p: np.nan for p in q}
+
+        return dict(zip(q, np.percentile(np.asarray(self.latencies) * 1000, q)))
+
+    def report(self) -> str:
+        """Return a one-line summary of frames pushed, requests dropped and latencies.
+        """
+
+        return "{} frames pushed, {} superseded requests dropped, latency ".format(len(self.latencies), self.dropped) + ", ".join(
+            "p{:g} {:.1f} ms".format(p, ms) for p, ms in self.percentiles().items())
+
+
+def scheduledShade(element, rgb: Callable, delay: int=150, cache=None, blank: Callable=None, **kwargs):
+    """Datashade a HoloViews/GeoViews element off the event loop, in place of datashade(element).
+
+    Parameters
+    ----------
+    element : Polygons
+        HoloViews or GeoViews element to datashade.
+    rgb : callable
+        RGB element class matching the datashaded output, e.g. hv.RGB or partial(gv.RGB, crs=ccrs.GOOGLE_MERCATOR),
+        used for the placeholder shown until the first frame arrives. The placeholder spans the element's extent,
+        so that the initial view is framed on the data.
+    delay : int
+        Debounce delay in milliseconds.
+    cache : ViewCache, optional
+        Render viewports through a view cache shared across sessions, see viewcache.py.
+    blank : callable, optional
+        Called with x_range and y_range, returning whether to push a transparent frame instead of datashading,
+        e.g. LevelOfDetail.isVector while the viewport is drawn as vector polygons, see lod.py.
+    **kwargs
+        Passed to datashade(), e.g. color_key and aggregator.
+
+    Returns
+    ----------
+        DynamicMap of RGB elements and the session's RenderScheduler.
+    """
+
+    import holoviews as hv
+    from bokeh.io import curdoc
+    from holoviews.streams import Pipe, RangeXY, PlotSize
+    from holoviews.operation.datashader import datashade
+
+    (x0, x1), (y0, y1) = element.range(0), element.range(1)
+    pipe = Pipe(data=rgb(np.zeros((2, 2, 4), dtype=np.uint8), bounds=(x0, y0, x1, y1)))
+
+    def render(x_range, y_range, width, height):
+        return datashade(element, dynamic=False, x_range=x_range, y_range=y_range, width=width, height=height, **kwargs)
+
+    if cache is not None:
+        render = cache.cached(render, kwargs.get('color_key', {}))
+
+    if blank is not None:
+        shade = render
+
+        def render(x_range, y_range, width, height):
+
+            if blank(x_range, y_range):
+                return rgb(np.zeros((2, 2, 4), dtype=np.uint8), bounds=(x_range[0], y_range[0], x_range[1], y_range[1]))
+
+            return shade(x_range, y_range, width, height)
+
+    scheduler = RenderScheduler(render, pipe.send, curdoc(), delay=delay)
+
+    def show(data, x_range, y_range, width, height):
+
+        # range and plot size events request a frame, the Pipe event then displays it
+        if x_range is not None and y_range is not None and width and height:
+            scheduler.request(x_range, y_range, width, height)
+
+        return data
+
+    return hv.DynamicMap(show, streams=[pipe, RangeXY(), PlotSize()]), scheduler
@@ -0,0 +1,214 @@
+"""Visvalingam-Whyatt importance of every vertex, computed once, so that a layer is simplified to any tolerance by one mask.
+
+Visvalingam-Whyatt simplification repeatedly drops the vertex spanning the smallest triangle with its neighbours. The
+area at which a vertex is dropped, made non-decreasing along the elimination order, is its effective area: simplifying
+to a tolerance keeps exactly the vertices whose effective area is at least tolerance**2. vertexImportance() computes
+these areas for all vertices of all layers with numba, and RaggedGeometry.simplify() then applies a tolerance by
+masking the coordinates and recounting the ring offsets, without touching any geometry object.
+
+Rings stay valid and shared walls stay shared:
+    - each ring keeps its first and closing vertex and at least three distinct vertices, i.e. collapses to a triangle
+      at most
+    - vertices shared by several rings, across all layers, e.g. between adjoining buildings within and outside 500m,
+      are given the largest importance of any of their rings, so that both sides of a wall drop the same vertices
+    - vertices where a shared wall ends, or where three or more rings meet, are never dropped
+
+Importance is an area in the layer's CRS units, e.g. m² for UTM 33, see pixelTolerance() for a tolerance in pixels.
+It is cached per dataset as a .npz in mapcompare/temp/importance/, and stored alongside the geometry in snapshots,
+see snapshot.py.
+"""
+
+import os
+import heapq
+from typing import List, Sequence
+import numpy as np
+from numba import njit
+from mapcompare.ragged import RaggedGeometry
+
+cachedir = 'mapcompare/temp/importance/'
+
+
+@njit(cache=True, nogil=True)
+def _area(coords, a, b, c):
+
+    return 0.5 * abs((coords[b, 0] - coords[a, 0]) * (coords[c, 1] - coords[a, 1])
+                     - (coords[c, 0] - coords[a, 0]) * (coords[b, 1] - coords[a, 1]))
+
+
+@njit(cache=True, nogil=True)
+def _ringImportance(coords, start, n, pinned, importance):
+    """Set the effective areas of a closed ring's n distinct vertices from start onwards, inf for those never dropped.
+    """
+
+    prv = np.empty(n, dtype=np.int64)
+    nxt = np.empty(n, dtype=np.int64)
+    area = np.full(n, np.inf)
+
+    for i in range(n):
+        prv[i] = (i + n - 1) % n
+        nxt[i] = (i + 1) % n
+
+    heap = [(np.inf, np.int64(0))]
+    heap.pop()
+
+    # the first vertex is kept, as it also closes the ring
+    for i in range(1, n):
+        if not pinned[start + i]:
+            area[i] = _area(coords, start + prv[i], start + i, start + nxt[i])
+            heap.append((area[i], np.int64(i)))
+
+    heapq.heapify(heap)
+
+    for i in range(n):
+        importance[start + i] = np.inf
+
+    remaining = n
+    current = 0.
+
+    while remaining > 3 and len(heap) > 0:
+        a, i = heapq.heappop(heap)
+
+        # superseded by a recomputed area
+        if a != area[i] or importance[start + i] != np.inf:
+            continue
+
+        current = max(current, a)
+        importance[start + i] = current
+        remaining -= 1
+
+        p, q = prv[i], nxt[i]
+        nxt[p], prv[q] = q, p
+
+        for j in (p, q):
+            if j != 0 and not pinned[start + j]:
+                area[j] = _area(coords, start + prv[j], start + j, start + nxt[j])
+                heapq.heappush(heap, (area[j], j))
+
+
+@njit(cache=True, nogil=True)
+def _layerImportance(coords, ring_offsets, pinned):
+
+    importance = np.empty(len(coords))
+
+    for r in range(len(ring_offsets) - 1):
+        start, end = ring_offsets[r], ring_offsets[r + 1]
+        # closing vertex
+        importance[end - 1] = np.inf
+        if end - start > 4:
+            _ringImportance(coords, start, end - start - 1, pinned, importance)
+        else:
+            importance[start:end] = np.inf
+
+    return importance
+
+
+def _ringNeighbours(ring_offsets: np.ndarray, n: int):
+    """Return the positions of each vertex's previous and next distinct vertex within its closed ring.
+    """
+
+    idx = np.arange(n)
+    starts = np.repeat(ring_offsets[:-1], np.diff(ring_offsets))
+    ends = np.repeat(ring_offsets[1:], np.diff(ring_offsets)) - 1
+
+    prv = np.where(idx == starts, ends - 1, idx - 1)
+    nxt = np.where(idx >= ends - 1, starts, idx + 1)
+
+    return prv, nxt
+
+
+def vertexImportance(*layers: RaggedGeometry) -> List[np.ndarray]:
+    """Return the effective area of every vertex of each layer, shared vertices resolved across all layers.
+
+    Parameters
+    ----------
+    *layers : RaggedGeometry
+        Layers in the same CRS, e.g. buildings_in, buildings_out and rivers as returned by sql2gdf(..., ragged=True).
+
+    Returns
+    ----------
+        One float64 array per layer, aligned with its coords, inf for vertices never dropped.
+    """
+
+    coords = np.concatenate([layer.coords for layer in layers])
+    ring_offsets = np.concatenate([[0]] + [layer.ring_offsets[1:] + offset for layer, offset in
+                                           zip(layers, np.cumsum([0] + [len(layer.coords) for layer in layers[:-1]]))])
+
+    # vertices by coordinates, closing vertices left out as they repeat the first one
+    closing = np.zeros(len(coords), dtype=bool)
+    closing[ring_offsets[1:] - 1] = True
+    keys = np.ascontiguousarray(coords).view(np.complex128).ravel()
+    _, inverse, counts = np.unique(np.where(closing, np.nan, keys), return_inverse=True, return_counts=True)
+    occurrences = np.where(closing, 1, counts[inverse])
+
+    shared = occurrences > 1
+    prv, nxt = _ringNeighbours(ring_offsets, len(coords))
+    pinned = shared & ((occurrences > 2) | ~shared[prv] | ~shared[nxt])
+
+    importance = _layerImportance(coords, ring_offsets, pinned)
+
+    # the same importance for every occurrence of a shared vertex
+    unified = np.zeros(len(counts))
+    np.maximum.at(unified, inverse[shared], importance[shared])
+    importance[shared] = unified[inverse[shared]]
+
+    return np.split(importance, np.cumsum([len(layer.coords) for layer in layers])[:-1])
+
+
+def cachedImportance(layers: Sequence[RaggedGeometry], key: str, cachedir: str=cachedir) -> List[np.ndarray]:
+    """Return vertexImportance() of the layers, cached by dataset key as a .npz in cachedir.
+
+    A hash of the layers' coordinates and offsets is compared to catch changed data.
+    """
+
+    fingerprint = ' '.join(layer.fingerprint() for layer in layers)
+
+    cachepath = cachedir + key + '.npz'
+
+    if os.path.exists(cachepath):
+        with np.load(cachepath) as npz:
+            if str(npz['fingerprint']) == fingerprint:
+                return [npz['layer' + str(i)] for i in range(len(layers))]
+
+    importance = vertexImportance(*layers)
+
+    if not os.path.exists(cachedir):
+        os.makedirs(cachedir)
+
+    np.savez(cachepath, fingerprint=fingerprint, **{'layer' + str(i): values for i, values in enumerate(importance)})
+
+    return importance
+
+
+def pixelTolerance(bounds: Sequence[float], width: int=None, height: int=None, pixels: float=1.) -> float:
+    """Return the tolerance in CRS units of the given number of pixels, for bounds (x0, y0, x1, y1) drawn width or height pixels across.
+    """
+
+    if width is not None:
+        return pixels * (bounds[2] - bounds[0]) / width
+
+    return pixels * (bounds[3] - bounds[1]) / height
+
+
+def simplifyLayers(layers: Sequence[RaggedGeometry], key: str, width: int=None, height: int=None, pixels: float=1.) -> List[RaggedGeometry]:
+    """Return the layers simplified to a tolerance in pixels of a canvas showing their combined bounds.
+
+    Parameters
+    ----------
+    layers : sequence of RaggedGeometry
+        In a projected CRS, as importance is an area.
+    key : str
+        Identifies the dataset for the importance cache, e.g. the db_name.
+    width, height : int
+        Canvas width, or else height, in pixels.
+    pixels : float
+        Tolerance in pixels, e.g. 0.5.
+    """
+
+    # e.g. read from a snapshot already
+    if any(layer.importance is None for layer in layers):
+        layers = [layer.withImportance(values) for layer, values in zip(layers, cachedImportance(layers, key))]
+
+    bounds = np.array([layer.total_bounds for layer in layers])
+    tolerance = pixelTolerance((bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()), width, height, pixels)
+
+    return [layer.simplify(tolerance) for layer in layers]
@@ -0,0 +1,271 @@
+"""Memory-mapped Arrow IPC snapshot of the three layers returned by sql2gdf(), for near-zero startup without PostGIS.
+
+The snapshot is a single Arrow IPC file with one record batch per layer and the columns
+    - layer: the layer name, dictionary-encoded
+    - use: the building use, dictionary-encoded, null for rivers/streams
+    - geometry: GeoArrow MultiPolygons with interleaved coordinates, i.e. list<list<list<fixed_size_list<double, 2>>>>
+    - importance, optional: the Visvalingam-Whyatt effective area of every vertex as list<list<list<float>>>, nested
+      as the geometry, so that readers can simplify to any tolerance without recomputing it (see simplify.py)
+and the fingerprint of the source tables in its metadata, e.g. sql2gdf.sourceFingerprint(), so that a stale snapshot
+is re-exported, as with the Parquet datasets of spatialparquet.py.
+
+Opened via pa.memory_map(), the coordinate buffers are mapped rather than read, and are used as the coordinate arrays of
+RaggedGeometry layers (see ragged.py) without copying. Several processes opening the same snapshot, e.g. Bokeh Server
+workers or benchmark subprocesses, therefore share the same physical pages through the OS page cache.
+
+As a mapped file can be neither replaced nor deleted on Windows, each export is written as a new version
+[db_name].[version].arrow, and readers open the latest. Older versions are deleted once no longer mapped.
+"""
+
+import os
+import re
+import time
+import contextlib
+from typing import Dict, Optional, Tuple, Union
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import geopandas as gpd # for type hinting only
+from mapcompare.ragged import RaggedGeometry
+
+# relative to the package, as the Bokeh Server apps are run from within apps/
+snapshotdir = os.path.join(os.path.dirname(__file__), 'temp', 'snapshots') + os.sep
+
+LAYER_NAMES = ('buildings_in', 'buildings_out', 'rivers')
+
+_schema = pa.schema([
+    pa.field('layer', pa.dictionary(pa.int8(), pa.string())),
+    pa.field('use', pa.dictionary(pa.int32(), pa.string())),
+    pa.field('geometry', pa.list_(pa.list_(pa.list_(pa.list_(pa.float64(), 2)))),
+             metadata={'ARROW:extension:name': 'geoarrow.multipolygon'}),
+    pa.field('importance', pa.list_(pa.list_(pa.list_(pa.float32()))))
+])
+
+
+def _versions(db_name: str) -> Dict[int, str]:
+    """Return the paths of a database's snapshot versions by version.
+    """
+
+    if not os.path.exists(snapshotdir):
+        return {}
+
+    pattern = re.compile(re.escape(db_name) + r'\.(\d+)\.arrow')
+    matches = [pattern.fullmatch(name) for name in os.listdir(snapshotdir)]
+
+    return {int(match.group(1)): snapshotdir + match.group(0) for match in matches if match}
+
+
+def snapshotPath(db_name: str) -> Optional[str]:
+    """Return the path of a database's latest snapshot, or None if none has been exported yet.
+    """
+
+    versions = _versions(db_name)
+
+    return versions[max(versions)] if versions else None
+
+
+def snapshotMetadata(path: str) -> Dict[str, Union[str, bool]]:
+    """Return the 'source' fingerprint a snapshot was exported from, None if unknown, and whether it holds 'importance'.
+    """
+
+    with pa.memory_map(path, 'r') as source:
+        schema = pa.ipc.open_file(source).schema
+
+    return dict(source=schema.metadata.get(b'source', b'').decode() or None, importance='importance' in schema.names)
+
+
+def _layerBatch(name: str, layer: RaggedGeometry, names: Tuple[str, ...], uses: pa.Array) -> pa.RecordBatch:
+    """Return a layer as a record batch, with the geometry column built from its coordinate and offset buffers.
+
+    IPC files allow a single dictionary per field, so all batches are encoded against the same layer names and uses.
+    """
+
+    n = len(layer)
+
+    def nested(values):
+        rings = pa.ListArray.from_arrays(pa.array(layer.ring_offsets.astype(np.int32)), values)
+        polys = pa.ListArray.from_arrays(pa.array(layer.part_offsets.astype(np.int32)), rings)
+        return pa.ListArray.from_arrays(pa.array(layer.geom_offsets.astype(np.int32)), polys)
+
+    multipolys = nested(pa.FixedSizeListArray.from_arrays(pa.array(layer.coords.ravel()), 2))
+
+    if 'use' in layer.attributes.columns:
+        codes = pd.Categorical(layer.attributes['use'], categories=uses.to_pylist()).codes.astype(np.int32)
+    else:
+        codes = np.full(n, -1, dtype=np.int32)
+
+    columns = [
+        pa.DictionaryArray.from_arrays(pa.array(np.full(n, names.index(name), dtype=np.int8)), pa.array(list(names))),
+        pa.DictionaryArray.from_arrays(pa.array(codes, mask=codes < 0), uses),
+        multipolys
+    ]
+
+    if layer.importance is None:
+        return pa.RecordBatch.from_arrays(columns, schema=_schema.remove(_schema.get_field_index('importance')))
+
+    return pa.RecordBatch.from_arrays(columns + [nested(pa.array(layer.importance.astype(np.float32)))], schema=_schema)
+
+
+def writeSnapshot(*layers: Union[RaggedGeometry, gpd.GeoDataFrame], path: str, names: Tuple[str, ...]=LAYER_NAMES,
+                  fingerprint: str=None, importance: bool=False) -> str:
+    """Write the layers as returned by sql2gdf(), as GeoDataFrames or RaggedGeometry, to an Arrow IPC snapshot.
+
+    Parameters
+    ----------
+    path : str
+        Path of the snapshot, which must not be mapped by any process, e.g. a new version, see updateSnapshot().
+    fingerprint : str, optional
+        Fingerprint of the source data, e.g. sql2gdf.sourceFingerprint(db_name, password), stored in the metadata.
+    importance : bool
+        Compute and store the vertex importance, across all layers so that shared walls are simplified alike. Only
+        needed by readers simplifying, see simplify.py, and otherwise skipped along with its JIT compilation.
+
+    Returns
+    ----------
+        The path written to.
+    """
+
+    layers = [layer if isinstance(layer, RaggedGeometry) else RaggedGeometry.fromGeoDataFrame(layer) for layer in layers]
+
+    if importance:
+        from mapcompare.simplify import vertexImportance
+        layers = [layer.withImportance(values) for layer, values in zip(layers, vertexImportance(*layers))]
+    else:
+        layers = [layer.withImportance(None) for layer in layers]
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    uses = pa.array(sorted({use for layer in layers if 'use' in layer.attributes.columns for use in layer.attributes['use'].dropna()}), type=pa.string())
+    crs = {layer.crs for layer in layers if layer.crs is not None}
+    schema = _schema if importance else _schema.remove(_schema.get_field_index('importance'))
+    schema = schema.with_metadata({'crs': crs.pop() if crs else '', 'layers': ','.join(names), 'source': fingerprint or ''})
+
+    # written to a temporary file first, so that readers never open a partial snapshot
+    with pa.OSFile(path + '.tmp', 'wb') as sink:
+        with pa.ipc.new_file(sink, schema) as writer:
+            for name, layer in zip(names, layers):
+                writer.write_batch(_layerBatch(name, layer, tuple(names), uses))
+
+    os.replace(path + '.tmp', path)
+
+    return path
+
+
+def updateSnapshot(db_name: str, password: str, fingerprint: str=None, importance: bool=False) -> str:
+    """Export a database's layers from PostGIS as a new snapshot version, and delete the older versions no longer mapped.
+
+    Older versions still mapped by a process, which Windows refuses to delete, are left to a later export.
+
+    Returns
+    ----------
+        The path of the new version.
+    """
+
+    from mapcompare.sql2gdf import sql2gdf
+
+    # versions ordered by export time, one version per export
+    path = snapshotdir + '{}.{}.arrow'.format(db_name, time.time_ns())
+
+    writeSnapshot(*sql2gdf(db_name, password, ragged=True), path=path, fingerprint=fingerprint, importance=importance)
+
+    for old in _versions(db_name).values():
+        if old != path:
+            with contextlib.suppress(OSError):
+                os.remove(old)
+
+    return path
+
+
+def ensureSnapshot(db_name: str, password: str=None, fingerprint: str=None, importance: bool=False) -> str:
+    """Return the path of a database's latest snapshot, exporting it first if none exists or the latest is stale.
+
+    Parameters
+    ----------
+    fingerprint : str, optional
+        Fingerprint of the source data, e.g. sql2gdf.sourceFingerprint(db_name, password). The snapshot is re-exported
+        if it was exported from a different one. Without a fingerprint, an existing snapshot is never re-exported.
+    importance : bool
+        Re-export the snapshot with vertex importance if it was exported without.
+    """
+
+    path = snapshotPath(db_name)
+
+    if path is not None:
+        metadata = snapshotMetadata(path)
+        if (fingerprint is None or metadata['source'] == fingerprint) and (metadata['importance'] or not importance):
+            return path
+
+    return updateSnapshot(db_name, password, fingerprint, importance)
+
+
+def _relativeOffsets(array: pa.Array) -> np.ndarray:
+    """Return the offsets of a list array relative to its first element.
+    """
+
+    offsets = array.offsets.to_numpy()
+
+    return offsets - offsets[0]
+
+
+def readSnapshot(path: str) -> Dict[str, RaggedGeometry]:
+    """Open a snapshot memory-mapped and return its layers as RaggedGeometry by name.
+
+    The coordinate and importance arrays are read-only views of the mapped file. Offsets are widened to int64, which
+    copies them. Snapshots written before importance was added are read without it.
+    """
+
+    source = pa.memory_map(path, 'r')
+    reader = pa.ipc.open_file(source)
+    crs = reader.schema.metadata.get(b'crs', b'').decode() or None
+
+    layers = {}
+
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        name = reader.schema.metadata[b'layers'].decode().split(',')[i]
+
+        multipolys = batch.column(2)
+        polys = multipolys.flatten()
+        rings = polys.flatten()
+        vertices = rings.flatten()
+        coords = vertices.flatten().to_numpy(zero_copy_only=True).reshape(-1, 2)
+
+        if 'importance' in batch.schema.names:
+            importance = batch.column('importance').flatten().flatten().flatten().to_numpy(zero_copy_only=True)
+        else:
+            importance = None
+
+        use = batch.column(1)
+        attributes = pd.DataFrame({'use': use.to_pandas()}) if use.null_count < len(use) else pd.DataFrame(index=pd.RangeIndex(batch.num_rows))
+
+        layers[name] = RaggedGeometry(coords, _relativeOffsets(rings), _relativeOffsets(polys), _relativeOffsets(multipolys), attributes, crs,
+                                      importance)
+
+    return layers
+
+
+def loadSnapshot(db_name: str, password: str=None, ragged: bool=False, fingerprint: str=None) -> Tuple:
+    """Return the three layers from the database's snapshot, exporting it from PostGIS first if missing or stale.
+
+    Parameters
+    ----------
+    db_name : {'dd', 'dd_subset'}
+        Source PostGIS database.
+    password : str, optional
+        Only required if the snapshot has to be exported.
+    ragged : bool
+        Return RaggedGeometry layers, sharing the mapped pages, rather than GeoDataFrames as sql2gdf() does.
+    fingerprint : str, optional
+        Fingerprint of the source data, re-exporting the snapshot if it was exported from a different one, see ensureSnapshot().
+
+    Returns
+    ----------
+        buildings_in, buildings_out, rivers
+    """
+
+    layers = readSnapshot(ensureSnapshot(db_name, password, fingerprint))
+
+    if ragged:
+        return tuple(layers[name] for name in LAYER_NAMES)
+
+    return tuple(layers[name].toGeoDataFrame() for name in LAYER_NAMES)
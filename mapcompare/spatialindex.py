@@ -0,0 +1,41 @@
+"""Spatial index helpers shared by renderers that only need the features within a given extent.
+
+Wraps shapely's STRtree, which is bulk-loaded once per layer and queried with vectorised bounding box tests.
+"""
+
+from typing import Sequence
+import numpy as np
+import shapely
+from shapely import STRtree
+from geopandas import GeoSeries
+
+
+def buildIndex(geoms: GeoSeries) -> STRtree:
+    """Return a packed STRtree over a layer's geometries.
+    """
+
+    return STRtree(np.asarray(geoms.values))
+
+
+def bboxQuery(tree: STRtree, extent: Sequence[float], predicate: str=None) -> np.ndarray:
+    """Return sorted positional indices of the geometries intersecting an extent in (x0, x1, y0, y1) order.
+
+    Parameters
+    ----------
+    tree : STRtree
+        Index as returned by buildIndex().
+    extent : sequence of float
+        Query window in cartopy set_extent order, as returned by getExtent().
+    predicate : str, optional
+        Refine the bounding box candidates with an exact shapely predicate, e.g. 'intersects'.
+        Without a predicate, all features whose bounds overlap the extent are returned,
+        which is sufficient for culling ahead of rendering.
+
+    Returns
+    ----------
+        Array of positional indices into the indexed layer.
+    """
+
+    x0, x1, y0, y1 = extent
+
+    return np.sort(tree.query(shapely.box(x0, y0, x1, y1), predicate=predicate))
@@ -0,0 +1,128 @@
+"""Write and lazily read the merged layers as a spatially partitioned Parquet dataset for datashader.
+
+Instead of converting the merged GeoDataFrame to a spatialpandas GeoDataFrame on every run, the conversion is done once.
+Features are sorted along a Hilbert curve and packed into partitions whose bounds are stored alongside the dataset.
+Loaded as a dask-backed spatialpandas DaskGeoDataFrame, aggregation is then parallelised across partitions
+and datashader only reads the partitions that intersect the current x_range/y_range.
+
+Datasets are rebuilt once a fingerprint of their source, e.g. sql2gdf.sourceFingerprint(), differs from the one stored
+alongside them.
+"""
+
+import os
+import shutil
+from typing import Callable, List, Sequence, Union
+import numpy as np
+import pandas as pd
+import geopandas as gpd # for type hinting only
+import dask.dataframe as dd
+from spatialpandas import GeoDataFrame
+from spatialpandas.dask import DaskGeoDataFrame
+from spatialpandas.io import read_parquet_dask
+
+# relative to the package, as the Bokeh Server apps are run from within apps/
+parquetdir = os.path.join(os.path.dirname(__file__), 'temp', 'parquet') + os.sep
+
+
+def parquetPath(db_name: str, epsg: int) -> str:
+    """Return the dataset path for a database and CRS, e.g. the UTM 33 layers of ds.py or the Web Mercator layers of the apps.
+    """
+
+    return parquetdir + db_name + ' (epsg_' + str(epsg) + ').parq'
+
+
+def writeParquet(merged: Union[gpd.GeoDataFrame, GeoDataFrame], path: str, npartitions: int=None) -> str:
+    """Write the merged GeoDataFrame as a Hilbert-sorted, spatially partitioned Parquet dataset.
+
+    Parameters
+    ----------
+    merged : GeoPandas or SpatialPandas GeoDataFrame
+        All three feature sets with a 'category' column, as produced by the prepGDFs() functions of the datashader scripts.
+    path : str
+        Output folder, see parquetPath(). Replaced if it exists.
+    npartitions : int, optional
+        Number of spatial partitions. Defaults to one per 10,000 features but at least one per CPU,
+        trading viewport pruning against per-partition overhead.
+
+    Returns
+    ----------
+        The path written to.
+    """
+
+    if npartitions is None:
+        npartitions = max(os.cpu_count() or 1, len(merged) // 10000)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+    ddf = dd.from_pandas(GeoDataFrame(merged), npartitions=npartitions)
+
+    # p=15: Hilbert curve order, i.e. a 2^15 x 2^15 grid over the total bounds
+    ddf.pack_partitions_to_parquet(path, npartitions=npartitions, p=15)
+
+    return path
+
+
+def readParquet(path: str, categories: Sequence[str]) -> DaskGeoDataFrame:
+    """Lazily open a dataset written by writeParquet() as a DaskGeoDataFrame.
+
+    Parameters
+    ----------
+    path : str
+        Dataset folder, see parquetPath().
+    categories : sequence of str
+        Values of the 'category' column, e.g. the keys of the color_key. ds.by() requires known categories.
+        datashader skips partitions outside the canvas' ranges on aggregation, so no window is read ahead.
+
+    Returns
+    ----------
+        DaskGeoDataFrame with one partition per spatial partition.
+    """
+
+    ddf = read_parquet_dask(path)
+    ddf['category'] = ddf['category'].astype(pd.CategoricalDtype(categories=list(categories)))
+
+    return ddf
+
+
+def _storedFingerprint(path: str) -> str:
+
+    if not os.path.exists(path + '.source'):
+        return None
+
+    with open(path + '.source') as f:
+        return f.read().strip()
+
+
+def loadParquet(db_name: str, epsg: int, categories: Sequence[str], prep: Callable[[], GeoDataFrame], fingerprint: str=None) -> DaskGeoDataFrame:
+    """Return the prepared dataset for a database and CRS, calling prep() to create it only if it does not exist yet or is outdated.
+
+    prep() is expected to query PostGIS and merge the layers, e.g. lambda: prepGDFs(*sql2gdf(db_name, password)).
+
+    Parameters
+    ----------
+    fingerprint : str, optional
+        Fingerprint of the source data, e.g. sql2gdf.sourceFingerprint(db_name, password), stored next to the dataset
+        in a [path].source file. The dataset is rebuilt if it was written from a different one. Without a fingerprint,
+        an existing dataset is always used.
+    """
+
+    path = parquetPath(db_name, epsg)
+
+    if not os.path.exists(path) or (fingerprint is not None and _storedFingerprint(path) != fingerprint):
+        writeParquet(prep(), path)
+
+        if fingerprint is not None:
+            with open(path + '.source', 'w') as f:
+                f.write(fingerprint)
+
+    return readParquet(path, categories)
+
+
+def totalBounds(ddf: DaskGeoDataFrame) -> List[np.float64]:
+    """Return the combined bbox (x0, x1, y0, y1) from the stored partition bounds, without reading any geometry.
+    """
+
+    bounds = ddf.geometry.partition_bounds
+
+    return [bounds['x0'].min(), bounds['x1'].max(), bounds['y0'].min(), bounds['y1'].max()]
@@ -2,13 +2,19 @@
     - all buildings within 500m of a river/stream, and their building use (simplified schema in English)
     - all buildings outside 500m of a river/stream, and their building use (simplified schema in English)
     - all rivers, streams and canals
+
+With ragged=True, the layers are returned as RaggedGeometry arrays (see ragged.py) instead, built from WKB without a GeoDataFrame.
+With incremental=True, only rows changed since the previous call are fetched (see deltasync.py).
+sourceFingerprint() returns the source tables' change counts, for caches derived from the layers to detect changes.
 """
 import numpy as np
+import pandas as pd
 import geopandas as gpd
 from sqlalchemy import create_engine
 import time
 import functools
 from mapcompare.misc.pw import password
+from mapcompare.ragged import RaggedGeometry, raggedQuery
 
 def timer(func):
     """Print runtime of decorated function courtesy of RealPython's Primer on Python Decorators: https://realpython.com/primer-on-python-decorators/"""
@@ -23,11 +29,48 @@ def timer(func):
         return value
     return wrapper_timer
 
+def sourceFingerprint(db_name, password):
+    """Return the cumulative insert, update and delete counts of ax_gebaeude and ax_fliessgewaesser as a change marker.
+
+    Read from the statistics collector's pg_stat_user_tables, i.e. a lookup of two rows rather than a scan of the tables,
+    so that it is cheap enough to check on every session or run. The counts only grow with any insert, update or delete,
+    including those of rolled back transactions or of a reload, which merely cause a spurious rebuild. They are
+    reported with a delay of up to a second, and start over should the statistics be reset, likewise causing a rebuild.
+    """
+
+    db_connection_url = "postgresql://postgres:" + password + "@localhost:5432/" + db_name
+
+    con = create_engine(db_connection_url)
+
+    sql = """SELECT relname, n_tup_ins, n_tup_upd, n_tup_del
+    FROM pg_stat_user_tables
+    WHERE schemaname = 'public' AND relname IN ('ax_gebaeude', 'ax_fliessgewaesser')
+    ORDER BY relname;"""
+
+    return '-'.join('{relname}:{n_tup_ins}:{n_tup_upd}:{n_tup_del}'.format(**row) for row in pd.read_sql(sql, con).to_dict('records'))
+
 @timer
-def sql2gdf(db_name, password):
-    """Return GeoDataFrames from PostGIS database.
+def sql2gdf(db_name, password, ragged=False, incremental=False):
+    """Return GeoDataFrames from PostGIS database, or RaggedGeometry layers if ragged=True.
+
+    With incremental=True, the layers are cached and only rows changed since the last call are fetched, see deltasync.py.
+    The layers then also carry a gml_id column.
     """
 
+    if incremental:
+        from mapcompare.deltasync import DeltaSync
+
+        sync = DeltaSync(db_name, password)
+        changes = sync.sync()
+        print(changes.summary())
+
+        layers = [layer.reset_index() for layer in sync.layers]
+
+        if ragged:
+            return tuple(RaggedGeometry.fromGeoDataFrame(layer) for layer in layers)
+
+        return tuple(layers)
+
     db_connection_url = "postgresql://postgres:" + password + "@localhost:5432/" + db_name
 
     con = create_engine(db_connection_url)
@@ -43,7 +86,10 @@ def sql2gdf(db_name, password):
         JOIN buffer ON ST_Within(g.wkb_geometry, buffer.geom) 
         OR ST_Intersects(g.wkb_geometry, buffer.geom);"""
 
-    buildings_in = gpd.GeoDataFrame.from_postgis(sql1, con, crs='epsg:25833')
+    if ragged:
+        buildings_in = raggedQuery(sql1, con, columns=['use'], crs='epsg:25833')
+    else:
+        buildings_in = gpd.GeoDataFrame.from_postgis(sql1, con, crs='epsg:25833')
 
     # Find all other buildings
     # FYI: 500m buffer: 41,878 rows, 1min29secs, 300m buffer: 77,705 rows, 4min29secs
@@ -63,12 +109,18 @@ def sql2gdf(db_name, password):
                 FROM public.ax_gebaeude as g 
                 JOIN buffer ON ST_Within(g.wkb_geometry, buffer.geom) OR ST_Intersects(g.wkb_geometry, buffer.geom));"""
 
-    buildings_out = gpd.GeoDataFrame.from_postgis(sql2, con, crs='epsg:25833')
+    if ragged:
+        buildings_out = raggedQuery(sql2, con, columns=['use'], crs='epsg:25833')
+    else:
+        buildings_out = gpd.GeoDataFrame.from_postgis(sql2, con, crs='epsg:25833')
 
     # Query 3: Find all rivers
     sql3 = """SELECT wkb_geometry as geom 
     FROM public.ax_fliessgewaesser;"""
 
-    rivers = gpd.GeoDataFrame.from_postgis(sql3, con, crs='epsg:25833')
+    if ragged:
+        rivers = raggedQuery(sql3, con, columns=[], crs='epsg:25833')
+    else:
+        rivers = gpd.GeoDataFrame.from_postgis(sql3, con, crs='epsg:25833')
 
     return buildings_in, buildings_out, rivers
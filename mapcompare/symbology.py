@@ -0,0 +1,135 @@
+"""Shared symbology of the map template and lightweight legend proxies per backend.
+
+Each layer's style and legend label is defined once here and read by the scripts, both to draw the layers and
+to build their legends. Styles and labels are those each library's script has always drawn, which differ slightly
+between libraries, e.g. the Bokeh and GeoViews legend labels. Legends are built from proxy handles holding zero or one
+feature, rather than from the layers themselves, so that showing a legend neither serialises the geometries a second
+time nor adds to render time:
+    - matplotlib: mpatches handles for ax.legend() (gpd.py, carto.py, gplt.py, mpl_pc.py)
+    - Bokeh: renderers without data, carrying only a legend label (bkh.py)
+    - HoloViews/GeoViews: one degenerate polygon per layer, or an NdOverlay of points as in the datashader apps
+"""
+
+from typing import Dict, List, Sequence
+
+# styles and legend labels in drawing order, in matplotlib's vocabulary, as drawn by the matplotlib scripts:
+#     - keys left out take matplotlib's defaults, e.g. the edge of the buildings within 500m
+#     - short_label is shown along with the number of features, see legendLabels()
+#     - handle overrides the style of the legend handle, see mplHandles()
+LAYERS = [
+    dict(label='Buildings within 500m of river/stream', short_label='Buildings within 500m', facecolor='red'),
+    dict(label='Buildings outside 500m of river/stream', short_label='Buildings outside 500m', facecolor='lightgrey',
+         edgecolor='black', linewidth=0.1, handle=dict(linewidth=0.5)),
+    dict(label='Rivers or streams', short_label='Rivers or streams', facecolor='lightblue', edgecolor='blue', linewidth=0.25)
+]
+
+# legend labels of the HoloViews/GeoViews scripts, see hvPolygonProxies()
+HV_LABELS = ['Buildings within 500m of rivers/stream', 'Buildings outside 500m of rivers/stream', 'Rivers/streams']
+
+# styles and legend labels in drawing order, in Bokeh's vocabulary, as drawn by bkh.py
+BOKEH_LAYERS = [
+    dict(label='Buildings within 500m of river/stream', color='red'),
+    dict(label='Buildings outside 500m of river/stream', color='lightgrey', line_color='black', line_width=0.5),
+    dict(label='River/stream', color='lightblue', line_color='blue', line_width=0.25)
+]
+
+
+def mplStyle(layer: dict, **defaults) -> dict:
+    """Return a layer's facecolor, edgecolor and linewidth as keyword arguments of matplotlib artists, e.g. via GeoPandas' .plot().
+
+    Keys the layer leaves out are taken from defaults if given, e.g. edgecolor='none' for a PathCollection.
+    """
+
+    return dict(defaults, **{key: layer[key] for key in ('facecolor', 'edgecolor', 'linewidth') if key in layer})
+
+
+def legendLabels(counts: Sequence[int]=None, layers: Sequence[dict]=LAYERS) -> List[str]:
+    """Return the layers' legend labels, or their short labels followed by their number of features if counts are given.
+    """
+
+    if counts is None:
+        return [layer['label'] for layer in layers]
+
+    return [layer['short_label'] + ' (n=' + str(count) + ')' for layer, count in zip(layers, counts)]
+
+
+def mplHandles(layers: Sequence[dict]=LAYERS) -> list:
+    """Return one mpatches.Rectangle handle per layer, to be passed to ax.legend() along with the labels.
+    """
+
+    import matplotlib.patches as mpatches
+
+    return [mpatches.Rectangle((0, 0), 1, 1, **dict(mplStyle(layer), **layer.get('handle', {}))) for layer in layers]
+
+
+def bokehGlyph(layer: dict) -> dict:
+    """Return a layer's glyph properties as keyword arguments of Bokeh's figure.patches(), i.e. without its label.
+    """
+
+    return {key: value for key, value in layer.items() if key != 'label'}
+
+
+def bokehProxies(p, renderers: Sequence=(), layers: Sequence[dict]=BOKEH_LAYERS) -> list:
+    """Add one patches renderer without any data per layer to a Bokeh figure, and a legend entry per layer drawn from it.
+
+    Parameters
+    ----------
+    p : bokeh.plotting.figure
+        Figure to add the proxies and legend to.
+    renderers : sequence of GlyphRenderer
+        The renderers drawing the layers, in the same order, hidden along with their proxy by the legend's click policy.
+
+    Returns
+    ----------
+        The proxy renderers.
+    """
+
+    from bokeh.models import Legend, LegendItem
+
+    proxies = [p.patches(xs=[], ys=[], **bokehGlyph(layer)) for layer in layers]
+    layer_renderers = list(renderers) or [None] * len(proxies)
+
+    items = [LegendItem(label=layer['label'], renderers=[proxy] + ([renderer] if renderer is not None else []))
+             for layer, proxy, renderer in zip(layers, proxies, layer_renderers)]
+
+    p.add_layout(Legend(items=items))
+
+    return proxies
+
+
+def hvPolygonProxies(module, layers: Sequence[dict]=LAYERS, labels: Sequence[str]=HV_LABELS, **kwargs):
+    """Return an overlay of one degenerate, single-point polygon per layer, showing as legend entries in HoloViews/GeoViews.
+
+    Parameters
+    ----------
+    module : module
+        holoviews or geoviews, i.e. hv or gv.
+    labels : sequence of str
+        Legend labels, defaulting to those of the HoloViews/GeoViews scripts.
+    **kwargs
+        Passed to the Polygons elements, e.g. crs=ccrs.GOOGLE_MERCATOR for GeoViews.
+    """
+
+    overlay = None
+
+    for layer, label in zip(layers, labels):
+        proxy = module.Polygons([{'x': [0, 0, 0], 'y': [0, 0, 0]}], label=label, **kwargs).opts(
+            color_index=None, color=layer['facecolor'], show_legend=True, apply_ranges=False)
+        overlay = proxy if overlay is None else overlay * proxy
+
+    return overlay
+
+
+def hvPointsLegend(module, color_key: Dict[str, str]):
+    """Return an NdOverlay of one point per category, the legend of datashaded layers in HoloViews/GeoViews.
+
+    Parameters
+    ----------
+    module : module
+        holoviews or geoviews, i.e. hv or gv.
+    color_key : dict
+        Category to colour mapping as passed to datashade().
+    """
+
+    return module.NdOverlay({k: module.Points([0, 0], label=str(k)).opts(color=v, apply_ranges=False)
+                             for k, v in color_key.items()}, 'category')
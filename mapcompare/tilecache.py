@@ -0,0 +1,340 @@
+"""Disk-backed cache of the OSM basemap tiles, prefetched for the extent of the layers and served over HTTP.
+
+Every render with basemap=True otherwise refetches its tiles from tile.openstreetmap.org, adding network latency and
+its variance to the timings. With the tile cache,
+    - tiles are stored as mapcompare/temp/tiles/osm/z/x/y.png, fetched once either by prefetch() or on first request
+    - a tile server answers from the cache and only falls back to OSM on a miss, at most two downloads at a time as
+      OSM's tile usage policy allows, or returns 404 if offline=True
+    - scripts and apps with tile_cache=True get their basemap from basemapSource()
+
+Where the tiles are served from depends on who requests them:
+    - contextily, geoplot and GeoViews with matplotlib fetch tiles while rendering, i.e. within the script's process,
+      which serves the cache itself from a daemon thread, see serveCache()
+    - Bokeh, GeoViews/HoloViews with Bokeh, hvPlot and Plotly figures fetch their tiles in the browser, possibly after
+      the script has exited or on another host than a Bokeh Server. They point at a standalone server started with
+      `mapcompare tiles`, at MAPCOMPARE_TILE_URL, by default http://localhost:8002
+
+Prefetch the tiles of a database's extent with scripts/osm_tiles.py. Note that OSM's tile usage policy rules out bulk
+downloads, so prefetch only the few zoom levels the figures actually use.
+"""
+
+import os
+import math
+import socket
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterable, List, Optional, Sequence
+import numpy as np
+import requests
+from mapcompare.inputs import envName
+from mapcompare.xyz import ORIGIN, serveHandler, tilesInExtent
+
+# relative to the package, as the Bokeh Server apps are run from within apps/
+cachedir = os.path.join(os.path.dirname(__file__), 'temp', 'tiles', 'osm') + os.sep
+
+OSM_URL = 'https://tile.openstreetmap.org/{z}/{x}/{y}.png'
+USER_AGENT = 'mapcompare/0.1.0 (+https://github.com/gregorhd/mapcompare)'
+
+# concurrent downloads allowed by OSM's tile usage policy
+OSM_CONNECTIONS = 2
+
+# standalone tile server, see serveForever(), overridden by MAPCOMPARE_TILE_URL
+TILE_URL = 'http://localhost:8002'
+
+# longitudinal range by zoom level (20 to 1) in degrees, if centered at equator, as in get_zoom_mercator() of gv.py and plotly_py.py
+LON_ZOOM_RANGE = np.array([
+    0.0007, 0.0014, 0.003, 0.006, 0.012, 0.024, 0.048, 0.096,
+    0.192, 0.3712, 0.768, 1.536, 3.072, 6.144, 11.8784, 23.7568,
+    47.5136, 98.304, 190.0544, 360.0
+])
+
+
+def zoomMercator(extent: Sequence[float], margin: float=1.2) -> int:
+    """Return the zoom level showing a lon/lat extent (x0, x1, y0, y1), computed like get_zoom_mercator() in gv.py.
+    """
+
+    minlon, maxlon, minlat, maxlat = extent
+    width_to_height = (maxlon - minlon) / (maxlat - minlat)
+
+    height = (maxlat - minlat) * margin * width_to_height
+    width = (maxlon - minlon) * margin
+    lon_zoom = np.interp(width, LON_ZOOM_RANGE, range(20, 0, -1))
+    lat_zoom = np.interp(height, LON_ZOOM_RANGE, range(20, 0, -1))
+
+    return int(round(min(lon_zoom, lat_zoom)))
+
+
+def mercatorExtent(extent: Sequence[float]) -> List[float]:
+    """Project a lon/lat extent (x0, x1, y0, y1) to Web Mercator.
+    """
+
+    def x(lon):
+        return lon * ORIGIN / 180
+
+    def y(lat):
+        return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2)) * ORIGIN / math.pi
+
+    return [x(extent[0]), x(extent[1]), y(extent[2]), y(extent[3])]
+
+
+class TileCache:
+    """XYZ tiles on disk in a z/x/y.png folder, fetched from a tile server on a miss unless offline.
+
+    Parameters
+    ----------
+    directory : str
+        Cache folder, defaulting to mapcompare/temp/tiles/osm/.
+    url : str
+        Upstream URL template in the {z}/{x}/{y} format.
+    offline : bool
+        Never fetch, i.e. serve only tiles already cached.
+    connections : int
+        Downloads at a time, across all threads, e.g. of prefetch() or of the tile server's request handlers.
+    """
+
+    def __init__(self, directory: str=cachedir, url: str=OSM_URL, offline: bool=False, timeout: float=10,
+                 connections: int=OSM_CONNECTIONS):
+
+        self.directory = directory
+        self.url = url
+        self.offline = offline
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.fetched = 0
+        self._lock = threading.Lock()
+        self._downloads = threading.BoundedSemaphore(connections)
+        # requests.Session is not thread-safe, hence one per thread
+        self._local = threading.local()
+
+    @property
+    def _session(self) -> requests.Session:
+
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+            self._local.session.headers['User-Agent'] = USER_AGENT
+
+        return self._local.session
+
+    def path(self, z: int, x: int, y: int) -> str:
+
+        return os.path.join(self.directory, str(z), str(x), str(y) + '.png')
+
+    def fetch(self, z: int, x: int, y: int) -> bytes:
+        """Download a tile and store it, written to a temporary file first as other threads may be reading it.
+        """
+
+        with self._downloads:
+            response = self._session.get(self.url.format(z=z, x=x, y=y), timeout=self.timeout)
+        response.raise_for_status()
+
+        path = self.path(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp = path + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(response.content)
+        os.replace(tmp, path)
+
+        with self._lock:
+            self.fetched += 1
+
+        return response.content
+
+    def get(self, z: int, x: int, y: int) -> Optional[bytes]:
+        """Return a tile's PNG, from disk if cached, otherwise fetched unless offline.
+
+        Returns
+        ----------
+            The PNG bytes, or None if offline and not cached.
+        """
+
+        try:
+            with open(self.path(z, x, y), 'rb') as f:
+                content = f.read()
+            with self._lock:
+                self.hits += 1
+            return content
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+
+        if self.offline:
+            return None
+
+        return self.fetch(z, x, y)
+
+    def prefetch(self, extent: Sequence[float], zooms: Iterable[int], workers: int=2) -> int:
+        """Fetch all tiles of a Web Mercator extent (x0, x1, y0, y1) at the given zoom levels not yet cached.
+
+        workers defaults to the two concurrent downloads OSM's tile usage policy allows, which the cache's
+        connections bound regardless.
+
+        Returns
+        ----------
+            The number of tiles fetched.
+        """
+
+        tiles = [tile for z in zooms for tile in tilesInExtent(extent, z) if not os.path.exists(self.path(*tile))]
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda tile: self.fetch(*tile), tiles))
+
+        return len(tiles)
+
+    def report(self) -> str:
+
+        return "Tile cache: {} hits, {} misses, {} fetched".format(self.hits, self.misses, self.fetched)
+
+
+class _CacheHandler(BaseHTTPRequestHandler):
+    """Answer /z/x/y.png requests from a TileCache.
+    """
+
+    def __init__(self, *args, cache: TileCache, **kwargs):
+
+        self.cache = cache
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+
+        try:
+            z, x, y = (int(part) for part in self.path.split('?')[0].strip('/').replace('.png', '').split('/'))
+            content = self.cache.get(z, x, y)
+        except (ValueError, requests.RequestException):
+            content = None
+
+        if content is None:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', 'max-age=86400')
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serveCache(cache: TileCache=None, port: int=8003, lowercase: bool=False) -> str:
+    """Serve a tile cache on localhost from a daemon thread, once per process and port.
+
+    The server stops with the process, so use only for tiles fetched while rendering, i.e. by contextily, geoplot
+    and GeoViews with matplotlib, see basemapSource().
+
+    Parameters
+    ----------
+    cache : TileCache, optional
+        Defaults to the OSM tile cache in mapcompare/temp/tiles/osm/.
+    lowercase : bool
+        Return the URL template in the {z}/{x}/{y} format expected by contextily, geoplot and Plotly,
+        rather than the {Z}/{X}/{Y} format expected by Bokeh, GeoViews and HoloViews.
+
+    Returns
+    ----------
+        URL template of the local tile server.
+    """
+
+    cache = cache or TileCache()
+
+    serveHandler(lambda *args: _CacheHandler(*args, cache=cache), port)
+
+    url = 'http://localhost:' + str(port) + '/{Z}/{X}/{Y}.png'
+
+    return url.lower() if lowercase else url
+
+
+def serveForever(cache: TileCache=None, host: str='localhost', port: int=8002) -> None:
+    """Serve a tile cache until interrupted, as the standalone tile server of figures displayed in a browser.
+    """
+
+    cache = cache or TileCache()
+
+    with ThreadingHTTPServer((host, port), lambda *args: _CacheHandler(*args, cache=cache)) as server:
+        print("Serving {} on http://{}:{}/{{z}}/{{x}}/{{y}}.png".format(cache.directory, host, port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+    print(cache.report())
+
+
+def tileUrl(lowercase: bool=False) -> str:
+    """Return the URL template of the standalone tile server, warning if it does not answer.
+
+    Parameters
+    ----------
+    lowercase : bool
+        Return the {z}/{x}/{y} format expected by Plotly, rather than the {Z}/{X}/{Y} format expected by Bokeh,
+        GeoViews and HoloViews.
+    """
+
+    base = os.environ.get(envName('tile_url'), TILE_URL).rstrip('/')
+    location = urlparse(base)
+
+    try:
+        socket.create_connection((location.hostname, location.port or (443 if location.scheme == 'https' else 80)), timeout=1).close()
+    except OSError:
+        print("Tile server {} not reachable, start it with `mapcompare tiles` or set {}.".format(base, envName('tile_url')))
+
+    url = base + '/{Z}/{X}/{Y}.png'
+
+    return url.lower() if lowercase else url
+
+
+def basemapSource(kind: str, tile_cache: bool, **kwargs):
+    """Return the OSM basemap in the form a library expects, served from the tile cache if tile_cache is set.
+
+    Parameters
+    ----------
+    kind : {'contextily', 'geoplot', 'geoviews_matplotlib', 'bokeh', 'geoviews', 'holoviews', 'hvplot', 'plotly'}
+        The first three render tiles in-process, the others in the browser, see the module docstring.
+    tile_cache : bool
+        The tile_cache input of the script or app.
+    **kwargs
+        Passed to the GeoViews or HoloViews tile element, e.g. name='OSM'.
+    """
+
+    if kind == 'contextily':
+        import contextily as ctx
+        return serveCache(lowercase=True) if tile_cache else ctx.providers.OpenStreetMap.Mapnik
+
+    if kind == 'geoplot':
+        # keyword arguments of gplt.webmap(), defaulting to its own OSM provider
+        return {'provider': serveCache(lowercase=True)} if tile_cache else {}
+
+    if kind == 'geoviews_matplotlib':
+        import geoviews as gv
+        return gv.WMTS(serveCache(), **kwargs) if tile_cache else gv.tile_sources.OSM()
+
+    if kind == 'bokeh':
+        from bokeh.models import WMTSTileSource
+        from bokeh.tile_providers import OSM, get_provider
+        return WMTSTileSource(url=tileUrl()) if tile_cache else get_provider(OSM)
+
+    if kind == 'geoviews':
+        import geoviews as gv
+        return gv.WMTS(tileUrl(), **kwargs) if tile_cache else gv.tile_sources.OSM()
+
+    if kind == 'holoviews':
+        import holoviews as hv
+        return hv.Tiles(tileUrl(), **kwargs) if tile_cache else hv.element.tiles.OSM()
+
+    if kind == 'hvplot':
+        import holoviews as hv
+        return hv.Tiles(tileUrl(), **kwargs) if tile_cache else 'OSM'
+
+    if kind == 'plotly':
+        # keyword arguments of fig.update_layout()
+        if tile_cache:
+            return dict(mapbox_style='white-bg', mapbox_layers=[{'below': 'traces', 'sourcetype': 'raster', 'source': [tileUrl(lowercase=True)]}])
+        return dict(mapbox_style='open-street-map')
+
+    raise ValueError("Unknown basemap kind " + repr(kind))
@@ -0,0 +1,298 @@
+"""Render very large static figures, e.g. A0 posters at print resolution, tile by tile in a process pool.
+
+The combined extent is split into a grid of tiles. Each worker process culls the features of its tile via an STRtree,
+renders the tile with either matplotlib (flattened PathCollections, see flatpaths.py) or datashader, and writes the pixels
+straight into a memory-mapped output array. Memory use is therefore bounded by the tile size rather than the poster size.
+
+TIFF output is written in place: the memory-mapped array is the pixel data of an uncompressed RGBA TIFF.
+PNG output is stitched in a temporary .npy memmap first and then encoded row block by row block.
+"""
+
+import os
+import struct
+import zlib
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Sequence, Tuple
+import numpy as np
+from geopandas import GeoDataFrame
+
+# per-worker state, set once by _initWorker() to avoid pickling the layers with every tile
+_layers = None
+_trees = None
+_options = None
+
+
+def fitExtent(extent: Sequence[float], width_px: int, height_px: int) -> List[float]:
+    """Pad an extent in (x0, x1, y0, y1) order to the aspect ratio of the output, keeping it centred.
+    """
+
+    x0, x1, y0, y1 = extent
+
+    target = width_px / height_px
+
+    if (x1 - x0) / (y1 - y0) < target:
+        pad = ((y1 - y0) * target - (x1 - x0)) / 2
+        x0, x1 = x0 - pad, x1 + pad
+    else:
+        pad = ((x1 - x0) / target - (y1 - y0)) / 2
+        y0, y1 = y0 - pad, y1 + pad
+
+    return [x0, x1, y0, y1]
+
+
+def tileGrid(width_px: int, height_px: int, tile_px: int) -> List[Tuple[int, int, int, int]]:
+    """Return pixel windows (row0, row1, col0, col1) covering the output, row 0 being the top of the figure.
+    """
+
+    return [(r, min(r + tile_px, height_px), c, min(c + tile_px, width_px))
+            for r in range(0, height_px, tile_px) for c in range(0, width_px, tile_px)]
+
+
+def tileExtent(extent: Sequence[float], width_px: int, height_px: int, window: Tuple[int, int, int, int]) -> List[float]:
+    """Return the map extent (x0, x1, y0, y1) of a pixel window.
+    """
+
+    x0, x1, y0, y1 = extent
+    row0, row1, col0, col1 = window
+
+    xres = (x1 - x0) / width_px
+    yres = (y1 - y0) / height_px
+
+    return [x0 + col0 * xres, x0 + col1 * xres, y1 - row1 * yres, y1 - row0 * yres]
+
+
+def tiffMemmap(path: str, height: int, width: int) -> np.memmap:
+    """Create an uncompressed, single-strip RGBA TIFF and return its pixel data as a writable memmap.
+
+    Classic TIFF offsets are 32-bit, limiting output to 4GB (roughly 32,000 x 32,000 pixels).
+    """
+
+    nbytes = height * width * 4
+
+    if nbytes + 256 >= 2**32:
+        raise ValueError("Output exceeds the 4GB limit of classic TIFF, write PNG instead or reduce dpi.")
+
+    # (tag, type, count, value), type 3 = SHORT, type 4 = LONG
+    entries = [
+        (256, 4, 1, width),        # ImageWidth
+        (257, 4, 1, height),       # ImageLength
+        (258, 3, 4, 146),          # BitsPerSample, offset to 4 x 8
+        (259, 3, 1, 1),            # Compression: none
+        (262, 3, 1, 2),            # PhotometricInterpretation: RGB
+        (273, 4, 1, 256),          # StripOffsets
+        (277, 3, 1, 4),            # SamplesPerPixel
+        (278, 4, 1, height),       # RowsPerStrip
+        (279, 4, 1, nbytes),       # StripByteCounts
+        (284, 3, 1, 1),            # PlanarConfiguration: chunky
+        (338, 3, 1, 2),            # ExtraSamples: unassociated alpha
+    ]
+
+    header = b'II*\x00' + struct.pack('<I', 8)
+    ifd = struct.pack('<H', len(entries))
+    for tag, typ, count, value in entries:
+        packed = struct.pack('<HI', value, 0)[:4] if typ == 3 else struct.pack('<I', value)
+        ifd += struct.pack('<HHI', tag, typ, count) + packed
+    ifd += struct.pack('<I', 0)
+    bits = struct.pack('<4H', 8, 8, 8, 8)
+
+    with open(path, 'wb') as f:
+        f.write(header + ifd + bits)
+        f.write(b'\x00' * (256 - f.tell()))
+        f.truncate(256 + nbytes)
+
+    return np.memmap(path, dtype=np.uint8, mode='r+', offset=256, shape=(height, width, 4))
+
+
+def writePNG(path: str, arr: np.ndarray, block_rows: int=256) -> None:
+    """Encode an (height, width, 4) uint8 array, typically a memmap, as RGBA PNG in blocks of rows.
+    """
+
+    height, width = arr.shape[:2]
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    compressor = zlib.compressobj(6)
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+
+        for r in range(0, height, block_rows):
+            block = np.asarray(arr[r:r + block_rows])
+            # prefix every scanline with filter type 0 (none)
+            rows = np.concatenate([np.zeros((len(block), 1), dtype=np.uint8), block.reshape(len(block), -1)], axis=1)
+            data = compressor.compress(rows.tobytes())
+            if data:
+                f.write(chunk(b'IDAT', data))
+
+        f.write(chunk(b'IDAT', compressor.flush()))
+        f.write(chunk(b'IEND', b''))
+
+
+def _initWorker(layers: Sequence[GeoDataFrame], options: dict) -> None:
+    """Keep the layers and one STRtree per layer in the worker process.
+    """
+
+    global _layers, _trees, _options
+
+    from mapcompare.spatialindex import buildIndex
+
+    _layers = layers
+    _trees = [buildIndex(layer.geometry) for layer in layers]
+    _options = options
+
+
+def _mplTile(subsets: Sequence[GeoDataFrame], extent: Sequence[float], width: int, height: int) -> np.ndarray:
+    """Render a tile's features with matplotlib's Agg canvas, without axes or margins.
+    """
+
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from mapcompare.flatpaths import layers2collection
+
+    dpi = _options['dpi']
+
+    # half a pixel added as Agg truncates the figure size in pixels
+    fig = Figure(figsize=((width + 0.5) / dpi, (height + 0.5) / dpi), dpi=dpi, facecolor='white')
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    ax.set_xlim(extent[0], extent[1])
+    ax.set_ylim(extent[2], extent[3])
+
+    drawn = [(subset, style) for subset, style in zip(subsets, _options['styles']) if len(subset)]
+
+    if drawn:
+        ax.add_collection(layers2collection([d[0] for d in drawn], [d[1] for d in drawn]))
+
+    canvas.draw()
+
+    return np.asarray(canvas.buffer_rgba())[:height, :width]
+
+
+def _dsTile(subsets: Sequence[GeoDataFrame], extent: Sequence[float], width: int, height: int) -> np.ndarray:
+    """Render a tile's features with datashader, using the categorical aggregation of ds.py.
+    """
+
+    import pandas as pd
+    import datashader as ds
+    import datashader.transfer_functions as tf
+    from spatialpandas import GeoDataFrame as SpatialGeoDataFrame
+
+    color_key = _options['color_key']
+
+    frames = []
+    for subset, category in zip(subsets, color_key):
+        frame = subset[[subset.geometry.name]].copy()
+        frame['category'] = category
+        frames.append(frame)
+
+    merged = pd.concat(frames)
+
+    if not len(merged):
+        return np.full((height, width, 4), 255, dtype=np.uint8)
+
+    merged['category'] = pd.Categorical(merged['category'], categories=list(color_key))
+
+    canvas = ds.Canvas(plot_width=width, plot_height=height, x_range=(extent[0], extent[1]), y_range=(extent[2], extent[3]))
+    agg = canvas.polygons(SpatialGeoDataFrame(merged), merged.geometry.name, agg=ds.by('category', ds.any()))
+
+    # fixed linear span rather than per-tile histogram equalisation, otherwise alpha would differ across tile seams
+    img = tf.set_background(tf.shade(agg, color_key=color_key, how='linear', span=[0, 1]), 'white')
+
+    return np.asarray(img.to_pil().convert('RGBA'))
+
+
+def _renderTile(window: Tuple[int, int, int, int], extent: Sequence[float], path: str, offset: int, shape: Tuple[int, int, int]) -> Tuple[Tuple[int, int, int, int], int, float]:
+    """Cull, render and write a single tile into the shared output memmap.
+
+    Returns the tile's window, number of features drawn and render time in seconds.
+    """
+
+    from mapcompare.spatialindex import bboxQuery
+
+    start_time = time.perf_counter()
+
+    row0, row1, col0, col1 = window
+
+    subsets = [layer.iloc[bboxQuery(tree, extent)] for layer, tree in zip(_layers, _trees)]
+
+    if _options['backend'] == 'ds':
+        pixels = _dsTile(subsets, extent, col1 - col0, row1 - row0)
+    else:
+        pixels = _mplTile(subsets, extent, col1 - col0, row1 - row0)
+
+    out = np.memmap(path, dtype=np.uint8, mode='r+', offset=offset, shape=shape)
+    out[row0:row1, col0:col1] = pixels
+    out.flush()
+    del out
+
+    return window, sum(len(subset) for subset in subsets), time.perf_counter() - start_time
+
+
+def renderTiled(*gdfs: GeoDataFrame, extent: Sequence[float], width_px: int, height_px: int, outpath: str, backend: str='mpl',
+                styles: Sequence[dict]=None, color_key: dict=None, dpi: int=300, tile_px: int=2048, workers: int=None) -> List[float]:
+    """Render the layers into a single PNG or TIFF of width_px x height_px, tile by tile in a process pool.
+
+    Parameters
+    ----------
+    buildings_in, buildings_out, rivers : GeoDataframes
+        The feature sets to draw, in drawing order and in the same CRS as extent.
+    extent : sequence of float
+        Combined extent (x0, x1, y0, y1) as returned by getExtent(), padded to the output's aspect ratio.
+    width_px, height_px : int
+        Size of the output in pixels.
+    outpath : str
+        Output file ending in .png, .tif or .tiff.
+    backend : {'mpl', 'ds'}
+        Render tiles with matplotlib, using one style dict per layer, or datashader, using one color_key entry per layer.
+    styles : sequence of dict
+        Per-layer 'facecolor', 'edgecolor' and 'linewidth' for the matplotlib backend.
+    color_key : dict
+        Category to colour mapping for the datashader backend, in layer order.
+    dpi : int
+        Resolution used to scale matplotlib linewidths, which are given in points.
+    tile_px : int
+        Edge length of a tile in pixels.
+    workers : int, optional
+        Number of worker processes, defaults to the number of CPUs.
+
+    Returns
+    ----------
+        Render time per tile in seconds.
+    """
+
+    extent = fitExtent(extent, width_px, height_px)
+    shape = (height_px, width_px, 4)
+
+    if outpath.lower().endswith(('.tif', '.tiff')):
+        out = tiffMemmap(outpath, height_px, width_px)
+        mmpath = outpath
+    else:
+        mmpath = outpath + '.npy'
+        out = np.lib.format.open_memmap(mmpath, mode='w+', dtype=np.uint8, shape=shape)
+
+    offset = out.offset
+    del out
+
+    options = dict(backend=backend, styles=styles, color_key=color_key, dpi=dpi)
+    windows = tileGrid(width_px, height_px, tile_px)
+    tile_times = []
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker, initargs=(gdfs, options)) as pool:
+        futures = [pool.submit(_renderTile, window, tileExtent(extent, width_px, height_px, window), mmpath, offset, shape) for window in windows]
+
+        for i, future in enumerate(as_completed(futures)):
+            window, n_features, seconds = future.result()
+            tile_times.append(seconds)
+            print("Tile {} of {} at rows {}-{}, cols {}-{}: {} features in {:.2f} secs".format(i + 1, len(windows), *window, n_features, seconds))
+
+    if mmpath != outpath:
+        stitched = np.load(mmpath, mmap_mode='r')
+        writePNG(outpath, stitched)
+        del stitched # release the memmap before removing it, required on Windows
+        os.remove(mmpath)
+
+    return tile_times
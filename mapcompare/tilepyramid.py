@@ -0,0 +1,159 @@
+"""Precompute a datashader XYZ raster tile pyramid for the Bokeh Server apps.
+
+Tiles from a city-wide zoom level down to building level are rendered offline in a process pool with the apps'
+color_key and ds.by('category', ds.any()) aggregator, and written as z/x/y.png. The apps then serve the pyramid as a
+tile layer, so that panning and zooming is a static file fetch, and only datashade live beyond the pyramid's maximum zoom.
+The pyramid is fetched by the browser, hence served by a standalone server, e.g. `mapcompare tiles --pyramid dd --port 8001`.
+
+Each worker opens the spatially partitioned Parquet dataset (see spatialparquet.py) lazily,
+so that every tile only reads the partitions intersecting it.
+"""
+
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Sequence, Tuple
+from mapcompare.xyz import tileBounds, tilesInExtent, zoomLevel, TILE_PX
+
+# relative to the package, as the Bokeh Server apps are run from within apps/
+pyramiddir = os.path.join(os.path.dirname(__file__), 'temp', 'tiles', 'datashader') + os.sep
+
+# fixed linear span rather than per-tile histogram equalisation, otherwise alpha would differ across tile seams,
+# as datashade() parameters for the live layer beyond the pyramid, see liveBeyondZoom()
+SHADING = dict(normalization='linear', clims=(0, 1))
+
+# per-worker state, set once by _initWorker()
+_ddf = None
+_options = None
+
+
+def _initWorker(parquet_path: str, color_key: Dict[str, str], outdir: str) -> None:
+    """Open the Parquet dataset in the worker and aggregate its partitions single-threaded, parallelism being across tiles.
+    """
+
+    global _ddf, _options
+
+    import dask
+    from mapcompare.spatialparquet import readParquet
+
+    dask.config.set(scheduler='synchronous')
+
+    _ddf = readParquet(parquet_path, list(color_key))
+    _options = dict(color_key=color_key, outdir=outdir)
+
+
+def _renderTile(tile: Tuple[int, int, int]) -> bool:
+    """Render and write a single tile, skipping tiles without any features.
+
+    Returns whether a PNG was written.
+    """
+
+    import datashader as ds
+    import datashader.transfer_functions as tf
+
+    z, x, y = tile
+    x0, x1, y0, y1 = tileBounds(z, x, y)
+
+    canvas = ds.Canvas(plot_width=TILE_PX, plot_height=TILE_PX, x_range=(x0, x1), y_range=(y0, y1))
+    agg = canvas.polygons(_ddf, _ddf.geometry.name, agg=ds.by('category', ds.any()))
+
+    if not agg.values.any():
+        return False
+
+    img = tf.shade(agg, color_key=_options['color_key'], how=SHADING['normalization'], span=list(SHADING['clims']))
+
+    tiledir = _options['outdir'] + str(z) + os.sep + str(x) + os.sep
+    os.makedirs(tiledir, exist_ok=True)
+    img.to_pil().save(tiledir + str(y) + '.png')
+
+    return True
+
+
+def renderPyramid(parquet_path: str, extent: Sequence[float], color_key: Dict[str, str], min_zoom: int, max_zoom: int,
+                  outdir: str, workers: int=None) -> Dict[int, Tuple[int, int]]:
+    """Render all tiles intersecting the extent for zoom levels min_zoom to max_zoom inclusive.
+
+    Parameters
+    ----------
+    parquet_path : str
+        Web Mercator dataset written by spatialparquet.writeParquet().
+    extent : sequence of float
+        Web Mercator extent (x0, x1, y0, y1) to cover.
+    color_key : dict
+        Category to colour mapping as used by the apps.
+    min_zoom, max_zoom : int
+        Zoom level range, e.g. xyz.fittingZoom(extent) for a city-wide view to 16 for individual buildings.
+    outdir : str
+        Folder receiving z/x/y.png, see pyramiddir. Cleared first, so that no tiles of earlier datasets or zoom levels remain.
+    workers : int, optional
+        Number of worker processes, defaults to the number of CPUs.
+
+    Returns
+    ----------
+        Number of tiles intersecting the extent and number of tiles written, by zoom level.
+    """
+
+    counts = {}
+
+    if os.path.exists(outdir):
+        shutil.rmtree(outdir)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker, initargs=(parquet_path, color_key, outdir)) as pool:
+        for z in range(min_zoom, max_zoom + 1):
+            tiles = tilesInExtent(extent, z)
+            written = sum(pool.map(_renderTile, tiles, chunksize=max(1, len(tiles) // (4 * (workers or os.cpu_count() or 1)))))
+            counts[z] = (len(tiles), written)
+            print("Zoom level {}: {} of {} tiles written".format(z, written, len(tiles)))
+
+    return counts
+
+
+def liveBeyondZoom(element, max_zoom: int, rgb: Callable, cache=None, **kwargs):
+    """Datashade a HoloViews/GeoViews element on pan and zoom only beyond max_zoom, where the precomputed pyramid ends.
+
+    Shaded like the pyramid's tiles, see SHADING, rather than with datashade()'s default histogram equalisation.
+
+    Parameters
+    ----------
+    element : Polygons
+        HoloViews or GeoViews element to datashade.
+    max_zoom : int
+        Maximum zoom level of the pyramid served underneath.
+    rgb : callable
+        RGB element class matching the datashaded output, e.g. hv.RGB or partial(gv.RGB, crs=ccrs.GOOGLE_MERCATOR),
+        used for the transparent placeholder as a DynamicMap must always return the same element type. Before the
+        first range event, the placeholder spans the element's extent, so that the initial view is framed on the data.
+    cache : ViewCache, optional
+        Render viewports through a view cache shared across sessions, see viewcache.py.
+    **kwargs
+        Passed to datashade(), e.g. color_key and aggregator.
+
+    Returns
+    ----------
+        DynamicMap of RGB elements.
+    """
+
+    import numpy as np
+    import holoviews as hv
+    from holoviews.streams import RangeXY, PlotSize
+    from holoviews.operation.datashader import datashade
+
+    kwargs = dict(SHADING, **kwargs)
+
+    def render(x_range, y_range, width, height):
+        return datashade(element, dynamic=False, x_range=x_range, y_range=y_range, width=width, height=height, **kwargs)
+
+    if cache is not None:
+        render = cache.cached(render, kwargs.get('color_key', {}))
+
+    (x0, x1), (y0, y1) = element.range(0), element.range(1)
+
+    def shade(x_range, y_range, width, height):
+
+        if x_range is None or y_range is None or not width or not height or zoomLevel(x_range, width) <= max_zoom:
+            bounds = (x0, y0, x1, y1) if x_range is None or y_range is None else (x_range[0], y_range[0], x_range[1], y_range[1])
+            return rgb(np.zeros((2, 2, 4), dtype=np.uint8), bounds=bounds)
+
+        return render(x_range, y_range, width, height)
+
+    return hv.DynamicMap(shade, streams=[RangeXY(), PlotSize()])
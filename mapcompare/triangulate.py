@@ -0,0 +1,371 @@
+"""Triangulate the polygon layers into triangle meshes for WebGL renderers, by ear clipping compiled with numba.
+
+Bokeh's WebGL backend accelerates lines and markers but not the Patches or MultiPolygons glyphs, and neither draws
+triangle meshes. Plotly's Mesh3d trace does, via WebGL, given vertex arrays and triangle indices. triangulate()
+returns these for a RaggedGeometry layer:
+    - vertices are the layer's coordinates with exterior rings counter-clockwise and interior rings clockwise, see
+      flatpaths.orient(), i.e. no vertex is copied
+    - holes are bridged into their exterior ring, by the ray cast from each hole's leftmost vertex as in earcut,
+      before the merged ring is clipped ear by ear
+    - triangles are int32 indices into the vertices, with per-feature offsets into the triangles
+
+Ear clipping is O(n^2) per polygon in the worst case, which the buildings' few vertices each keep negligible, while
+large river polygons dominate. cachedTriangles() therefore caches the triangles per dataset in memory and in
+mapcompare/temp/triangles/, and benchmarkTriangulation() reports time and memory per layer.
+"""
+
+import os
+import time
+from typing import Dict, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from numba import njit
+from mapcompare.flatpaths import orient
+from mapcompare.ragged import RaggedGeometry
+
+cachedir = 'mapcompare/temp/triangles/'
+
+# triangles by dataset key, see cachedTriangles()
+_triangle_cache = {}
+
+
+@njit(cache=True, nogil=True)
+def _cross(ax, ay, bx, by, cx, cy):
+
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+
+@njit(cache=True, nogil=True)
+def _inTriangle(ax, ay, bx, by, cx, cy, px, py):
+    """Whether p lies within or on triangle abc, of either orientation.
+    """
+
+    d1 = _cross(ax, ay, bx, by, px, py)
+    d2 = _cross(bx, by, cx, cy, px, py)
+    d3 = _cross(cx, cy, ax, ay, px, py)
+
+    return not ((d1 < 0 or d2 < 0 or d3 < 0) and (d1 > 0 or d2 > 0 or d3 > 0))
+
+
+@njit(cache=True, nogil=True)
+def _link(node_vertex, nxt, prv, k, start, n):
+    """Link the n vertices from start onwards into a circular list of nodes from node k onwards.
+    """
+
+    for i in range(n):
+        node_vertex[k + i] = start + i
+        nxt[k + i] = k + (i + 1) % n
+        prv[k + i] = k + (i + n - 1) % n
+
+
+@njit(cache=True, nogil=True)
+def _locallyInside(coords, node_vertex, nxt, prv, a, bx, by):
+    """Whether the direction from node a to (bx, by) points into the counter-clockwise ring at a.
+    """
+
+    ax, ay = coords[node_vertex[a], 0], coords[node_vertex[a], 1]
+    px, py = coords[node_vertex[prv[a]], 0], coords[node_vertex[prv[a]], 1]
+    nx, ny = coords[node_vertex[nxt[a]], 0], coords[node_vertex[nxt[a]], 1]
+
+    if _cross(px, py, ax, ay, nx, ny) >= 0:
+        return _cross(ax, ay, nx, ny, bx, by) >= 0 and _cross(px, py, ax, ay, bx, by) >= 0
+
+    return _cross(ax, ay, nx, ny, bx, by) >= 0 or _cross(px, py, ax, ay, bx, by) >= 0
+
+
+@njit(cache=True, nogil=True)
+def _findBridge(coords, node_vertex, nxt, prv, hole, outer):
+    """Return the node of the outer ring to bridge a hole's leftmost node to, or -1.
+
+    Casts a ray to the left of the hole node, takes the nearest edge crossed and, of the vertices within the triangle
+    spanned by the hole node, the crossing and that edge's left end, the one at the smallest angle to the ray. Of
+    several nodes at that vertex, e.g. the ends of earlier bridges, the one whose interior faces the hole is returned.
+    """
+
+    hx, hy = coords[node_vertex[hole], 0], coords[node_vertex[hole], 1]
+    qx = -np.inf
+    m = -1
+
+    p = outer
+    while True:
+        px, py = coords[node_vertex[p], 0], coords[node_vertex[p], 1]
+        nx, ny = coords[node_vertex[nxt[p]], 0], coords[node_vertex[nxt[p]], 1]
+
+        if ny != py and min(py, ny) <= hy <= max(py, ny):
+            x = px + (hy - py) * (nx - px) / (ny - py)
+            if qx < x <= hx:
+                qx = x
+                m = p if px < nx else nxt[p]
+                if x == hx:
+                    break
+
+        p = nxt[p]
+        if p == outer:
+            break
+
+    if m < 0:
+        return -1
+
+    mx, my = coords[node_vertex[m], 0], coords[node_vertex[m], 1]
+    tan_min = np.inf
+    stop = m
+    p = m
+
+    while True:
+        px, py = coords[node_vertex[p], 0], coords[node_vertex[p], 1]
+
+        if hx >= px >= mx and hx != px and _inTriangle(hx, hy, qx, hy, mx, my, px, py):
+            tan = abs(hy - py) / (hx - px)
+            if tan < tan_min or (tan == tan_min and px > coords[node_vertex[m], 0]):
+                m = p
+                tan_min = tan
+
+        p = nxt[p]
+        if p == stop:
+            break
+
+    mx, my = coords[node_vertex[m], 0], coords[node_vertex[m], 1]
+    p = m
+
+    while True:
+        if (coords[node_vertex[p], 0] == mx and coords[node_vertex[p], 1] == my
+                and _locallyInside(coords, node_vertex, nxt, prv, p, hx, hy)):
+            return p
+
+        p = nxt[p]
+        if p == m:
+            break
+
+    return m
+
+
+@njit(cache=True, nogil=True)
+def _isEar(coords, node_vertex, nxt, a, b, c):
+
+    ax, ay = coords[node_vertex[a], 0], coords[node_vertex[a], 1]
+    bx, by = coords[node_vertex[b], 0], coords[node_vertex[b], 1]
+    cx, cy = coords[node_vertex[c], 0], coords[node_vertex[c], 1]
+
+    # reflex or collinear
+    if _cross(ax, ay, bx, by, cx, cy) <= 0:
+        return False
+
+    x0, x1 = min(ax, bx, cx), max(ax, bx, cx)
+    y0, y1 = min(ay, by, cy), max(ay, by, cy)
+
+    p = nxt[c]
+    while p != a:
+        px, py = coords[node_vertex[p], 0], coords[node_vertex[p], 1]
+
+        # duplicates of a, b or c, as left by bridges, do not count
+        if (x0 <= px <= x1 and y0 <= py <= y1 and not (px == ax and py == ay) and not (px == bx and py == by)
+                and not (px == cx and py == cy) and _inTriangle(ax, ay, bx, by, cx, cy, px, py)):
+            return False
+
+        p = nxt[p]
+
+    return True
+
+
+@njit(cache=True, nogil=True)
+def _earclip(coords, node_vertex, nxt, prv, ear, count, triangles, t):
+    """Clip the counter-clockwise ring of count nodes from ear onwards into triangles from t onwards, returning the next t.
+
+    If no ear is found within a full pass, e.g. for self-intersecting rings, the current vertex is clipped regardless.
+    """
+
+    fails = 0
+
+    while count > 3:
+        a, c = prv[ear], nxt[ear]
+
+        if fails >= count or _isEar(coords, node_vertex, nxt, a, ear, c):
+            triangles[t, 0], triangles[t, 1], triangles[t, 2] = node_vertex[a], node_vertex[ear], node_vertex[c]
+            t += 1
+            nxt[a], prv[c] = c, a
+            count -= 1
+            ear = c
+            fails = 0
+        else:
+            ear = c
+            fails += 1
+
+    triangles[t, 0], triangles[t, 1], triangles[t, 2] = node_vertex[prv[ear]], node_vertex[ear], node_vertex[nxt[ear]]
+
+    return t + 1
+
+
+@njit(cache=True, nogil=True)
+def _triangulatePart(coords, ring_offsets, r0, r1, node_vertex, nxt, prv, triangles, t):
+    """Triangulate a polygon of rings r0 (exterior) to r1 (exclusive), returning the next t.
+    """
+
+    # closed rings, the closing vertex left out
+    n = ring_offsets[r0 + 1] - ring_offsets[r0] - 1
+    if n < 3:
+        return t
+
+    _link(node_vertex, nxt, prv, 0, ring_offsets[r0], n)
+    k = n
+    count = n
+
+    holes = r1 - r0 - 1
+    leftmost = np.full(holes, -1, dtype=np.int64)
+    left_x = np.full(holes, np.inf)
+
+    for h in range(holes):
+        start = ring_offsets[r0 + 1 + h]
+        m = ring_offsets[r0 + 2 + h] - start - 1
+        if m < 3:
+            continue
+
+        _link(node_vertex, nxt, prv, k, start, m)
+        leftmost[h] = k
+        for i in range(k, k + m):
+            if coords[node_vertex[i], 0] < coords[node_vertex[leftmost[h]], 0]:
+                leftmost[h] = i
+        left_x[h] = coords[node_vertex[leftmost[h]], 0]
+        k += m
+
+    for h in np.argsort(left_x):
+        if leftmost[h] < 0:
+            continue
+
+        b = leftmost[h]
+        a = _findBridge(coords, node_vertex, nxt, prv, b, 0)
+        if a < 0:
+            continue
+
+        # splice the hole in via a bridge there and back: a -> b ... hole ... b2 -> a2
+        m = ring_offsets[r0 + 2 + h] - ring_offsets[r0 + 1 + h] - 1
+        a2, b2 = k, k + 1
+        node_vertex[a2], node_vertex[b2] = node_vertex[a], node_vertex[b]
+        an, bp = nxt[a], prv[b]
+        nxt[a], prv[b] = b, a
+        nxt[a2], prv[an] = an, a2
+        nxt[b2], prv[a2] = a2, b2
+        nxt[bp], prv[b2] = b2, bp
+        k += 2
+        count += m + 2
+
+    return _earclip(coords, node_vertex, nxt, prv, 0, count, triangles, t)
+
+
+@njit(cache=True, nogil=True)
+def _triangulateLayer(coords, ring_offsets, part_offsets):
+
+    n_parts = len(part_offsets) - 1
+    capacity = 0
+    max_nodes = 0
+
+    for p in range(n_parts):
+        nodes = 2 * (part_offsets[p + 1] - part_offsets[p] - 1)
+        for r in range(part_offsets[p], part_offsets[p + 1]):
+            nodes += ring_offsets[r + 1] - ring_offsets[r] - 1
+        capacity += max(nodes - 2, 0)
+        max_nodes = max(max_nodes, nodes)
+
+    triangles = np.empty((capacity, 3), dtype=np.int32)
+    part_triangles = np.empty(n_parts + 1, dtype=np.int64)
+    node_vertex = np.empty(max_nodes, dtype=np.int64)
+    nxt = np.empty(max_nodes, dtype=np.int64)
+    prv = np.empty(max_nodes, dtype=np.int64)
+
+    t = 0
+    for p in range(n_parts):
+        part_triangles[p] = t
+        t = _triangulatePart(coords, ring_offsets, part_offsets[p], part_offsets[p + 1], node_vertex, nxt, prv, triangles, t)
+    part_triangles[n_parts] = t
+
+    return triangles[:t], part_triangles
+
+
+def triangulate(layer: RaggedGeometry) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return a layer's oriented vertices, its triangles as (m, 3) int32 indices into them, and per-feature triangle offsets.
+    """
+
+    vertices = orient(layer.coords, layer.ring_offsets, layer.part_offsets)
+    triangles, part_triangles = _triangulateLayer(vertices, layer.ring_offsets, layer.part_offsets)
+
+    return vertices, triangles, part_triangles[layer.geom_offsets]
+
+
+def cachedTriangles(layer: RaggedGeometry, key: str, cachedir: str=cachedir) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return triangulate() of a layer, cached by dataset key in memory and as a .npz in cachedir.
+
+    Parameters
+    ----------
+    layer : RaggedGeometry
+    key : str
+        Identifies the dataset and layer, e.g. 'dd buildings_in'. A hash of the coordinates and offsets is compared
+        to catch changed data.
+    """
+
+    fingerprint = layer.fingerprint()
+
+    if key in _triangle_cache and _triangle_cache[key][0] == fingerprint:
+        return _triangle_cache[key][1]
+
+    cachepath = cachedir + key + '.npz'
+
+    if os.path.exists(cachepath):
+        with np.load(cachepath) as npz:
+            if str(npz['fingerprint']) == fingerprint:
+                arrays = (npz['vertices'], npz['triangles'], npz['offsets'])
+                _triangle_cache[key] = (fingerprint, arrays)
+                return arrays
+
+    arrays = triangulate(layer)
+
+    if not os.path.exists(cachedir):
+        os.makedirs(cachedir)
+
+    np.savez(cachepath, fingerprint=fingerprint, vertices=arrays[0], triangles=arrays[1], offsets=arrays[2])
+
+    _triangle_cache[key] = (fingerprint, arrays)
+
+    return arrays
+
+
+def outlines(layer: RaggedGeometry) -> Tuple[np.ndarray, np.ndarray]:
+    """Return all rings of a layer as one x and one y array, rings separated by NaN, to be drawn as a single line trace.
+    """
+
+    coords = np.insert(layer.coords, layer.ring_offsets[1:-1], np.nan, axis=0)
+
+    return coords[:, 0], coords[:, 1]
+
+
+def benchmarkTriangulation(layers: Dict[str, RaggedGeometry]) -> pd.DataFrame:
+    """Time the triangulation of each layer, without cache, and report its memory.
+
+    The first layer's time includes numba's compilation, unless loaded from numba's cache. Peak RSS growth is
+    that of this process, i.e. only grows beyond the peak of earlier layers, and NaN where the resource module is
+    missing, e.g. on Windows.
+
+    Returns
+    ----------
+        One row per layer with vertices, triangles, secs, the triangles' MB and the growth in peak RSS in MB.
+    """
+
+    try:
+        import resource
+    except ImportError:
+        resource = None
+
+    def peakRss():
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else np.nan
+
+    rows = []
+
+    for name, layer in layers.items():
+        rss_before = peakRss()
+        start_time = time.perf_counter()
+        vertices, triangles, offsets = triangulate(layer)
+        run_time = time.perf_counter() - start_time
+        rss_after = peakRss()
+
+        rows.append(dict(layer=name, features=len(layer), vertices=len(vertices), triangles=len(triangles), secs=run_time,
+                         triangles_mb=(triangles.nbytes + offsets.nbytes) / 2**20, peak_rss_growth_mb=(rss_after - rss_before) / 2**10))
+
+    return pd.DataFrame(rows)
@@ -0,0 +1,241 @@
+"""Cross-session LRU cache of datashaded viewports for the Bokeh Server apps.
+
+Most sessions of a deployed app look at the same city-wide default view and a few districts, yet each session recomputes
+identical aggregates. Viewports are therefore snapped to a zoom-dependent grid, so that nearly identical ranges share a key,
+and the shaded images are kept in a size-bounded LRU cache shared by all sessions of the server process.
+Entries evicted from memory can optionally be spilled to disk and are loaded from there on the next hit.
+
+Keys include the database and a fingerprint of the data, see frameFingerprint(), and spilled entries are kept in a
+folder per dataset, so that neither the process-wide cache nor the spill folder serve images of other or outdated data.
+"""
+
+import os
+import math
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple
+import numpy as np
+import pandas as pd
+
+# by database, shared by all sessions, as the app script is executed again for every session
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def snapRange(lo: float, hi: float, quantum: int=256) -> Tuple[float, float]:
+    """Snap a range to the nearest points of a grid whose step is a power of two fraction of its span, about 1/quantum of it.
+
+    As the step only changes with the zoom level, the same view panned or zoomed by less than half a step yields the same range.
+    The snapped range is rendered, so a cached image is off by at most half a step, i.e. a sub-pixel shift at typical plot sizes.
+    """
+
+    step = 2.0**math.floor(math.log2((hi - lo) / quantum))
+
+    return round(lo / step) * step, round(hi / step) * step
+
+
+def viewKey(dataset: str, x_range, y_range, width: int, height: int, color_key: Dict[str, str], quantum: int=256) -> tuple:
+    """Return the dataset, snapped ranges, plot size and colour key identifying a shaded viewport.
+    """
+
+    return (dataset, snapRange(*x_range, quantum=quantum), snapRange(*y_range, quantum=quantum), int(width), int(height),
+            tuple(sorted(color_key.items())))
+
+
+def frameFingerprint(merged) -> str:
+    """Return a hash of the apps' merged frame, changing with its geometries or categories.
+
+    Parameters
+    ----------
+    merged : SpatialPandas or Dask SpatialPandas GeoDataFrame
+        As produced by the apps' prepGDFs() or loadParquet().
+        A Dask frame is not read, so its fingerprint is taken from the bounds of its partitions.
+    """
+
+    digest = hashlib.blake2b(digest_size=16)
+
+    if hasattr(merged, 'compute'):
+        digest.update(pd.util.hash_pandas_object(merged.partition_bounds).values.tobytes())
+        return digest.hexdigest()
+
+    geometry = merged.geometry.values
+    digest.update(np.ascontiguousarray(geometry.buffer_values).tobytes())
+
+    for offsets in geometry.buffer_offsets:
+        digest.update(np.ascontiguousarray(offsets).tobytes())
+
+    digest.update(pd.util.hash_pandas_object(merged['category'], index=False).values.tobytes())
+
+    return digest.hexdigest()
+
+
+def imageBytes(image) -> int:
+    """Return the size of a shaded image's RGB(A) arrays, e.g. of an hv.RGB element backed by an xarray Dataset.
+    """
+
+    data = getattr(image, 'data', image)
+
+    if hasattr(data, 'data_vars'):
+        return int(sum(data[name].nbytes for name in data.data_vars))
+
+    return int(np.asarray(data).nbytes)
+
+
+class ViewCache:
+    """Thread-safe LRU cache of shaded images, bounded by their total size in bytes.
+
+    Parameters
+    ----------
+    db_name : str
+        Database the images are rendered from.
+    fingerprint : str
+        Hash of the rendered data, e.g. frameFingerprint() of the apps' merged frame.
+    maxbytes : int
+        Memory budget for cached images.
+    spilldir : str, optional
+        Folder receiving entries evicted from memory in a subfolder per dataset, keyed by a hash of the view key. No spilling if None.
+    """
+
+    def __init__(self, db_name: str, fingerprint: str, maxbytes: int=512 * 2**20, spilldir: str=None):
+
+        self.fingerprint = fingerprint
+        self.dataset = db_name + '-' + fingerprint
+        self.maxbytes = maxbytes
+        self.spilldir = None if spilldir is None else os.path.join(spilldir, self.dataset)
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.spills = 0
+
+        if self.spilldir is not None:
+            os.makedirs(self.spilldir, exist_ok=True)
+
+    def _spillPath(self, key: tuple) -> str:
+        return os.path.join(self.spilldir, hashlib.md5(repr(key).encode()).hexdigest() + '.pkl')
+
+    def get(self, key: tuple):
+        """Return the cached image for a key or None, counting hits and misses.
+        """
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+
+        if self.spilldir is not None and os.path.exists(self._spillPath(key)):
+            with open(self._spillPath(key), 'rb') as f:
+                image = pickle.load(f)
+            with self.lock:
+                self.disk_hits += 1
+            self.put(key, image)
+            return image
+
+        with self.lock:
+            self.misses += 1
+
+        return None
+
+    def put(self, key: tuple, image) -> None:
+        """Store an image, evicting (and optionally spilling) the least recently used ones beyond maxbytes.
+        """
+
+        nbytes = imageBytes(image)
+        evicted = []
+
+        with self.lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key)[1]
+
+            self.entries[key] = (image, nbytes)
+            self.nbytes += nbytes
+
+            while self.nbytes > self.maxbytes and len(self.entries) > 1:
+                old_key, (old_image, old_nbytes) = self.entries.popitem(last=False)
+                self.nbytes -= old_nbytes
+                evicted.append((old_key, old_image))
+
+        if self.spilldir is not None:
+            for old_key, old_image in evicted:
+                with open(self._spillPath(old_key), 'wb') as f:
+                    pickle.dump(old_image, f, protocol=pickle.HIGHEST_PROTOCOL)
+                with self.lock:
+                    self.spills += 1
+
+    def cached(self, render: Callable, color_key: Dict[str, str], quantum: int=256) -> Callable:
+        """Wrap a render(x_range, y_range, width, height) function, rendering snapped viewports through the cache.
+        """
+
+        def wrapper(x_range, y_range, width, height):
+
+            key = viewKey(self.dataset, x_range, y_range, width, height, color_key, quantum=quantum)
+            image = self.get(key)
+
+            if image is None:
+                image = render(key[1], key[2], width, height)
+                self.put(key, image)
+
+            return image
+
+        return wrapper
+
+    def report(self) -> str:
+        """Return a one-line summary of the hit/miss counters and memory use.
+        """
+
+        return "View cache: {} hits, {} disk hits, {} misses, {} spills, {} entries, {:.1f} MB".format(
+            self.hits, self.disk_hits, self.misses, self.spills, len(self.entries), self.nbytes / 2**20)
+
+
+def sharedCache(db_name: str, fingerprint: str, maxbytes: int=512 * 2**20, spilldir: str=None) -> ViewCache:
+    """Return the process-wide view cache of a database, created on first use and replaced once its data changes.
+    """
+
+    with _caches_lock:
+        cache = _caches.get(db_name)
+
+        if cache is None or cache.fingerprint != fingerprint:
+            cache = _caches[db_name] = ViewCache(db_name, fingerprint, maxbytes, spilldir)
+
+    return cache
+
+
+def cachedShade(element, cache: ViewCache, **kwargs):
+    """Datashade a HoloViews/GeoViews element through a view cache, in place of datashade(element).
+
+    Parameters
+    ----------
+    element : Polygons
+        HoloViews or GeoViews element to datashade.
+    cache : ViewCache
+        Typically sharedCache(), so that all sessions showing the same data share it.
+    **kwargs
+        Passed to datashade(), e.g. color_key and aggregator. color_key is part of the cache key.
+
+    Returns
+    ----------
+        DynamicMap of RGB elements.
+    """
+
+    import holoviews as hv
+    from holoviews.streams import RangeXY, PlotSize
+    from holoviews.operation.datashader import datashade
+
+    def render(x_range, y_range, width, height):
+        return datashade(element, dynamic=False, x_range=x_range, y_range=y_range, width=width, height=height, **kwargs)
+
+    shade = cache.cached(render, kwargs.get('color_key', {}))
+
+    def show(x_range, y_range, width, height):
+
+        if x_range is None or y_range is None or not width or not height:
+            return render(x_range, y_range, width or 400, height or 400)
+
+        return shade(x_range, y_range, width, height)
+
+    return hv.DynamicMap(show, streams=[RangeXY(), PlotSize()])
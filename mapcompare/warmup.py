@@ -0,0 +1,129 @@
+"""Warmup of datashader's numba kernels at startup.
+
+datashader compiles its polygon rasterisation and aggregation kernels with numba on the first Canvas.polygons() call of
+every process, which to_cProfile() shows as the slow first run of ds.py. Every fresh Bokeh Server process and every
+ds.py run pays for it again. warmup() therefore rasterises a tiny synthetic frame with the same column types, categories
+and ds.by('category', ds.any()) aggregation as the scripts, so that the first real render finds all kernels compiled.
+
+numba's on-disk cache is not used: most of datashader's kernels are generated at runtime from source strings, which numba
+cannot cache, and enabling it for the others only took the first render from about 3.7 to 3.5 secs with 3 kernels written.
+
+compareFirstRun() reports the first render's latency in fresh processes without and with warmup(), e.g. via
+`mapcompare warmup --repeat 3`.
+"""
+
+import sys
+import json
+import time
+import argparse
+import subprocess
+from typing import Dict, Sequence
+import pandas as pd
+
+_warmed = set()
+
+
+def syntheticFrame(categories: Sequence[str], geometry: str='geom'):
+    """Return a spatialpandas GeoDataFrame of two MultiPolygons per category, one with a hole, in a 'category' column.
+    """
+
+    import geopandas as gpd
+    from shapely.geometry import MultiPolygon, Polygon
+    from spatialpandas import GeoDataFrame
+
+    square = Polygon([(0, 0), (1, 0), (1, 1), (0, 1)])
+    holed = Polygon([(0, 0), (2, 0), (2, 2), (0, 2)], [[(0.5, 0.5), (1.5, 0.5), (1.5, 1.5), (0.5, 1.5)]])
+
+    geoms, labels = [], []
+    for category in categories:
+        geoms += [MultiPolygon([square]), MultiPolygon([holed, Polygon([(3, 3), (4, 3), (4, 4)])])]
+        labels += [category, category]
+
+    gdf = gpd.GeoDataFrame({'category': pd.Categorical(labels, categories=categories)}, geometry=gpd.GeoSeries(geoms))
+
+    return GeoDataFrame(gdf.rename_geometry(geometry))
+
+
+def warmup(categories: Sequence[str], geometry: str='geom') -> float:
+    """Compile the kernels of Canvas.polygons() with ds.by('category', ds.any()) and of tf.shade(), once per process.
+
+    Parameters
+    ----------
+    categories : sequence of str
+        The categories of the scripts' 'category' column, in order.
+    geometry : str
+        Name of the geometry column.
+
+    Returns
+    ----------
+        Secs spent, 0 if this process has been warmed up for the categories already.
+    """
+
+    key = (tuple(categories), geometry)
+
+    if key in _warmed:
+        return 0.
+
+    start_time = time.perf_counter()
+    _rasterise(categories, geometry)
+    _warmed.add(key)
+
+    return time.perf_counter() - start_time
+
+
+def _rasterise(categories: Sequence[str], geometry: str='geom') -> None:
+
+    import datashader as ds
+    import datashader.transfer_functions as tf
+
+    frame = syntheticFrame(categories, geometry)
+    canvas = ds.Canvas(plot_width=16, plot_height=16, x_range=(0., 4.), y_range=(0., 4.))
+    agg = canvas.polygons(frame, geometry, agg=ds.by('category', ds.any()))
+    tf.shade(agg, color_key={category: 'red' for category in categories})
+
+
+def _probe(warm: bool) -> Dict[str, float]:
+    """Time importing datashader, warmup() if warm, and the first and second render within this process.
+    """
+
+    start_time = time.perf_counter()
+    import datashader
+    import spatialpandas
+    import_time = time.perf_counter() - start_time
+
+    categories = ['Within_500m', 'Outside_500m', 'River/stream']
+    warmup_time = warmup(categories) if warm else 0.
+
+    renders = []
+    for _ in range(2):
+        start_time = time.perf_counter()
+        _rasterise(categories)
+        renders.append(time.perf_counter() - start_time)
+
+    return {'import': import_time, 'warmup': warmup_time, 'first': renders[0], 'second': renders[1]}
+
+
+def compareFirstRun(repeat: int=3) -> pd.DataFrame:
+    """Time the first render in fresh processes without and with warmup().
+
+    Returns
+    ----------
+        One row per process with import, warmup, first and second render secs.
+    """
+
+    def probe(warm):
+        cmd = [sys.executable, '-m', 'mapcompare.warmup'] + (['--warm'] if warm else [])
+        output = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    rows = [dict(warm=warm, sample=i, **probe(warm)) for warm in (False, True) for i in range(repeat)]
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+
+    p = argparse.ArgumentParser(description="Print the import, warmup, first and second render times of this process as JSON.")
+    p.add_argument('--warm', action='store_true', help="call warmup() ahead of the first render")
+
+    print(json.dumps(_probe(p.parse_args().warm)))
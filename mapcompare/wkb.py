@@ -0,0 +1,122 @@
+"""Decode the WKB of a layer's MultiPolygons straight into the ragged arrays of a RaggedGeometry, see ragged.py.
+
+The WKB values of all features are concatenated into one byte buffer and walked twice with numba: once to count the
+parts, rings and vertices, and once to fill the offset arrays and copy the coordinates, i.e. without any shapely
+object per feature. Only little-endian (NDR) 2D MultiPolygons are supported, as returned by
+ST_AsBinary(ST_Multi(geom), 'NDR') for polygon layers.
+"""
+
+from typing import Sequence, Tuple
+import numpy as np
+from numba import njit
+
+MULTIPOLYGON = 6
+POLYGON = 3
+
+
+@njit(cache=True, nogil=True)
+def _uint32(buf, i):
+
+    return np.int64(buf[i]) | (np.int64(buf[i + 1]) << 8) | (np.int64(buf[i + 2]) << 16) | (np.int64(buf[i + 3]) << 24)
+
+
+@njit(cache=True, nogil=True)
+def _header(buf, i, geom_type):
+    """Check the byte order and type of the (sub)geometry at i, returning the position of its element count.
+    """
+
+    if buf[i] != 1:
+        raise ValueError("Expected little-endian (NDR) WKB")
+    if _uint32(buf, i + 1) != geom_type:
+        raise ValueError("Expected 2D MultiPolygon WKB")
+
+    return i + 5
+
+
+@njit(cache=True, nogil=True)
+def _count(buf, starts):
+    """Return the total number of parts, rings and vertices.
+    """
+
+    n_parts = n_rings = n_vertices = 0
+
+    for f in range(len(starts) - 1):
+        i = _header(buf, starts[f], MULTIPOLYGON)
+        parts = _uint32(buf, i)
+        i += 4
+        n_parts += parts
+
+        for _ in range(parts):
+            i = _header(buf, i, POLYGON)
+            rings = _uint32(buf, i)
+            i += 4
+            n_rings += rings
+
+            for _ in range(rings):
+                vertices = _uint32(buf, i)
+                i += 4 + 16 * vertices
+                n_vertices += vertices
+
+    return n_parts, n_rings, n_vertices
+
+
+@njit(cache=True, nogil=True)
+def _fill(buf, starts, coord_bytes, ring_offsets, part_offsets, geom_offsets):
+    """Fill the offset arrays and copy the coordinates' bytes into coord_bytes, a uint8 view of the coordinate array.
+    """
+
+    part = ring = vertex = 0
+
+    for f in range(len(starts) - 1):
+        i = _header(buf, starts[f], MULTIPOLYGON)
+        parts = _uint32(buf, i)
+        i += 4
+
+        for _ in range(parts):
+            i = _header(buf, i, POLYGON)
+            rings = _uint32(buf, i)
+            i += 4
+
+            for _ in range(rings):
+                vertices = _uint32(buf, i)
+                i += 4
+                coord_bytes[16 * vertex:16 * (vertex + vertices)] = buf[i:i + 16 * vertices]
+                i += 16 * vertices
+                vertex += vertices
+                ring += 1
+                ring_offsets[ring] = vertex
+
+            part += 1
+            part_offsets[part] = ring
+
+        geom_offsets[f + 1] = part
+
+
+def decodeMultiPolygons(values: Sequence[bytes]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Return the coordinates, ring, part and geometry offsets of a sequence of MultiPolygon WKB values.
+
+    Parameters
+    ----------
+    values : sequence of bytes-like
+        One little-endian 2D MultiPolygon WKB per feature, e.g. a query's bytea column.
+
+    Returns
+    ----------
+        (n, 2) float64 coordinates and the ring, part and geometry offsets, as taken by RaggedGeometry().
+    """
+
+    values = [bytes(value) for value in values]
+    lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+    starts = np.concatenate([[0], np.cumsum(lengths)])
+    buf = np.frombuffer(b''.join(values), dtype=np.uint8)
+
+    n_parts, n_rings, n_vertices = _count(buf, starts)
+
+    coords = np.empty((n_vertices, 2), dtype=np.float64)
+    ring_offsets = np.zeros(n_rings + 1, dtype=np.int64)
+    part_offsets = np.zeros(n_parts + 1, dtype=np.int64)
+    geom_offsets = np.zeros(len(values) + 1, dtype=np.int64)
+
+    _fill(buf, starts, coords.reshape(-1).view(np.uint8), ring_offsets, part_offsets, geom_offsets)
+
+    return coords, ring_offsets, part_offsets, geom_offsets
@@ -0,0 +1,228 @@
+"""Long-lived local worker rendering the scripts on request, keeping libraries imported and layers loaded between renders.
+
+Each render run via the mapcompare command pays for Python startup, importing its visualisation library, numba's JIT
+compilation in datashader, and querying PostGIS. The worker pays these once:
+    - scripts are imported once per set of inputs, so that their # INPUTS reflect the job's options, and reused by
+      later jobs with the same inputs. The libraries they import remain in sys.modules either way, and datashader's
+      compiled kernels remain in memory
+    - sql2gdf() is replaced in each script by a version returning the layers already queried for the same database,
+      or read from its Arrow IPC snapshot for jobs with snapshot=True, see snapshot.py
+
+Jobs are dicts sent over a multiprocessing.connection on localhost, which unpickles what it receives. Connections are
+therefore authenticated with MAPCOMPARE_WORKER_KEY if set, or else with a random key generated on the worker's first
+start and kept readable only by its owner in mapcompare/temp/worker.key, see authKey(). Jobs look like
+    dict(lib='ds', db='dd', basemap=False, savefig=True, options={'parquet': 'True'}, output='/tmp/maps', snapshot=False)
+and are answered with their timings, see submit(). Jobs are rendered one at a time, in the order received, as neither
+pyplot nor the scripts' module globals are thread-safe. Interactive scripts still call show().
+
+    mapcompare worker --preload gpd --preload ds
+    mapcompare render --lib gpd --db dd --no-basemap --worker
+"""
+
+import os
+import sys
+import stat
+import time
+import secrets
+import functools
+import traceback
+import contextlib
+from multiprocessing.connection import Client, Listener
+from typing import Dict, Iterable, Tuple
+from mapcompare.inputs import envName
+from mapcompare.cli import loadScript, scriptsdir, timedMain
+
+HOST = 'localhost'
+PORT = int(os.environ.get(envName('worker_port'), 6010))
+keypath = os.path.join(os.path.dirname(__file__), 'temp', 'worker.key')
+
+# loaded scripts by lib, inputs and output directory
+_scripts = {}
+
+
+def authKey(create: bool=False) -> bytes:
+    """Return the key authenticating connections to the worker, from MAPCOMPARE_WORKER_KEY or the key file.
+
+    Parameters
+    ----------
+    create : bool
+        Generate the key file if it does not exist yet, as the worker does on start.
+
+    Raises
+    ----------
+    RuntimeError
+        If there is no key, i.e. no worker has been started, or the key file is accessible to other users.
+        The latter is not checked on Windows, where st_mode does not reflect the file's ACL.
+    """
+
+    if os.environ.get(envName('worker_key')):
+        return os.environ[envName('worker_key')].encode()
+
+    if create and not os.path.exists(keypath):
+        os.makedirs(os.path.dirname(keypath), exist_ok=True)
+        # created with owner-only permissions from the start, failing if another process created it meanwhile
+        with contextlib.suppress(FileExistsError):
+            fd = os.open(keypath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(secrets.token_bytes(32))
+
+    if not os.path.exists(keypath):
+        raise RuntimeError("No worker key in {}. Start the worker first, or set {}.".format(keypath, envName('worker_key')))
+
+    if os.name != 'nt' and os.stat(keypath).st_mode & (stat.S_IRWXG | stat.S_IRWXO):
+        raise RuntimeError("{} is accessible to other users. Restrict it with chmod 600.".format(keypath))
+
+    with open(keypath, 'rb') as f:
+        return f.read()
+
+
+class LayerCache:
+    """Drop-in replacement for sql2gdf() returning the layers of each database and layer type queried only once.
+
+    GeoDataFrames are returned as shallow copies, as some scripts add columns to the layers they are given.
+    """
+
+    def __init__(self):
+
+        self.layers = {}
+
+    def __call__(self, db_name: str, password: str, ragged: bool=False, incremental: bool=False, snapshot: bool=False) -> Tuple:
+
+        key = (db_name, ragged, incremental, snapshot)
+
+        # incremental layers are synced on every call, only fetching the rows changed since, see deltasync.py
+        if key not in self.layers or incremental:
+            if snapshot:
+                from mapcompare.snapshot import loadSnapshot
+                self.layers[key] = loadSnapshot(db_name, password, ragged=ragged)
+            else:
+                from mapcompare.sql2gdf import sql2gdf
+                self.layers[key] = sql2gdf(db_name, password, ragged=ragged, incremental=incremental)
+
+        if ragged:
+            return self.layers[key]
+
+        return tuple(gdf.copy(deep=False) for gdf in self.layers[key])
+
+
+@contextlib.contextmanager
+def _inputs(job: dict):
+    """Set a job's inputs as the environment variables read by override(), restoring the environment afterwards.
+
+    Yields the variables set.
+    """
+
+    # renderFigure() called once and unprofiled, see cProfile_viz.py, as profiles are kept per script and database only
+    inputs = dict({'profile': False}, **(job.get('options') or {}))
+
+    for name, key in (('db_name', 'db'), ('basemap', 'basemap'), ('savefig', 'savefig')):
+        if job.get(key) is not None:
+            inputs[name] = job[key]
+
+    inputs = {envName(name): str(value) for name, value in inputs.items()}
+
+    saved = dict(os.environ)
+    os.environ.update(inputs)
+
+    try:
+        yield inputs
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+def runJob(job: dict, layers: LayerCache) -> Dict[str, float]:
+    """Render a job's script with its inputs, returning import, load, render and write times in secs, see timedMain().
+    """
+
+    with _inputs(job) as inputs:
+        key = (job['lib'], tuple(sorted(inputs.items())), job.get('output'))
+
+        start_time = time.perf_counter()
+        if key not in _scripts:
+            _scripts[key] = loadScript(job['lib'])
+            if job.get('output') is not None:
+                _scripts[key].outputdir = os.path.join(job['output'], '')
+        module = _scripts[key]
+        import_time = time.perf_counter() - start_time
+
+        module.sql2gdf = functools.partial(layers, snapshot=bool(job.get('snapshot')))
+
+        try:
+            timings = timedMain(module)
+        finally:
+            # figures would otherwise accumulate over the worker's lifetime
+            if 'matplotlib.pyplot' in sys.modules:
+                sys.modules['matplotlib.pyplot'].close('all')
+
+    return dict(timings, **{'import': import_time})
+
+
+def serve(port: int=None, preload: Iterable[str]=()) -> None:
+    """Accept and render jobs until a 'shutdown' job is received.
+
+    Parameters
+    ----------
+    port : int, optional
+        Port on localhost, defaulting to MAPCOMPARE_WORKER_PORT or 6010.
+    preload : iterable of str
+        Scripts, as in --lib, to import at startup, i.e. their libraries.
+    """
+
+    # scripts use paths relative to the repository root
+    os.chdir(os.path.dirname(os.path.dirname(scriptsdir)))
+
+    layers = LayerCache()
+
+    for lib in preload:
+        start_time = time.perf_counter()
+        loadScript(lib)
+        print("Preloaded {} in {:.2f} secs".format(lib, time.perf_counter() - start_time))
+
+    with Listener((HOST, port or PORT), authkey=authKey(create=True)) as listener:
+        print("Worker listening on {}:{}".format(HOST, port or PORT))
+
+        while True:
+            with listener.accept() as conn:
+                try:
+                    job = conn.recv()
+                except EOFError:
+                    continue
+
+                if job.get('command') == 'shutdown':
+                    conn.send({'status': 'ok'})
+                    break
+
+                try:
+                    reply = dict(status='ok', **runJob(job, layers))
+                except Exception:
+                    reply = {'status': 'error', 'traceback': traceback.format_exc()}
+
+                print("{lib} ({db}): {status}".format(lib=job.get('lib'), db=job.get('db'), status=reply['status']))
+                conn.send(reply)
+
+
+def submit(job: dict, port: int=None) -> Dict[str, float]:
+    """Send a job to a running worker and wait for its timings.
+
+    Raises
+    ----------
+    RuntimeError
+        If the render failed within the worker, with the worker's traceback.
+    """
+
+    with Client((HOST, port or PORT), authkey=authKey()) as conn:
+        conn.send(job)
+        reply = conn.recv()
+
+    if reply['status'] != 'ok':
+        raise RuntimeError("Render failed on worker:\n" + reply.get('traceback', ''))
+
+    return reply
+
+
+def shutdown(port: int=None) -> None:
+    """Stop a running worker after its current job.
+    """
+
+    submit({'command': 'shutdown'}, port)
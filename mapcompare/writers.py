@@ -0,0 +1,189 @@
+"""Write figures with configurable output strategies, timing each write and recording the size of the file written.
+
+With savefig=True, SVGs of all polygons and HTML files with the data inline are both large and slow to write and open.
+The scripts' output strategies are selected via their # INPUTS:
+    - static figures (matplotlib): output_format 'svg', 'svg_raster' (polygon layers rasterised at dpi inside an
+      otherwise vector SVG, i.e. legend and text remain vector), 'png' or 'webp', and decimals limiting the precision
+      of SVG path coordinates
+    - interactive figures (Bokeh, HoloViews/GeoViews, hvPlot, Plotly): resources 'cdn' or 'inline' JS, and decimals
+      limiting the precision of coordinates written as GeoJSON text (Bokeh's GeoJSONDataSource, Plotly)
+    - compress: gzip SVG or HTML output to .svgz or .html.gz
+
+Every write is appended to `writes`, reported by the mapcompare command and compared by scripts/output_comp.py.
+"""
+
+import os
+import io
+import re
+import gzip
+import time
+import functools
+from typing import Dict, List
+import geopandas as gpd
+import shapely
+import numpy as np
+
+STATIC_FORMATS = ('svg', 'svg_raster', 'png', 'webp')
+
+# path, secs and bytes of every figure written by this process
+writes: List[Dict] = []
+
+_number = re.compile(r'-?\d+\.\d+')
+_path_data = re.compile(r' d="[^"]*"')
+
+
+def _recordWrite(func):
+    """Time a writer returning the path written, and record its size.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+
+        start_time = time.perf_counter()
+        path = func(*args, **kwargs)
+        run_time = time.perf_counter() - start_time
+
+        size = os.path.getsize(path)
+        writes.append({'path': path, 'secs': run_time, 'bytes': size})
+        print("\nWrote {} ({:.1f} MB) in {:.2f} secs".format(os.path.basename(path), size / 2**20, run_time))
+
+        return path
+
+    return wrapper
+
+
+def roundGeometries(gdf: gpd.GeoDataFrame, decimals: int) -> gpd.GeoDataFrame:
+    """Return a copy of a GeoDataFrame with its coordinates rounded, e.g. decimals=1 in Web Mercator metres.
+
+    Applied after projecting, ahead of rendering, as only the GeoJSON written as text becomes shorter.
+    """
+
+    gdf = gdf.copy()
+    rounded = shapely.transform(np.asarray(gdf.geometry.values), lambda coords: np.round(coords, decimals))
+    gdf[gdf.geometry.name] = gpd.GeoSeries(rounded, index=gdf.index, crs=gdf.crs)
+
+    return gdf
+
+
+def limitPrecision(svg: str, decimals: int) -> str:
+    """Round the coordinates of all path data in an SVG, leaving attributes such as font sizes and line widths untouched.
+    """
+
+    def roundNumber(match):
+        number = ('{:.' + str(decimals) + 'f}').format(float(match.group()))
+        # trailing zeros only after a decimal point, e.g. '10' with decimals=0 stays '10'
+        return number.rstrip('0').rstrip('.') if '.' in number else number
+
+    return _path_data.sub(lambda match: _number.sub(roundNumber, match.group()), svg)
+
+
+def _write(content: bytes, path: str, compress: bool) -> str:
+
+    if compress:
+        with gzip.open(path, 'wb', compresslevel=6) as f:
+            f.write(content)
+    else:
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    return path
+
+
+@_recordWrite
+def saveMatplotlib(fig, basepath: str, output_format: str='svg', dpi: int=300, decimals: int=None, compress: bool=False, **kwargs) -> str:
+    """Save a matplotlib figure in one of STATIC_FORMATS.
+
+    Parameters
+    ----------
+    fig : matplotlib.figure.Figure
+    basepath : str
+        Output path without extension.
+    output_format : {'svg', 'svg_raster', 'png', 'webp'}
+    dpi : int
+        Resolution of raster output, and of the rasterised layers if 'svg_raster'.
+    decimals : int, optional
+        Decimals of SVG path coordinates, in points.
+    compress : bool
+        gzip SVG output to .svgz.
+    **kwargs
+        Passed to savefig().
+
+    Returns
+    ----------
+        The path written to.
+    """
+
+    if output_format not in STATIC_FORMATS:
+        raise ValueError("output_format must be one of " + str(STATIC_FORMATS) + ", got " + repr(output_format))
+
+    if output_format in ('png', 'webp'):
+        path = basepath + '.' + output_format
+        fig.savefig(path, format=output_format, dpi=dpi, **kwargs)
+        return path
+
+    if output_format == 'svg_raster':
+        from matplotlib.collections import Collection
+
+        # polygon layers, i.e. collections incl. cartopy's FeatureArtist, while text, legend and frame stay vector
+        for ax in fig.axes:
+            for artist in ax.get_children():
+                if isinstance(artist, Collection) or type(artist).__name__ == 'FeatureArtist':
+                    artist.set_rasterized(True)
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='svg', dpi=dpi, **kwargs)
+    content = buffer.getvalue()
+
+    if decimals is not None:
+        content = limitPrecision(content.decode('utf-8'), decimals).encode('utf-8')
+
+    return _write(content, basepath + ('.svgz' if compress else '.svg'), compress)
+
+
+def _compressHtml(path: str) -> str:
+    """Replace an HTML file by its gzipped copy.
+    """
+
+    with open(path, 'rb') as f:
+        content = f.read()
+
+    os.remove(path)
+
+    return _write(content, path + '.gz', True)
+
+
+@_recordWrite
+def saveBokeh(obj, basepath: str, resources: str='cdn', compress: bool=False, title: str=None) -> str:
+    """Save a Bokeh model to HTML with BokehJS either loaded from the CDN or inline.
+    """
+
+    from bokeh.io import save
+    from bokeh.resources import CDN, INLINE
+
+    path = save(obj, filename=basepath + '.html', resources=INLINE if resources == 'inline' else CDN, title=title or os.path.basename(basepath))
+
+    return _compressHtml(path) if compress else path
+
+
+@_recordWrite
+def saveHoloViews(obj, basepath: str, fmt: str='html', resources: str='cdn', compress: bool=False, **kwargs) -> str:
+    """Save a HoloViews, GeoViews or hvPlot object via hv.save(), e.g. to HTML with BokehJS from the CDN or inline.
+    """
+
+    import holoviews as hv
+
+    path = basepath + '.' + fmt
+    hv.save(obj, path, fmt=fmt, resources=resources, **kwargs)
+
+    return _compressHtml(path) if compress and fmt == 'html' else path
+
+
+@_recordWrite
+def savePlotly(fig, basepath: str, resources: str='inline', compress: bool=False) -> str:
+    """Save a Plotly figure to HTML with plotly.js either loaded from the CDN or inline.
+    """
+
+    path = basepath + '.html'
+    fig.write_html(path, include_plotlyjs='cdn' if resources == 'cdn' else True)
+
+    return _compressHtml(path) if compress else path
@@ -0,0 +1,66 @@
+"""XYZ tile helpers in Web Mercator (EPSG:3857) and a minimal local tile server.
+
+Shared by the precomputed datashader tile pyramid, the Bokeh Server apps showing it and the basemap tile cache.
+"""
+
+import math
+import threading
+from http.server import ThreadingHTTPServer
+from typing import List, Sequence, Tuple
+
+# half the circumference of the earth in Web Mercator metres
+ORIGIN = 20037508.342789244
+TILE_PX = 256
+
+# running servers by port, so that re-executed Bokeh app scripts start them only once per process
+_servers = {}
+
+
+def tileBounds(z: int, x: int, y: int) -> List[float]:
+    """Return the Web Mercator extent (x0, x1, y0, y1) of tile z/x/y, y counting from the top as in OSM.
+    """
+
+    size = 2 * ORIGIN / 2**z
+
+    return [-ORIGIN + x * size, -ORIGIN + (x + 1) * size, ORIGIN - (y + 1) * size, ORIGIN - y * size]
+
+
+def tilesInExtent(extent: Sequence[float], z: int) -> List[Tuple[int, int, int]]:
+    """Return all (z, x, y) tiles intersecting a Web Mercator extent in (x0, x1, y0, y1) order.
+    """
+
+    x0, x1, y0, y1 = extent
+    size = 2 * ORIGIN / 2**z
+    n = 2**z
+
+    col0 = max(0, int((x0 + ORIGIN) // size))
+    col1 = min(n - 1, int((x1 + ORIGIN) // size))
+    row0 = max(0, int((ORIGIN - y1) // size))
+    row1 = min(n - 1, int((ORIGIN - y0) // size))
+
+    return [(z, x, y) for x in range(col0, col1 + 1) for y in range(row0, row1 + 1)]
+
+
+def zoomLevel(x_range: Sequence[float], width_px: int) -> float:
+    """Return the (fractional) XYZ zoom level at which x_range spans width_px screen pixels.
+    """
+
+    return math.log2(2 * ORIGIN * width_px / (TILE_PX * (x_range[1] - x_range[0])))
+
+
+def fittingZoom(extent: Sequence[float], width_px: int=1024) -> int:
+    """Return the highest zoom level at which the whole extent still fits into width_px, e.g. a city-wide view.
+    """
+
+    return int(math.floor(zoomLevel((extent[0], extent[1]), width_px)))
+
+
+def serveHandler(handler, port: int) -> None:
+    """Serve requests on localhost with a request handler class from a daemon thread, once per process and port.
+    """
+
+    if port not in _servers:
+        server = ThreadingHTTPServer(('localhost', port), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        _servers[port] = server
+
@@ -17,20 +17,25 @@ import altair as alt
 import json
 from geopandas import GeoDataFrame
 from IPython.display import display
+from mapcompare.inputs import override
 from mapcompare.sql2gdf import sql2gdf
 from mapcompare.misc.pw import password
-importlib.reload(sys.modules['mapcompare.cProfile_viz']) # no kernel/IDE restart needed after editing cProfile_viz.py
+if 'mapcompare.cProfile_viz' in sys.modules:
+    importlib.reload(sys.modules['mapcompare.cProfile_viz']) # no kernel/IDE restart needed after editing cProfile_viz.py
 from mapcompare.cProfile_viz import to_cProfile
 
 outputdir = 'mapcompare/outputs/'
 
 # as yet no support for basemaps
-basemap = True
+basemap = override('basemap', True)
 
 # chart.save() seems to have a number of issues on Windows
 # see https://github.com/altair-viz/altair_saver/issues/72 and 
 # https://github.com/altair-viz/altair_saver/issues/95 - no luck yet with these solutions
-savefig = False
+savefig = override('savefig', False)
+
+simplify_px = override('simplify_px', None, float) # simplify to a tolerance in pixels of the 700px wide chart, e.g. 0.5, see mapcompare/simplify.py
+profile_suffix = '_simplified' if simplify_px is not None else '' # keeps cProfiles of both inputs apart
 
 
 # mark_geoshape currently does not support interactive mode
@@ -39,7 +44,7 @@ viz_type = 'static/'
 
 
 # INPUTS
-db_name = 'dd_subset'
+db_name = override('db_name', 'dd_subset')
 
 
 # VSCode can natively display the charts in the interpreter
@@ -119,13 +124,25 @@ def renderFigure(json_features: dict, basemap: bool=basemap, savefig: bool=savef
         pass
 
 
-if __name__ == "__main__":
+def main() -> None:
+    """Query PostGIS, prepare the layers and render, as when run as a script. Called by the mapcompare command, see mapcompare/cli.py.
+    """
+
+    global json_features, buildings_in, buildings_out, rivers
 
-    buildings_in, buildings_out, rivers = sql2gdf(db_name, password)
+    if simplify_px is not None:
+        # imported here, as numba's import is only paid for when simplifying
+        from mapcompare.simplify import simplifyLayers
+        layers = simplifyLayers(sql2gdf(db_name, password, ragged=True), db_name, width=700, pixels=simplify_px)
+        buildings_in, buildings_out, rivers = [layer.toGeoDataFrame() for layer in layers]
+    else:
+        buildings_in, buildings_out, rivers = sql2gdf(db_name, password)
 
     json_features = prepGDFs(buildings_in, buildings_out, rivers)
 
     renderFigure(json_features)
-    
 
 
+if __name__ == "__main__":
+
+    main()
@@ -11,15 +11,18 @@ import os
 import numpy as np
 from typing import List, Tuple
 from bokeh.models.ranges import Range1d
-from bokeh.io import output_file, show
+from bokeh.io import show
 from bokeh.io.output import output_notebook
 from bokeh.models import GeoJSONDataSource, Range1d
 from bokeh.plotting import figure
 from geopandas import GeoDataFrame
+from mapcompare.inputs import override
+from mapcompare.writers import roundGeometries, saveBokeh
+from mapcompare.tilecache import basemapSource
 from mapcompare.sql2gdf import sql2gdf, timer
+from mapcompare.symbology import BOKEH_LAYERS, bokehGlyph, bokehProxies
 from mapcompare.misc.pw import password
 from mapcompare.cProfile_viz import to_cProfile
-from bokeh.tile_providers import OSM, get_provider
 
 # required to display plot in VSCode or a Jupyter Notebook
 # See https://docs.bokeh.org/en/latest/docs/first_steps/first_steps_7.html#displaying-in-a-jupyter-notebook
@@ -29,9 +32,15 @@ outputdir = 'mapcompare/outputs/'
 viz_type = 'interactive/' # type non-adjustable
 
 # INPUTS
-db_name = 'dd_subset'
-basemap = True
-savefig = False
+db_name = override('db_name', 'dd_subset')
+basemap = override('basemap', True)
+savefig = override('savefig', False)
+tile_cache = override('tile_cache', False) # basemap tiles from the tile cache, served by `mapcompare tiles` to the browser, see mapcompare/tilecache.py
+resources = override('resources', 'cdn') # load JS from the 'cdn' or 'inline', see mapcompare/writers.py
+decimals = override('decimals', None, int) # decimals of the projected coordinates written to HTML, e.g. 1
+compress = override('compress', False) # gzip HTML output to .html.gz
+simplify_px = override('simplify_px', None, float) # simplify to a tolerance in pixels of the 600px high plot, e.g. 0.5, see mapcompare/simplify.py
+profile_suffix = '_simplified' if simplify_px is not None else '' # keeps cProfiles of both inputs apart
 
 @timer
 def prepGDFs(*gdfs: GeoDataFrame) -> Tuple[Tuple[GeoDataFrame], List[np.float64], np.float64]:
@@ -86,7 +95,7 @@ def renderFigure(*gdfs: GeoDataFrame, basemap: bool=basemap, savefig: bool=savef
             y_range=Range1d(extent[2], extent[3]),
         )
         
-        p.add_tile(get_provider(OSM))
+        p.add_tile(basemap_source)
     
     else:
         
@@ -103,9 +112,10 @@ def renderFigure(*gdfs: GeoDataFrame, basemap: bool=basemap, savefig: bool=savef
     p.yaxis.visible = False
         
     # Add features
-    p.patches('xs', 'ys', legend_label="Buildings within 500m of river/stream", color='red', source=GeoJSONDataSource(geojson=gdfs[0].to_json()))
-    p.patches('xs', 'ys', legend_label="Buildings outside 500m of river/stream", color='lightgrey', line_color='black', line_width=0.5, source=GeoJSONDataSource(geojson=gdfs[1].to_json()))
-    p.patches('xs', 'ys', legend_label="River/stream", color='lightblue', line_color='blue', line_width=0.25, source=GeoJSONDataSource(geojson=gdfs[2].to_json()))
+    renderers = [p.patches('xs', 'ys', source=GeoJSONDataSource(geojson=gdf.to_json()), **bokehGlyph(layer)) for gdf, layer in zip(gdfs, BOKEH_LAYERS)]
+
+    # Legend entries drawn from data-less proxies, each hiding its layer's renderer on click
+    bokehProxies(p, renderers)
 
         
     p.legend.location = "top_right"
@@ -116,18 +126,37 @@ def renderFigure(*gdfs: GeoDataFrame, basemap: bool=basemap, savefig: bool=savef
         if not os.path.exists(outputdir + viz_type):
             os.makedirs(outputdir + viz_type)
 
-        output_file(filename=outputdir + viz_type + "bokeh" + " (" + db_name + ").html")
+        saveBokeh(p, outputdir + viz_type + "bokeh" + " (" + db_name + ")", resources=resources, compress=compress)
     else:
         pass
         
     show(p)
 
-if __name__ == "__main__":
+def main() -> None:
+    """Query PostGIS, prepare the layers and render, as when run as a script. Called by the mapcompare command, see mapcompare/cli.py.
+    """
 
-    buildings_in, buildings_out, rivers = sql2gdf(db_name, password)
+    global buildings_in, buildings_out, rivers, extent, aspect_ratio, basemap_source
+
+    if simplify_px is not None:
+        # simplified in the source CRS, before reprojecting
+        # imported here, as numba's import is only paid for when simplifying
+        from mapcompare.simplify import simplifyLayers
+        layers = simplifyLayers(sql2gdf(db_name, password, ragged=True), db_name, height=600, pixels=simplify_px)
+        buildings_in, buildings_out, rivers = [layer.toGeoDataFrame() for layer in layers]
+    else:
+        buildings_in, buildings_out, rivers = sql2gdf(db_name, password)
 
     (buildings_in, buildings_out, rivers), extent, aspect_ratio = prepGDFs(buildings_in, buildings_out, rivers)
 
+    if decimals is not None:
+        buildings_in, buildings_out, rivers = [roundGeometries(gdf, decimals) for gdf in (buildings_in, buildings_out, rivers)]
+
+    basemap_source = basemapSource('bokeh', tile_cache)
+
     renderFigure(buildings_in, buildings_out, rivers)
 
 
+if __name__ == "__main__":
+
+    main()
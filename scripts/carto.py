@@ -13,22 +13,35 @@ import importlib
 import numpy as np
 import contextily as ctx
 import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
+from matplotlib.collections import PathCollection
 from cartopy import crs as ccrs
 from geopandas import GeoDataFrame
-from mapcompare.sql2gdf import sql2gdf
+from mapcompare.inputs import override
+from mapcompare.writers import saveMatplotlib
+from mapcompare.tilecache import basemapSource
+from mapcompare.sql2gdf import sql2gdf, sourceFingerprint
+from mapcompare.flatpaths import cachedPaths
+from mapcompare.symbology import LAYERS, mplStyle, mplHandles, legendLabels
 from mapcompare.misc.pw import password
 import requests
-importlib.reload(sys.modules['mapcompare.cProfile_viz']) # no kernel/IDE restart needed after editing cProfile_viz.py
+if 'mapcompare.cProfile_viz' in sys.modules:
+    importlib.reload(sys.modules['mapcompare.cProfile_viz']) # no kernel/IDE restart needed after editing cProfile_viz.py
 from mapcompare.cProfile_viz import to_cProfile
 
 outputdir = 'mapcompare/outputs/'
 viz_type = 'static/' # type non-adjustable
 
 # INPUTS
-db_name = 'dd_subset' 
-basemap = True
-savefig = False
+db_name = override('db_name', 'dd_subset')
+basemap = override('basemap', True)
+savefig = override('savefig', False)
+tile_cache = override('tile_cache', False) # serve basemap tiles from the local tile cache, see mapcompare/tilecache.py
+output_format = override('output_format', 'svg') # or 'svg_raster', 'png', 'webp', see mapcompare/writers.py
+decimals = override('decimals', None, int) # decimals of SVG path coordinates, e.g. 1
+compress = override('compress', False) # gzip SVG output to .svgz
+prepath = override('prepath', False) # add cached, pre-projected paths instead of calling add_geometries(), see mapcompare/flatpaths.py
+
+profile_suffix = '_pp' if prepath else '' # keeps cProfiles of both paths apart
 
 
 def getExtent(*gdfs: GeoDataFrame) -> list:
@@ -78,29 +91,36 @@ def renderFigure(*gdfs: GeoDataFrame, basemap: bool=basemap, savefig: bool=savef
     ax.set_extent(extent, crs=crs)
     ax.set_title("Matplotlib interface: cartopy's .add_geometries()" + "\n", fontsize=20)
     
-    # Add features to Axes with cartopy add_geometries()
-    
-    ax.add_geometries(gdfs[0].geometry, crs, facecolor='red')
-    ax.add_geometries(gdfs[1].geometry, crs, facecolor='lightgrey', edgecolor='black', linewidth=0.1)
-    ax.add_geometries(gdfs[2].geometry, crs, facecolor='lightblue', edgecolor='blue', linewidth=0.25)
+    if prepath:
+
+        # Add features to Axes as paths already projected to the GeoAxes' projection,
+        # skipping cartopy's per-geometry projection; cached by dataset and projection
+        # so that repeated renders of the same data only pay for drawing
+
+        for i, layer in enumerate(LAYERS):
+            paths = cachedPaths(gdfs[i].geometry, db_name + ' layer ' + str(i), crs, ax.projection, fingerprint=source_fingerprint)
+            ax.add_collection(PathCollection(paths, **mplStyle(layer, edgecolor='none')))
+
+    else:
+
+        # Add features to Axes with cartopy add_geometries()
+
+        for gdf, layer in zip(gdfs, LAYERS):
+            ax.add_geometries(gdf.geometry, crs, **mplStyle(layer))
 
     if basemap:
         try:
-            ctx.add_basemap(ax, crs=rivers.crs.to_string(), source=ctx.providers.OpenStreetMap.Mapnik)
+            ctx.add_basemap(ax, crs=rivers.crs.to_string(), source=basemap_source)
         except requests.HTTPError:
             print("Contextily: No tiles found. Zoom level likely too high. Setting zoom level to 13.")
-            ctx.add_basemap(ax, zoom=13, crs=rivers.crs.to_string(), source=ctx.providers.OpenStreetMap.Mapnik)
+            ctx.add_basemap(ax, zoom=13, crs=rivers.crs.to_string(), source=basemap_source)
     else:
         pass
     
     # Legend
 
-    buildings_in_handle = [mpatches.Rectangle((0, 0), 1, 1, facecolor='red')]
-    buildings_out_handle = [mpatches.Rectangle((0, 0), 1, 1, facecolor='lightgrey', edgecolor='black', linewidth=0.5)]
-    rivers_handle = [mpatches.Rectangle((0, 0), 1, 1, facecolor='lightblue',edgecolor='blue', linewidth=0.25)]
-
-    handles = buildings_in_handle + buildings_out_handle + rivers_handle 
-    labels = ['Buildings within 500m of river/stream', 'Buildings outside 500m of river/stream', 'Rivers or streams']
+    handles = mplHandles()
+    labels = legendLabels()
 
     ax.legend(handles, labels, title=None, title_fontsize=14, fontsize=18, loc='best', frameon=True, framealpha=1)
 
@@ -110,18 +130,29 @@ def renderFigure(*gdfs: GeoDataFrame, basemap: bool=basemap, savefig: bool=savef
         if not os.path.exists(outputdir + viz_type):
             os.makedirs(outputdir + viz_type)
 
-        plt.savefig(outputdir + viz_type + "cartopy (" + db_name + ").svg", format='svg', orientation='landscape')
+        saveMatplotlib(plt.gcf(), outputdir + viz_type + "cartopy (" + db_name + ")", output_format, decimals=decimals, compress=compress, orientation='landscape')
     else:
         pass
 
 
-if __name__ == "__main__":
-    
-    buildings_in, buildings_out, rivers = sql2gdf(db_name, password) 
+def main() -> None:
+    """Query PostGIS, prepare the layers and render, as when run as a script. Called by the mapcompare command, see mapcompare/cli.py.
+    """
+
+    global extent, buildings_in, buildings_out, rivers, basemap_source, source_fingerprint
+
+    buildings_in, buildings_out, rivers = sql2gdf(db_name, password)
+
+    # validates the cached paths without hashing the layers, see mapcompare/flatpaths.py
+    source_fingerprint = sourceFingerprint(db_name, password) if prepath else None
 
     extent = getExtent(buildings_in, buildings_out, rivers)
 
+    basemap_source = basemapSource('contextily', tile_cache)
+
     renderFigure(buildings_in, buildings_out, rivers)
 
 
+if __name__ == "__main__":
 
+    main()
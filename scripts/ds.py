@@ -11,14 +11,19 @@ import sys
 import importlib
 import numpy as np
 from spatialpandas import GeoDataFrame
+from spatialpandas.dask import DaskGeoDataFrame
 import geopandas as gpd # for type hinting only
 from typing import Tuple, List
 import datashader as ds
 import datashader.transfer_functions as tf
 import datashader.utils as utils
-from mapcompare.sql2gdf import sql2gdf, timer
+from mapcompare.inputs import override
+from mapcompare.sql2gdf import sql2gdf, sourceFingerprint, timer
+from mapcompare.spatialparquet import loadParquet, totalBounds
+from mapcompare.warmup import warmup as warmupKernels
 from mapcompare.misc.pw import password
-importlib.reload(sys.modules['mapcompare.cProfile_viz']) # no kernel/IDE restart needed after editing cProfile_viz.py
+if 'mapcompare.cProfile_viz' in sys.modules:
+    importlib.reload(sys.modules['mapcompare.cProfile_viz']) # no kernel/IDE restart needed after editing cProfile_viz.py
 from mapcompare.cProfile_viz import to_cProfile
 
 
@@ -27,8 +32,10 @@ viz_type = 'static/' # not adjustable
 basemap = False # not adjustable
 
 # INPUTS
-db_name = 'dd_subset'
-savefig = True
+db_name = override('db_name', 'dd_subset')
+savefig = override('savefig', True)
+parquet = override('parquet', False) # read a Hilbert-sorted, spatially partitioned Parquet dataset lazily with dask, see mapcompare/spatialparquet.py
+warmup = override('warmup', False) # compile the kernels on a tiny synthetic frame ahead of renderFigure(), i.e. outside its cProfile
 
 @timer
 def prepGDFs(*gdfs: gpd.GeoDataFrame) -> Tuple[GeoDataFrame, List[np.float64]]:
@@ -67,13 +74,28 @@ def prepGDFs(*gdfs: gpd.GeoDataFrame) -> Tuple[GeoDataFrame, List[np.float64]]:
     return spatialpdGDF, extent
 
 
+@timer
+def prepParquet(db_name: str=db_name) -> Tuple[DaskGeoDataFrame, List[np.float64]]:
+    """Open the spatially partitioned Parquet dataset, writing it first from PostGIS if it does not exist yet.
+
+    This step is separated from actual rendering to not affect performance measurement.
+    """
+
+    categories = ['Within_500m', 'Outside_500m', 'River/stream']
+
+    spatialpdGDF = loadParquet(db_name, 25833, categories, lambda: prepGDFs(*sql2gdf(db_name, password))[0],
+                               fingerprint=sourceFingerprint(db_name, password))
+
+    return spatialpdGDF, totalBounds(spatialpdGDF)
+
+
 @to_cProfile
 def renderFigure(spatialpdGDF: GeoDataFrame, extent: List[np.float64], basemap: bool=basemap, savefig: bool=savefig, db_name: str=db_name, viz_type: str=viz_type) -> None:
     """Renders the figure reproducing the map template minus the basemap and legend.
 
     Parameters
     ----------
-    spatialpdGDF : SpatialPandas GeoDataFrame
+    spatialpdGDF : SpatialPandas GeoDataFrame or DaskGeoDataFrame
         GeoDataFrame containing all three feature sets.
     basemap : Boolean
         Global scope variable determining whether or not to add a basemap.
@@ -105,16 +127,28 @@ def renderFigure(spatialpdGDF: GeoDataFrame, extent: List[np.float64], basemap:
         pass
 
 
-if __name__ == "__main__":
-    
-    buildings_in, buildings_out, rivers = sql2gdf(db_name, password)
+def main() -> None:
+    """Query PostGIS, prepare the layers and render, as when run as a script. Called by the mapcompare command, see mapcompare/cli.py.
+    """
 
-    spatialpdGDF, extent = prepGDFs(buildings_in, buildings_out, rivers)
+    global spatialpdGDF, extent, buildings_in, buildings_out, rivers
 
-    renderFigure(spatialpdGDF, extent)
+    if warmup:
+        print("Warmed up datashader's kernels in {:.2f} secs".format(warmupKernels(['Outside_500m', 'River/stream', 'Within_500m'])))
 
+    if parquet:
 
+        spatialpdGDF, extent = prepParquet()
+
+    else:
 
+        buildings_in, buildings_out, rivers = sql2gdf(db_name, password)
 
+        spatialpdGDF, extent = prepGDFs(buildings_in, buildings_out, rivers)
 
+    renderFigure(spatialpdGDF, extent)
+
+
+if __name__ == "__main__":
 
+    main()
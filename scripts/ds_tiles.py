@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+"""Precompute the datashader XYZ tile pyramid shown by the Bokeh Server apps in apps/gv_ds/ and apps/hv_ds/ if tile_pyramid=True.
+
+Tiles are rendered in a process pool from the spatially partitioned Parquet dataset in Web Mercator,
+which is written from PostGIS first if it does not exist yet (see mapcompare/spatialparquet.py).
+Serve the pyramid to the apps' browser sessions with `mapcompare tiles --pyramid [db_name] --port 8001`.
+"""
+
+import geopandas as gpd # for type hinting only
+from mapcompare.inputs import override
+from mapcompare.sql2gdf import sql2gdf, sourceFingerprint, timer
+from mapcompare.spatialparquet import loadParquet, parquetPath, totalBounds
+from mapcompare.tilepyramid import renderPyramid, pyramiddir
+from mapcompare.xyz import fittingZoom
+from mapcompare.misc.pw import password
+
+# INPUTS
+db_name = override('db_name', 'dd')
+min_zoom = None # defaults to the highest zoom level showing the whole city on a 1024 px wide map
+max_zoom = override('max_zoom', 16) # beyond this zoom level the apps datashade live
+workers = None # defaults to the number of CPUs
+
+
+def prepGDFs(*gdfs: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """Transform to Web Mercator and merge GeoDataFrames as in the apps' prepGDFs().
+    """
+
+    buildings_in, buildings_out, rivers = [gdf.to_crs(epsg=3857) for gdf in gdfs]
+
+    buildings_in['category'] = 'Buildings within 500m of river/stream'
+    buildings_out['category'] = 'Buildings outside 500m of river/stream'
+    rivers['category'] = 'River/stream'
+
+    merged = buildings_in.append(buildings_out).append(rivers)
+    merged['category'] = merged['category'].astype('category')
+
+    return merged
+
+
+@timer
+def renderTiles(db_name: str=db_name) -> None:
+    """Render the tile pyramid to mapcompare/temp/tiles/datashader/[db_name]/.
+    """
+
+    # same colours as the apps' color_key
+    color_key = {'Buildings within 500m of river/stream': 'red', 'Buildings outside 500m of river/stream': 'grey', 'River/stream': 'lightblue'}
+
+    ddf = loadParquet(db_name, 3857, list(color_key), lambda: prepGDFs(*sql2gdf(db_name, password)),
+                      fingerprint=sourceFingerprint(db_name, password))
+
+    extent = totalBounds(ddf)
+
+    renderPyramid(parquetPath(db_name, 3857), extent, color_key, min_zoom if min_zoom is not None else fittingZoom(extent), max_zoom,
+                  pyramiddir + db_name + '/', workers=workers)
+
+
+def main() -> None:
+    """Render the tile pyramid, as when run as a script. Called by the mapcompare command, see mapcompare/cli.py.
+    """
+
+    renderTiles()
+
+
+if __name__ == "__main__":
+
+    main()
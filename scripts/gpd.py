@@ -15,21 +15,29 @@ from geopandas.geodataframe import GeoDataFrame
 import numpy as np
 import contextily as ctx
 import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
 from cartopy import crs as ccrs
+from mapcompare.inputs import override
+from mapcompare.writers import saveMatplotlib
+from mapcompare.tilecache import basemapSource
 from mapcompare.sql2gdf import sql2gdf
+from mapcompare.symbology import LAYERS, mplStyle, mplHandles, legendLabels
 from mapcompare.misc.pw import password
 import requests
-importlib.reload(sys.modules['mapcompare.cProfile_viz']) # no kernel/IDE restart needed after editing cProfile_viz.py
+if 'mapcompare.cProfile_viz' in sys.modules:
+    importlib.reload(sys.modules['mapcompare.cProfile_viz']) # no kernel/IDE restart needed after editing cProfile_viz.py
 from mapcompare.cProfile_viz import to_cProfile
 
 outputdir = 'mapcompare/outputs/'
 viz_type = 'static/' # non-adjustable
 
 # INPUTS
-db_name = 'dd_subset' 
-basemap = True
-savefig = False
+db_name = override('db_name', 'dd_subset')
+basemap = override('basemap', True)
+savefig = override('savefig', False)
+tile_cache = override('tile_cache', False) # serve basemap tiles from the local tile cache, see mapcompare/tilecache.py
+output_format = override('output_format', 'svg') # or 'svg_raster', 'png', 'webp', see mapcompare/writers.py
+decimals = override('decimals', None, int) # decimals of SVG path coordinates, e.g. 1
+compress = override('compress', False) # gzip SVG output to .svgz
 
 
 def getExtent(*gdfs: GeoDataFrame) -> List[np.float64]:
@@ -72,11 +80,6 @@ def renderFigure(*gdfs, basemap: bool=basemap, savefig: bool=savefig, db_name: s
         A figure reproducing the map template.
     """
     
-    # Get number of features per GDF, to display in legend
-    buildings_in_no = str(len(gdfs[0].index))
-    buildings_out_no = str(len(gdfs[1].index))
-    rivers_no = str(len(gdfs[2].index))
-
     crs = ccrs.UTM(33)
 
     fig, ax = plt.subplots(1, 1, subplot_kw={'projection': crs}, figsize=(20, 10))
@@ -103,27 +106,22 @@ def renderFigure(*gdfs, basemap: bool=basemap, savefig: bool=savefig, db_name: s
     # See: https://github.com/geopandas/geopandas/issues/1269.
     """
     
-    gdfs[0].plot(ax=ax, facecolor='red')
-    gdfs[1].plot(ax=ax, facecolor='lightgrey', edgecolor='black', linewidth=0.1)
-    gdfs[2].plot(ax=ax, facecolor='lightblue', edgecolor='blue', linewidth=0.25)
+    for gdf, layer in zip(gdfs, LAYERS):
+        gdf.plot(ax=ax, **mplStyle(layer))
    
     if basemap:
         try:
-            ctx.add_basemap(ax, crs=rivers.crs.to_string(), source=ctx.providers.OpenStreetMap.Mapnik)
+            ctx.add_basemap(ax, crs=rivers.crs.to_string(), source=basemap_source)
         except requests.HTTPError:
             print("Contextily: No tiles found. Zoom level likely too high. Setting zoom level to 13.")
-            ctx.add_basemap(ax, zoom=13, crs=rivers.crs.to_string(), source=ctx.providers.OpenStreetMap.Mapnik)
+            ctx.add_basemap(ax, zoom=13, crs=rivers.crs.to_string(), source=basemap_source)
     else:
         pass
     
     # Legend
 
-    buildings_in_handle = [mpatches.Rectangle((0, 0), 1, 1, facecolor='red')]
-    buildings_out_handle = [mpatches.Rectangle((0, 0), 1, 1, facecolor='lightgrey', edgecolor='black', linewidth=0.5)]
-    rivers_handle = [mpatches.Rectangle((0, 0), 1, 1, facecolor='lightblue',edgecolor='blue', linewidth=0.25)]
-
-    handles = buildings_in_handle + buildings_out_handle + rivers_handle 
-    labels = ['Buildings within 500m (n=' + buildings_in_no + ')', 'Buildings outside 500m (n=' + buildings_out_no + ')', 'Rivers or streams (n=' + rivers_no + ')']
+    handles = mplHandles()
+    labels = legendLabels([len(gdf) for gdf in gdfs])
 
     ax.legend(handles, labels, title=None, title_fontsize=14, fontsize=18, loc='best', frameon=True, framealpha=1)
 
@@ -135,18 +133,26 @@ def renderFigure(*gdfs, basemap: bool=basemap, savefig: bool=savefig, db_name: s
         if not os.path.exists(outputdir + viz_type):
             os.makedirs(outputdir + viz_type)
 
-        plt.savefig(outputdir + viz_type + "geopandas (" + db_name + ').svg', format='svg', orientation='landscape')
+        saveMatplotlib(plt.gcf(), outputdir + viz_type + "geopandas (" + db_name + ")", output_format, decimals=decimals, compress=compress, orientation='landscape')
     else:
         pass
 
 
-if __name__ == "__main__":
+def main() -> None:
+    """Query PostGIS, prepare the layers and render, as when run as a script. Called by the mapcompare command, see mapcompare/cli.py.
+    """
+
+    global extent, buildings_in, buildings_out, rivers, basemap_source
 
     buildings_in, buildings_out, rivers = sql2gdf(db_name, password)
 
     extent = getExtent(buildings_in, buildings_out, rivers)
-    
+
+    basemap_source = basemapSource('contextily', tile_cache)
+
     renderFigure(buildings_in, buildings_out, rivers)
 
 
+if __name__ == "__main__":
 
+    main()
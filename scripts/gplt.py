@@ -16,21 +16,29 @@ from typing import Tuple, List
 from geopandas.geodataframe import GeoDataFrame
 import numpy as np
 import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
 import geoplot as gplt
 import geoplot.crs as gcrs
+from mapcompare.inputs import override
+from mapcompare.writers import saveMatplotlib
+from mapcompare.tilecache import basemapSource
 from mapcompare.sql2gdf import sql2gdf
+from mapcompare.symbology import LAYERS, mplStyle, mplHandles, legendLabels
 from mapcompare.misc.pw import password
-importlib.reload(sys.modules['mapcompare.cProfile_viz']) # no kernel/IDE restart needed after editing cProfile_viz.py
+if 'mapcompare.cProfile_viz' in sys.modules:
+    importlib.reload(sys.modules['mapcompare.cProfile_viz']) # no kernel/IDE restart needed after editing cProfile_viz.py
 from mapcompare.cProfile_viz import to_cProfile
 
 outputdir = 'mapcompare/outputs/'
 viz_type = 'static/' # type non-adjustable
 
 # INPUTS
-db_name = 'dd_subset'
-basemap = True
-savefig = False
+db_name = override('db_name', 'dd_subset')
+basemap = override('basemap', True)
+savefig = override('savefig', False)
+tile_cache = override('tile_cache', False) # serve basemap tiles from the local tile cache, see mapcompare/tilecache.py
+output_format = override('output_format', 'svg') # or 'svg_raster', 'png', 'webp', see mapcompare/writers.py
+decimals = override('decimals', None, int) # decimals of SVG path coordinates, e.g. 1
+compress = override('compress', False) # gzip SVG output to .svgz
 
 
 def prepGDFs(*gdfs: GeoDataFrame) -> Tuple[Tuple[GeoDataFrame], List[np.float64]]:
@@ -75,29 +83,19 @@ def renderFigure(*gdfs, basemap: bool=basemap, savefig: bool=savefig, db_name: s
         A figure reproducing the map template.
     """
 
-     # Get number of features per GDF, to display in legend
-    buildings_in_no = str(len(gdfs[0].index))
-    buildings_out_no = str(len(gdfs[1].index))
-    rivers_no = str(len(gdfs[2].index))
-
     if basemap:
-        ax = gplt.webmap(gdfs[0], extent=extent, projection=gcrs.WebMercator(), figsize=(20, 10))
-        gplt.polyplot(gdfs[0], ax=ax, facecolor='red', zorder=3)
-        gplt.polyplot(gdfs[1], ax=ax, facecolor='lightgrey', edgecolor='black', linewidth=0.1, zorder=2)
-        gplt.polyplot(gdfs[2], ax=ax, facecolor='lightblue', edgecolor='blue', linewidth=0.25, zorder=1)
+        ax = gplt.webmap(gdfs[0], extent=extent, projection=gcrs.WebMercator(), figsize=(20, 10), **basemap_kwargs)
+        for gdf, layer, zorder in zip(gdfs, LAYERS, (3, 2, 1)):
+            gplt.polyplot(gdf, ax=ax, zorder=zorder, **mplStyle(layer))
     else:
-        ax = gplt.polyplot(gdfs[0], extent=extent, projection=gcrs.Mercator(), facecolor='red', figsize=(20, 10))
-        gplt.polyplot(gdfs[1], ax=ax, facecolor='lightgrey', edgecolor='black', linewidth=0.1)
-        gplt.polyplot(gdfs[2], ax=ax, facecolor='lightblue', edgecolor='blue', linewidth=0.25)
+        ax = gplt.polyplot(gdfs[0], extent=extent, projection=gcrs.Mercator(), figsize=(20, 10), **mplStyle(LAYERS[0]))
+        for gdf, layer in zip(gdfs[1:], LAYERS[1:]):
+            gplt.polyplot(gdf, ax=ax, **mplStyle(layer))
 
     # Legend
 
-    buildings_in_handle = [mpatches.Rectangle((0, 0), 1, 1, facecolor='red')]
-    buildings_out_handle = [mpatches.Rectangle((0, 0), 1, 1, facecolor='lightgrey', edgecolor='black', linewidth=0.5)]
-    rivers_handle = [mpatches.Rectangle((0, 0), 1, 1, facecolor='lightblue',edgecolor='blue', linewidth=0.25)]
-
-    handles = buildings_in_handle + buildings_out_handle + rivers_handle
-    labels = ['Buildings within 500m (n=' + buildings_in_no + ')', 'Buildings outside 500m (n=' + buildings_out_no + ')', 'Rivers or streams (n=' + rivers_no + ')']
+    handles = mplHandles()
+    labels = legendLabels([len(gdf) for gdf in gdfs])
 
     ax.legend(handles, labels, title=None, title_fontsize=14, fontsize=18, loc='best', frameon=True, framealpha=1)
 
@@ -111,15 +109,26 @@ def renderFigure(*gdfs, basemap: bool=basemap, savefig: bool=savefig, db_name: s
         if not os.path.exists(outputdir + viz_type):
             os.makedirs(outputdir + viz_type)
 
-        plt.savefig(outputdir + viz_type + "geoplot (" + db_name + ").svg", format="svg", orientation="landscape")
+        saveMatplotlib(plt.gcf(), outputdir + viz_type + "geoplot (" + db_name + ")", output_format, decimals=decimals, compress=compress, orientation='landscape')
     else:
         pass
 
 
-if __name__ == "__main__":
+def main() -> None:
+    """Query PostGIS, prepare the layers and render, as when run as a script. Called by the mapcompare command, see mapcompare/cli.py.
+    """
+
+    global buildings_in, buildings_out, rivers, extent, basemap_kwargs
 
     buildings_in, buildings_out, rivers = sql2gdf(db_name, password)
 
     ((buildings_in, buildings_out, rivers), extent) = prepGDFs(buildings_in, buildings_out, rivers)
 
+    basemap_kwargs = basemapSource('geoplot', tile_cache)
+
     renderFigure(buildings_in, buildings_out, rivers)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -14,7 +14,11 @@ import numpy as np
 import geoviews as gv
 from geoviews import opts
 from bokeh.plotting import show
+from mapcompare.inputs import override
+from mapcompare.writers import saveHoloViews
+from mapcompare.tilecache import basemapSource
 from mapcompare.sql2gdf import sql2gdf
+from mapcompare.symbology import LAYERS, hvPolygonProxies
 from mapcompare.misc.pw import password
 from mapcompare.cProfile_viz import to_cProfile
 from cartopy import crs as ccrs
@@ -29,9 +33,12 @@ outputdir = "mapcompare/outputs/"
 viz_type = 'interactive/'
 
 # INPUTS
-db_name = 'dd_subset'
-basemap = True    
-savefig = False
+db_name = override('db_name', 'dd_subset')
+basemap = override('basemap', True)
+savefig = override('savefig', False)
+tile_cache = override('tile_cache', False) # basemap tiles from the tile cache, served by `mapcompare tiles` if interactive, see mapcompare/tilecache.py
+resources = override('resources', 'cdn') # load JS from the 'cdn' or 'inline', see mapcompare/writers.py
+compress = override('compress', False) # gzip HTML output to .html.gz
 
 
 def prepGDFs(*gdfs: GeoDataFrame) -> Tuple[Tuple[GeoDataFrame], int]:
@@ -98,26 +105,21 @@ def prepGDFs(*gdfs: GeoDataFrame) -> Tuple[Tuple[GeoDataFrame], int]:
 @to_cProfile
 def renderFigure(*gdfs: GeoDataFrame, basemap: bool=basemap, savefig: bool=savefig, db_name: str=db_name, viz_type: str=viz_type) -> None:
     
-    tiles = gv.tile_sources.OSM()
-    
+    tiles = basemap_source
+
     if basemap and viz_type == 'interactive/':
 
         # color_index=None makes GeoViews ignore the automatically identified 'use' values dimension according to which
         # a color scheme would otherwise be applied
-        buildings_in = gv.Polygons(gdfs[0], crs=ccrs.GOOGLE_MERCATOR).opts(tools=['hover'], color_index=None, color='red', xaxis=None, yaxis=None)
-        buildings_out = gv.Polygons(gdfs[1], crs=ccrs.GOOGLE_MERCATOR).opts(tools=['hover'], color_index=None, color='lightgrey')
-        rivers = gv.Polygons(gdfs[2], crs=ccrs.GOOGLE_MERCATOR).opts(color='lightblue')
+        buildings_in = gv.Polygons(gdfs[0], crs=ccrs.GOOGLE_MERCATOR).opts(tools=['hover'], color_index=None, color=LAYERS[0]['facecolor'], xaxis=None, yaxis=None)
+        buildings_out = gv.Polygons(gdfs[1], crs=ccrs.GOOGLE_MERCATOR).opts(tools=['hover'], color_index=None, color=LAYERS[1]['facecolor'])
+        rivers = gv.Polygons(gdfs[2], crs=ccrs.GOOGLE_MERCATOR).opts(color=LAYERS[2]['facecolor'])
 
         features = buildings_in * buildings_out * rivers * tiles
 
-        # Similar to matplotlib legend artists have to be declared separately
-        
-        popts = dict(show_legend=True, apply_ranges=False)
-        bldg_in_leg = gv.Polygons(buildings_in, label="Buildings within 500m of rivers/stream").opts(color_index=None, color='red', **popts)
-        bldg_out_leg = gv.Polygons(buildings_out, label="Buildings outside 500m of rivers/stream").opts(color_index=None, color='lightgrey', **popts)
-        rivers_leg = gv.Polygons(rivers, label="Rivers/streams").opts(color_index=None, color='lightblue', **popts)
-
-        legend = bldg_in_leg * bldg_out_leg * rivers_leg
+        # Similar to matplotlib legend artists have to be declared separately,
+        # using single-point proxies rather than the complete layers a second time
+        legend = hvPolygonProxies(gv, crs=ccrs.GOOGLE_MERCATOR)
 
         title = "Bokeh's hide/mute legend click policy yet to be exposed in GeoViews"
 
@@ -127,20 +129,15 @@ def renderFigure(*gdfs: GeoDataFrame, basemap: bool=basemap, savefig: bool=savef
     
     elif basemap == False and viz_type == 'interactive/':
 
-        buildings_in = gv.Polygons(gdfs[0], crs=ccrs.GOOGLE_MERCATOR).opts(tools=['hover'], color_index=None, color='red', xaxis=None, yaxis=None)
-        buildings_out = gv.Polygons(gdfs[1], crs=ccrs.GOOGLE_MERCATOR).opts(tools=['hover'], color_index=None, color='lightgrey')
-        rivers = gv.Polygons(gdfs[2], crs=ccrs.GOOGLE_MERCATOR).opts(color='lightblue')
+        buildings_in = gv.Polygons(gdfs[0], crs=ccrs.GOOGLE_MERCATOR).opts(tools=['hover'], color_index=None, color=LAYERS[0]['facecolor'], xaxis=None, yaxis=None)
+        buildings_out = gv.Polygons(gdfs[1], crs=ccrs.GOOGLE_MERCATOR).opts(tools=['hover'], color_index=None, color=LAYERS[1]['facecolor'])
+        rivers = gv.Polygons(gdfs[2], crs=ccrs.GOOGLE_MERCATOR).opts(color=LAYERS[2]['facecolor'])
         
         features = buildings_in * buildings_out * rivers
 
-        # Similar to matplotlib legend artists have to be declared separately
-        
-        popts = dict(show_legend=True, apply_ranges=False)
-        bldg_in_leg = gv.Polygons(gdfs[0], label="Buildings within 500m of rivers/stream").opts(color_index=None, color='red', **popts)
-        bldg_out_leg = gv.Polygons(gdfs[1], label="Buildings outside 500m of rivers/stream").opts(color_index=None, color='lightgrey', **popts)
-        rivers_leg = gv.Polygons(gdfs[2], label="Rivers/streams").opts(color_index=None, color='lightblue', **popts)
-
-        legend = bldg_in_leg * bldg_out_leg * rivers_leg
+        # Similar to matplotlib legend artists have to be declared separately,
+        # using single-point proxies rather than the complete layers a second time
+        legend = hvPolygonProxies(gv, crs=ccrs.GOOGLE_MERCATOR)
 
         title = "Bokeh's hide/mute legend click policy yet to be exposed in GeoViews"
 
@@ -181,21 +178,30 @@ def renderFigure(*gdfs: GeoDataFrame, basemap: bool=basemap, savefig: bool=savef
         if not os.path.exists(outputdir + viz_type):
             os.makedirs(outputdir + viz_type)
 
-        gv.save(layout, outputdir + viz_type + "geoviews (" + db_name + ").html")
+        saveHoloViews(layout, outputdir + viz_type + "geoviews (" + db_name + ")", resources=resources, compress=compress)
     
     elif savefig and viz_type == 'static/':
         if not os.path.exists(outputdir + viz_type):
             os.makedirs(outputdir + viz_type)
         
-        gv.save(layout, outputdir + viz_type + "geoviews (" + db_name + ").svg", dpi=600, backend='matplotlib')
+        saveHoloViews(layout, outputdir + viz_type + "geoviews (" + db_name + ")", fmt='svg', dpi=600, backend='matplotlib')
     
 
-if __name__ == "__main__":
+def main() -> None:
+    """Query PostGIS, prepare the layers and render, as when run as a script. Called by the mapcompare command, see mapcompare/cli.py.
+    """
+
+    global buildings_in, buildings_out, rivers, zoom, basemap_source
 
     buildings_in, buildings_out, rivers = sql2gdf(db_name, password)
 
     ((buildings_in, buildings_out, rivers), zoom) = prepGDFs(buildings_in, buildings_out, rivers)
 
+    basemap_source = basemapSource('geoviews' if viz_type == 'interactive/' else 'geoviews_matplotlib', tile_cache)
+
     renderFigure(buildings_in, buildings_out, rivers)
 
-    
\ No newline at end of file
+
+if __name__ == "__main__":
+
+    main()
@@ -25,8 +25,14 @@ import geopandas as gpd # for type hinting only
 import numpy as np # for type hinting only
 import datashader as ds
 from bokeh.plotting import show
+from mapcompare.inputs import override
+from mapcompare.writers import saveHoloViews
+from mapcompare.tilecache import basemapSource
+from mapcompare.warmup import warmup as warmupKernels
 from mapcompare.cProfile_viz import to_cProfile
-from mapcompare.sql2gdf import sql2gdf
+from mapcompare.sql2gdf import sql2gdf, sourceFingerprint, timer
+from mapcompare.spatialparquet import loadParquet, totalBounds
+from mapcompare.symbology import hvPointsLegend
 from mapcompare.misc.pw import password
 from holoviews.operation.datashader import (
     datashade, inspect_polygons
@@ -40,9 +46,14 @@ outputdir = 'mapcompare/outputs/'
 viz_type = 'interactive/' # not adjustable
 
 # INPUTS
-db_name = 'dd_subset'
-basemap = True
-savefig = False
+db_name = override('db_name', 'dd_subset')
+basemap = override('basemap', True)
+savefig = override('savefig', False)
+tile_cache = override('tile_cache', False) # basemap tiles from the tile cache, served by `mapcompare tiles` to the browser, see mapcompare/tilecache.py
+resources = override('resources', 'cdn') # load JS from the 'cdn' or 'inline', see mapcompare/writers.py
+compress = override('compress', False) # gzip HTML output to .html.gz
+parquet = override('parquet', False) # read a Hilbert-sorted, spatially partitioned Parquet dataset lazily with dask, see mapcompare/spatialparquet.py
+warmup = override('warmup', False) # compile the kernels on a tiny synthetic frame ahead of renderFigure()
 
 
 def prepGDFs(*gdfs: gpd.GeoDataFrame) -> Tuple[GeoDataFrame, np.float64]:
@@ -73,13 +84,31 @@ def prepGDFs(*gdfs: gpd.GeoDataFrame) -> Tuple[GeoDataFrame, np.float64]:
     return spatialpdGDF, aspect_ratio
 
 
+@timer
+def prepParquet(db_name: str=db_name) -> Tuple[GeoDataFrame, np.float64]:
+    """Open the spatially partitioned Parquet dataset, writing it first from PostGIS if it does not exist yet.
+
+    This step is separated from actual rendering to not affect performance measurement.
+    """
+
+    categories = ['Buildings within 500m of river/stream', 'Buildings outside 500m of river/stream', 'River/stream']
+
+    spatialpdGDF = loadParquet(db_name, 3857, categories, lambda: prepGDFs(*sql2gdf(db_name, password))[0],
+                               fingerprint=sourceFingerprint(db_name, password))
+
+    extent = totalBounds(spatialpdGDF)
+    aspect_ratio = (extent[1] - extent[0]) / (extent[3] - extent[2])
+
+    return spatialpdGDF, aspect_ratio
+
+
 @to_cProfile
 def renderFigure(spatialpdGDF: GeoDataFrame, basemap: bool=basemap, savefig: bool=savefig, db_name: str=db_name, viz_type: str=viz_type) -> None:
     """Renders the figure reproducing the map template.
 
     Parameters
     ----------
-    spatialpdGDF : SpatialPandas GeoDataFrame
+    spatialpdGDF : SpatialPandas GeoDataFrame or DaskGeoDataFrame
         GeoDataFrame containing all three feature sets.
     basemap : Boolean
         Global scope variable determining whether or not to add an OSM basemap.
@@ -97,9 +126,7 @@ def renderFigure(spatialpdGDF: GeoDataFrame, basemap: bool=basemap, savefig: boo
 
     color_key = {'Buildings within 500m of river/stream': 'red', 'Buildings outside 500m of river/stream': 'grey', 'River/stream': 'lightblue'}
 
-    legend    = gv.NdOverlay({k: gv.Points([0,0], label=str(k)).opts(
-                                            color=v, apply_ranges=False) 
-                            for k, v in color_key.items()}, 'category')
+    legend = hvPointsLegend(gv, color_key)
 
     polys = gv.Polygons(spatialpdGDF, crs=ccrs.GOOGLE_MERCATOR, vdims='category')
 
@@ -108,7 +135,7 @@ def renderFigure(spatialpdGDF: GeoDataFrame, basemap: bool=basemap, savefig: boo
 
     if basemap:
 
-        tiles = gv.tile_sources.OSM().opts(
+        tiles = basemap_source.opts(
         min_height=500, responsive=True, xaxis=None, yaxis=None)
 
         layout = tiles * shaded * hover * legend
@@ -133,25 +160,35 @@ def renderFigure(spatialpdGDF: GeoDataFrame, basemap: bool=basemap, savefig: boo
         if not os.path.exists(outputdir + viz_type):
             os.makedirs(outputdir + viz_type)
         
-        gv.save(layout, outputdir + viz_type + "geoviews+datashader+bokeh" + " (" + db_name + ").html")
+        saveHoloViews(layout, outputdir + viz_type + "geoviews+datashader+bokeh" + " (" + db_name + ")", resources=resources, compress=compress)
     else:
         pass
     
 
-if __name__ == "__main__":
+def main() -> None:
+    """Query PostGIS, prepare the layers and render, as when run as a script. Called by the mapcompare command, see mapcompare/cli.py.
+    """
 
-    buildings_in, buildings_out, rivers = sql2gdf(db_name, password)
+    global spatialpdGDF, aspect_ratio, buildings_in, buildings_out, rivers, basemap_source
 
-    spatialpdGDF, aspect_ratio = prepGDFs(buildings_in, buildings_out, rivers)
+    if warmup:
+        print("Warmed up datashader's kernels in {:.2f} secs".format(warmupKernels(['Buildings outside 500m of river/stream', 'Buildings within 500m of river/stream', 'River/stream'])))
 
-    renderFigure(spatialpdGDF)
+    if parquet:
 
-    
+        spatialpdGDF, aspect_ratio = prepParquet()
 
+    else:
 
+        buildings_in, buildings_out, rivers = sql2gdf(db_name, password)
 
+        spatialpdGDF, aspect_ratio = prepGDFs(buildings_in, buildings_out, rivers)
 
+    basemap_source = basemapSource('geoviews', tile_cache)
 
+    renderFigure(spatialpdGDF)
 
 
+if __name__ == "__main__":
 
+    main()
@@ -10,7 +10,11 @@ This is to avoid tile loading or writing to disk affecting performance measureme
 import os
 from geopandas import GeoDataFrame
 import hvplot.pandas
+import holoviews as hv
 from IPython.display import display
+from mapcompare.inputs import override
+from mapcompare.writers import saveHoloViews
+from mapcompare.tilecache import basemapSource
 from mapcompare.sql2gdf import sql2gdf
 from mapcompare.misc.pw import password
 from mapcompare.cProfile_viz import to_cProfile
@@ -19,9 +23,12 @@ outputdir = "mapcompare/outputs/"
 viz_type = 'interactive/'
 
 # INPUTS
-db_name = 'dd_subset'
-basemap = True
-savefig = False
+db_name = override('db_name', 'dd_subset')
+basemap = override('basemap', True)
+savefig = override('savefig', False)
+tile_cache = override('tile_cache', False) # basemap tiles from the tile cache, served by `mapcompare tiles` to the browser, see mapcompare/tilecache.py
+resources = override('resources', 'cdn') # load JS from the 'cdn' or 'inline', see mapcompare/writers.py
+compress = override('compress', False) # gzip HTML output to .html.gz
 
 
 def prepGDFs(*gdfs: GeoDataFrame) -> GeoDataFrame:
@@ -68,7 +75,7 @@ def renderFigure(merged: GeoDataFrame, basemap: bool=basemap, savefig: bool=save
     if basemap:
 
         plot = (
-        merged.hvplot(geo=True, cmap=['red', 'lightgrey', 'lightblue'], tiles='OSM', hover_cols=['Legend', 'Building use'], xaxis=None, yaxis=None, legend='top_right', height=500)
+        merged.hvplot(geo=True, cmap=['red', 'lightgrey', 'lightblue'], tiles=basemap_source, hover_cols=['Legend', 'Building use'], xaxis=None, yaxis=None, legend='top_right', height=500)
         )
 
     elif not basemap:
@@ -81,19 +88,28 @@ def renderFigure(merged: GeoDataFrame, basemap: bool=basemap, savefig: bool=save
         if not os.path.exists(outputdir + viz_type):
             os.makedirs(outputdir + viz_type)
 
-        hvplot.save(plot, outputdir + viz_type + "hvPlot (" + db_name + ").html")
+        saveHoloViews(plot, outputdir + viz_type + "hvPlot (" + db_name + ")", resources=resources, compress=compress)
 
     # Calling display() here for plot to show in VSCode-Python.
     # This only works occasionally wherease "return plot" does not work at all, though it allegedly works in an actual Jupyter Notebook:
     # https://stackoverflow.com/questions/65907096/hvplot-call-inside-function-does-not-display-in-jupyter-notebook
     display(plot)
 
-if __name__ == "__main__":
+def main() -> None:
+    """Query PostGIS, prepare the layers and render, as when run as a script. Called by the mapcompare command, see mapcompare/cli.py.
+    """
+
+    global merged, buildings_in, buildings_out, rivers, basemap_source
 
     buildings_in, buildings_out, rivers = sql2gdf(db_name, password)
 
     merged = prepGDFs(buildings_in, buildings_out, rivers)
 
+    basemap_source = basemapSource('hvplot', tile_cache)
+
     renderFigure(merged)
 
 
+if __name__ == "__main__":
+
+    main()
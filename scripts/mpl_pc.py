@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+"""Plot figure by adding one flattened PathCollection per figure directly to a matplotlib GeoAxes.
+
+Unlike GeoPandas' .plot(), cartopy's .add_geometries() or geoplot's polyplot(), no patch is created per geometry.
+Instead each layer's ring coordinates are converted in bulk into compound Paths (see mapcompare/flatpaths.py).
+
+Create a cProfile of the renderFigure() function encompassing the core plotting task.
+The cProfile is dumped as a .prof in mapcompare/profiles/[viz_type]/[db_name]/) only if basemap=False and savefig=False.
+This is to avoid tile loading or writing to disk affecting performance measurement of the core plotting task.
+"""
+
+import os
+import sys
+import importlib
+from typing import List
+from geopandas.geodataframe import GeoDataFrame
+import numpy as np
+import contextily as ctx
+import matplotlib.pyplot as plt
+from cartopy import crs as ccrs
+from mapcompare.inputs import override
+from mapcompare.writers import saveMatplotlib
+from mapcompare.tilecache import basemapSource
+from mapcompare.sql2gdf import sql2gdf
+from mapcompare.flatpaths import layers2collection
+from mapcompare.simplify import simplifyLayers
+from mapcompare.symbology import LAYERS, mplHandles, legendLabels
+from mapcompare.misc.pw import password
+import requests
+if 'mapcompare.cProfile_viz' in sys.modules:
+    importlib.reload(sys.modules['mapcompare.cProfile_viz']) # no kernel/IDE restart needed after editing cProfile_viz.py
+from mapcompare.cProfile_viz import to_cProfile
+
+outputdir = 'mapcompare/outputs/'
+viz_type = 'static/' # non-adjustable
+
+# INPUTS
+db_name = override('db_name', 'dd_subset')
+basemap = override('basemap', True)
+savefig = override('savefig', False)
+tile_cache = override('tile_cache', False) # serve basemap tiles from the local tile cache, see mapcompare/tilecache.py
+output_format = override('output_format', 'svg') # or 'svg_raster', 'png', 'webp', see mapcompare/writers.py
+decimals = override('decimals', None, int) # decimals of SVG path coordinates, e.g. 1
+compress = override('compress', False) # gzip SVG output to .svgz
+ragged = override('ragged', False) # fetch layers as RaggedGeometry arrays instead of GeoDataFrames, see mapcompare/ragged.py
+simplify_px = override('simplify_px', None, float) # simplify to a tolerance in pixels of the 20in wide figure, e.g. 0.5, see mapcompare/simplify.py
+profile_suffix = ('_ragged' if ragged else '') + ('_simplified' if simplify_px is not None else '') # keeps cProfiles of all inputs apart
+
+
+def getExtent(*gdfs: GeoDataFrame) -> List[np.float64]:
+    """Return combined bbox of all GDFs in cartopy set_extent format (x0, x1, y0, y1).
+
+    This step is separated from actual rendering to not affect performance measurement.
+    """
+
+    list_of_bounds = [gdf.total_bounds for gdf in gdfs]
+
+    xmin = np.min([item[0] for item in list_of_bounds])
+    xmax = np.max([item[2] for item in list_of_bounds])
+    ymin = np.min([item[1] for item in list_of_bounds])
+    ymax = np.max([item[3] for item in list_of_bounds])
+
+    extent = [xmin, xmax, ymin, ymax]
+
+    return extent
+
+
+@to_cProfile
+def renderFigure(*gdfs, basemap: bool=basemap, savefig: bool=savefig, db_name: str=db_name, viz_type: str=viz_type) -> None:
+    """Renders the figure reproducing the map template.
+
+    Parameters
+    ----------
+    buildings_in, buildings_out, rivers : GeoDataframes or RaggedGeometry
+        The three feature sets styled and added to the figure as a single PathCollection.
+    basemap : Boolean
+        Global scope variable determining whether or not to add an OSM basemap.
+    savefig : Boolean
+        Global scope variable determining whether or not to save the current figure to SVG in /mapcompare/outputs/[viz_type]
+    db_name : {'dd', 'dd_subset'}
+        Global scope variable indicating the source PostGIS database to be used, 'dd' being the complete dataset and 'dd_subset' the subset.
+    viz_type : {'static/', 'interactive/'}
+        Global scope variable indicating the visualisation type.
+
+    Returns
+    ----------
+        A figure reproducing the map template.
+    """
+
+    crs = ccrs.UTM(33)
+
+    fig, ax = plt.subplots(1, 1, subplot_kw={'projection': crs}, figsize=(20, 10))
+
+    ax.set_extent(extent, crs=crs)
+    ax.set_title("Matplotlib interface: flattened PathCollection" + "\n", fontsize=20)
+
+    # Add features to Axes as one artist, styled per layer as in gpd.py
+    # Source and target CRS are both UTM 33, hence the collection can use the GeoAxes' transData as is
+
+    ax.add_collection(layers2collection(gdfs, LAYERS))
+
+    if basemap:
+        # RaggedGeometry stores its CRS as a string already
+        basemap_crs = rivers.crs if ragged else rivers.crs.to_string()
+        try:
+            ctx.add_basemap(ax, crs=basemap_crs, source=basemap_source)
+        except requests.HTTPError:
+            print("Contextily: No tiles found. Zoom level likely too high. Setting zoom level to 13.")
+            ctx.add_basemap(ax, zoom=13, crs=basemap_crs, source=basemap_source)
+    else:
+        pass
+
+    # Legend
+
+    handles = mplHandles()
+    labels = legendLabels([len(gdf) for gdf in gdfs])
+
+    ax.legend(handles, labels, title=None, title_fontsize=14, fontsize=18, loc='best', frameon=True, framealpha=1)
+
+    # draw() included as for cartopy, since the collection is only rasterised on draw
+    fig.canvas.draw()
+
+    if savefig:
+        if not os.path.exists(outputdir + viz_type):
+            os.makedirs(outputdir + viz_type)
+
+        saveMatplotlib(plt.gcf(), outputdir + viz_type + "pathcollection (" + db_name + ")", output_format, decimals=decimals, compress=compress, orientation='landscape')
+    else:
+        pass
+
+
+def main() -> None:
+    """Query PostGIS, prepare the layers and render, as when run as a script. Called by the mapcompare command, see mapcompare/cli.py.
+    """
+
+    global extent, buildings_in, buildings_out, rivers, basemap_source
+
+    if simplify_px is not None:
+        layers = simplifyLayers(sql2gdf(db_name, password, ragged=True), db_name, width=20 * plt.rcParams['figure.dpi'], pixels=simplify_px)
+        buildings_in, buildings_out, rivers = layers if ragged else [layer.toGeoDataFrame() for layer in layers]
+    else:
+        buildings_in, buildings_out, rivers = sql2gdf(db_name, password, ragged=ragged)
+
+    extent = getExtent(buildings_in, buildings_out, rivers)
+
+    basemap_source = basemapSource('contextily', tile_cache)
+
+    renderFigure(buildings_in, buildings_out, rivers)
+
+
+if __name__ == "__main__":
+
+    main()
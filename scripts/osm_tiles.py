@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+"""Prefetch the OSM basemap tiles of a database's extent into the tile cache served to the scripts and apps if tile_cache=True.
+
+Zoom levels range from the level showing the whole extent, computed like get_zoom_mercator() in gv.py, to extra_zooms
+levels beyond it, e.g. for zooming in on the interactive figures. See mapcompare/tilecache.py.
+"""
+
+import numpy as np
+from mapcompare.inputs import override
+from mapcompare.sql2gdf import sql2gdf, timer
+from mapcompare.tilecache import TileCache, zoomMercator
+from mapcompare.misc.pw import password
+
+# INPUTS
+db_name = override('db_name', 'dd')
+extra_zooms = override('extra_zooms', 2) # zoom levels beyond the one showing the whole extent
+workers = 2 # concurrent downloads, the maximum allowed by OSM's tile usage policy
+
+
+@timer
+def prefetchTiles(db_name: str=db_name) -> None:
+    """Fetch all tiles of the database's extent not yet in mapcompare/temp/tiles/osm/.
+    """
+
+    gdfs = sql2gdf(db_name, password)
+
+    def bbox(crs):
+        bounds = np.array([gdf.to_crs(epsg=crs).total_bounds for gdf in gdfs])
+        return [bounds[:, 0].min(), bounds[:, 2].max(), bounds[:, 1].min(), bounds[:, 3].max()]
+
+    zoom = zoomMercator(bbox(4326))
+    zooms = range(max(0, zoom - 1), zoom + extra_zooms + 1)
+
+    cache = TileCache()
+    fetched = cache.prefetch(bbox(3857), zooms, workers=workers)
+
+    print("Fetched {} tiles at zoom levels {}-{}".format(fetched, zooms[0], zooms[-1]))
+
+
+def main() -> None:
+    """Prefetch the tiles, as when run as a script. Called by the mapcompare command, see mapcompare/cli.py.
+    """
+
+    prefetchTiles()
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+"""Compare write time and file size of the savefig output strategies across libraries (see mapcompare/writers.py).
+
+Each library is rendered with savefig=True and basemap=False once per output strategy applicable to it, via the render
+matrix (see mapcompare/matrix.py). Jobs run one at a time by default, so that write times are not skewed by concurrent jobs.
+The resulting table is saved to mapcompare/outputs/[date] [db_name] output comparison.csv.
+"""
+
+from datetime import datetime
+import pandas as pd
+from mapcompare.inputs import override
+from mapcompare.matrix import runMatrix
+
+# INPUTS
+db_name = override('db_name', 'dd_subset')
+workers = override('workers', 1)
+
+outputdir = 'mapcompare/outputs/'
+
+# libraries by output strategy, the first strategy of each being the scripts' default
+STATIC = ['gpd', 'carto', 'gplt', 'mpl_pc']
+INTERACTIVE = ['bkh', 'gv', 'gv_ds', 'hv_plot', 'plotly_py']
+
+STRATEGIES = {
+    'static': [
+        {'output_format': 'svg'},
+        {'output_format': 'svg', 'decimals': 1},
+        {'output_format': 'svg', 'decimals': 1, 'compress': True},
+        {'output_format': 'svg_raster'},
+        {'output_format': 'png'},
+        {'output_format': 'webp'}
+    ],
+    'interactive': [
+        {'resources': 'cdn'},
+        {'resources': 'inline'},
+        {'resources': 'cdn', 'compress': True}
+    ]
+}
+
+# coordinate precision applies to the GeoJSON written by Bokeh and Plotly only
+DECIMALS = {'bkh': 1, 'plotly_py': 5}
+
+
+def outputJobs(db_name: str=db_name) -> list:
+    """Return one savefig job per library and applicable output strategy.
+    """
+
+    jobs = []
+
+    for lib in STATIC + INTERACTIVE:
+        strategies = STRATEGIES['static' if lib in STATIC else 'interactive']
+
+        if lib in DECIMALS:
+            strategies = strategies + [{'resources': 'cdn', 'decimals': DECIMALS[lib]}]
+
+        jobs += [dict(lib=lib, db=db_name, basemap=False, savefig=True, options=options) for options in strategies]
+
+    return jobs
+
+
+def main() -> None:
+    """Run the jobs and save the comparison table, as when run as a script. Called by the mapcompare command, see mapcompare/cli.py.
+    """
+
+    results = runMatrix(outputJobs(), workers=workers)
+
+    table = pd.DataFrame({
+        'library': results['lib'],
+        'strategy': results['options'],
+        'status': results['status'],
+        'write (secs)': results.get('write'),
+        'render incl. write (secs)': results.get('render'),
+        'size (MB)': results['output_bytes'] / 2**20
+    }).round(2)
+
+    print(table.to_string(index=False))
+
+    table.to_csv(outputdir + datetime.today().strftime('%Y-%m-%d') + ' ' + db_name + ' output comparison.csv', index=False)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+"""Plot figure from triangle meshes drawn by plotly.py's WebGL Mesh3d trace, viewed top-down, without basemap.
+
+Bokeh's WebGL backend does not accelerate the Patches glyph (see bkh_webgl (not included).py), nor does any other
+backend draw 144k polygons at interactive frame rates. Instead, each layer is triangulated once (see
+mapcompare/triangulate.py) and drawn as one Mesh3d trace, i.e. one WebGL draw call, with the outlines of a layer
+as one NaN-separated line trace. The orthographic camera looks straight down, with panning as the default drag mode.
+
+Create a cProfile of the renderFigure() function encompassing the core plotting task.
+The cProfile is dumped as a .prof in mapcompare/profiles/[viz_type]/[db_name]/) only if savefig=False.
+This is to avoid writing to disk affecting performance measurement of the core plotting task.
+"""
+
+import os
+import sys
+import importlib
+from typing import List
+import numpy as np
+import plotly.graph_objects as go
+from mapcompare.inputs import override
+from mapcompare.writers import savePlotly
+from mapcompare.sql2gdf import sql2gdf, timer
+from mapcompare.ragged import RaggedGeometry
+from mapcompare.symbology import LAYERS
+from mapcompare.triangulate import cachedTriangles, outlines, benchmarkTriangulation
+from mapcompare.simplify import simplifyLayers
+from mapcompare.misc.pw import password
+if 'mapcompare.cProfile_viz' in sys.modules:
+    importlib.reload(sys.modules['mapcompare.cProfile_viz']) # no kernel/IDE restart needed after editing cProfile_viz.py
+from mapcompare.cProfile_viz import to_cProfile
+
+outputdir = 'mapcompare/outputs/'
+viz_type = 'interactive/' # non-adjustable
+basemap = False # non-adjustable
+
+# INPUTS
+db_name = override('db_name', 'dd_subset')
+savefig = override('savefig', False)
+resources = override('resources', 'inline') # load JS from the 'cdn' or 'inline', see mapcompare/writers.py
+compress = override('compress', False) # gzip HTML output to .html.gz
+benchmark_triangulation = override('benchmark_triangulation', False) # time the triangulation of each layer uncached and write it to mapcompare/outputs/
+simplify_px = override('simplify_px', None, float) # simplify to a tolerance in pixels of a 1200px wide browser window, e.g. 0.5, see mapcompare/simplify.py
+profile_suffix = '_simplified' if simplify_px is not None else '' # keeps cProfiles of both inputs apart
+
+
+@timer
+def prepMeshes(*layers: RaggedGeometry) -> List[dict]:
+    """Triangulate the layers, or load their triangles from the cache, and collect the outlines of the outlined layers.
+
+    This step is separated from actual rendering to not affect performance measurement.
+    """
+
+    meshes = []
+
+    for name, layer, style in zip(('buildings_in', 'buildings_out', 'rivers'), layers, LAYERS):
+        vertices, triangles, _ = cachedTriangles(layer, db_name + profile_suffix + ' ' + name)
+
+        mesh = dict(label=style['label'] + ' (n=' + str(len(layer)) + ')', color=style['facecolor'], vertices=vertices, triangles=triangles)
+
+        if style['edgecolor'] != 'none':
+            mesh['outlines'] = outlines(layer)
+            mesh['edgecolor'] = style['edgecolor']
+
+        meshes.append(mesh)
+
+    return meshes
+
+
+@to_cProfile
+def renderFigure(meshes: List[dict], basemap: bool=basemap, savefig: bool=savefig, db_name: str=db_name, viz_type: str=viz_type) -> None:
+    """Renders the figure reproducing the map template.
+
+    Parameters
+    ----------
+    meshes : list of dict
+        Vertices, triangles, outlines and style per layer, as returned by prepMeshes().
+    basemap : Boolean
+        Not adjustable, as Mesh3d traces cannot be drawn over a map.
+    savefig : Boolean
+        Global scope variable determining whether or not to save the current figure to HTML in /mapcompare/outputs/[viz_type]/.
+    db_name : {'dd', 'dd_subset'}
+        Global scope variable indicating the source PostGIS database to be used, 'dd' being the complete dataset and 'dd_subset' the subset.
+    viz_type : {'static/', 'interactive/'}
+        Global scope variable indicating the visualisation type.
+
+    Returns
+    ----------
+        A figure reproducing the map template.
+    """
+
+    title = 'Click on a legend entry to hide/unhide features'
+
+    fig = go.Figure()
+
+    for mesh in meshes:
+        vertices, triangles = mesh['vertices'], mesh['triangles']
+
+        # unlit, i.e. flat colours as seen from above
+        fig.add_trace(go.Mesh3d(x=vertices[:, 0], y=vertices[:, 1], z=np.zeros(len(vertices), dtype=np.float32),
+                                i=triangles[:, 0], j=triangles[:, 1], k=triangles[:, 2], color=mesh['color'], name=mesh['label'],
+                                legendgroup=mesh['label'], showlegend=True, hoverinfo='skip', flatshading=True,
+                                lighting=dict(ambient=1, diffuse=0, specular=0, roughness=1, fresnel=0)))
+
+        if 'outlines' in mesh:
+            xs, ys = mesh['outlines']
+            fig.add_trace(go.Scatter3d(x=xs, y=ys, z=np.zeros(len(xs), dtype=np.float32), mode='lines', line=dict(color=mesh['edgecolor'], width=1),
+                                       legendgroup=mesh['label'], showlegend=False, hoverinfo='skip'))
+
+    hidden = dict(visible=False, showspikes=False)
+
+    fig.update_layout(margin={"r": 0, "t": 20, "l": 0, "b": 0}, title_text=title, title_font_size=12, dragmode='pan',
+                      scene=dict(xaxis=hidden, yaxis=hidden, zaxis=hidden, aspectmode='data', dragmode='pan',
+                                 camera=dict(projection=dict(type='orthographic'), eye=dict(x=0, y=0, z=1), up=dict(x=0, y=1, z=0))))
+
+    fig.show()
+
+    if savefig:
+        if not os.path.exists(outputdir + viz_type):
+            os.makedirs(outputdir + viz_type)
+
+        savePlotly(fig, outputdir + viz_type + "plotly_gl (" + db_name + ")", resources=resources, compress=compress)
+
+    else:
+        pass
+
+
+def main() -> None:
+    """Query PostGIS, prepare the layers and render, as when run as a script. Called by the mapcompare command, see mapcompare/cli.py.
+    """
+
+    global buildings_in, buildings_out, rivers, meshes
+
+    buildings_in, buildings_out, rivers = sql2gdf(db_name, password, ragged=True)
+
+    if simplify_px is not None:
+        buildings_in, buildings_out, rivers = simplifyLayers((buildings_in, buildings_out, rivers), db_name, width=1200, pixels=simplify_px)
+
+    if benchmark_triangulation:
+        benchmark = benchmarkTriangulation({'buildings_in': buildings_in, 'buildings_out': buildings_out, 'rivers': rivers})
+        print(benchmark.to_string(index=False))
+
+        if not os.path.exists(outputdir):
+            os.makedirs(outputdir)
+
+        benchmark.to_csv(outputdir + "triangulation (" + db_name + ").csv", index=False)
+
+    meshes = prepMeshes(buildings_in, buildings_out, rivers)
+
+    renderFigure(meshes)
+
+
+if __name__ == "__main__":
+
+    main()
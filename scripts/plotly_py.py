@@ -13,6 +13,9 @@ from typing import Tuple
 from geopandas import GeoDataFrame
 import numpy as np
 import plotly.express as px
+from mapcompare.inputs import override
+from mapcompare.writers import roundGeometries, savePlotly
+from mapcompare.tilecache import basemapSource
 from mapcompare.sql2gdf import sql2gdf
 from mapcompare.misc.pw import password
 from mapcompare.cProfile_viz import to_cProfile
@@ -21,9 +24,13 @@ outputdir = 'mapcompare/outputs/'
 viz_type = 'interactive/' # type non-adjustable
 
 # INPUTS
-db_name = 'dd_subset'
-basemap = True
-savefig = False
+db_name = override('db_name', 'dd_subset')
+basemap = override('basemap', True)
+savefig = override('savefig', False)
+tile_cache = override('tile_cache', False) # basemap tiles from the tile cache, served by `mapcompare tiles` to the browser, see mapcompare/tilecache.py
+resources = override('resources', 'inline') # load JS from the 'cdn' or 'inline', see mapcompare/writers.py
+decimals = override('decimals', None, int) # decimals of the projected coordinates written to HTML, e.g. 5
+compress = override('compress', False) # gzip HTML output to .html.gz
 
 
 def prepGDFs(*gdfs: GeoDataFrame) -> Tuple[GeoDataFrame, int, np.float64, np.float64, str]:
@@ -57,6 +64,9 @@ def prepGDFs(*gdfs: GeoDataFrame) -> Tuple[GeoDataFrame, int, np.float64, np.flo
         return round(min(lon_zoom, lat_zoom))
 
     buildings_in, buildings_out, rivers = [gdf.to_crs(epsg=4326) for gdf in gdfs]
+
+    if decimals is not None:
+        buildings_in, buildings_out, rivers = [roundGeometries(gdf, decimals) for gdf in (buildings_in, buildings_out, rivers)]
     
     # Plotly does not seem to allow for adding multiple GDFs to the same figure successively (?)
     # Therefore, create Legend column in each GDF prior to GDF merge
@@ -131,10 +141,10 @@ def renderFigure(merged: GeoDataFrame, zoom: int, centerx: np.float64, centery:
         fig = px.choropleth_mapbox(merged, geojson=geojson, locations=merged['id'], title=title, color=merged['Legend'], color_discrete_map={
         'Building within 500m of river/stream':'red',
         'Building outside 500m of river/stream':'lightgrey',
-        'River/stream':'lightblue'}, hover_data={'id': False, 'Legend': False, 'Building use':True}, mapbox_style="open-street-map", center={'lat': centery, 'lon': centerx}, zoom=zoom, featureidkey='properties.id')
+        'River/stream':'lightblue'}, hover_data={'id': False, 'Legend': False, 'Building use':True}, center={'lat': centery, 'lon': centerx}, zoom=zoom, featureidkey='properties.id')
         
         fig.update_geos(projection_type="mercator")
-        fig.update_layout(margin={"r":0,"t":20,"l":0,"b":0}, title_text=title, title_font_size=12)
+        fig.update_layout(margin={"r":0,"t":20,"l":0,"b":0}, title_text=title, title_font_size=12, **basemap_source)
     
     else:
         # Plot without tile map using px.choropleth() which does not require
@@ -154,16 +164,27 @@ def renderFigure(merged: GeoDataFrame, zoom: int, centerx: np.float64, centery:
         if not os.path.exists(outputdir + viz_type):
             os.makedirs(outputdir + viz_type)
 
-        fig.write_html(outputdir + viz_type + "plotly_py (" + db_name + ").html")
+        savePlotly(fig, outputdir + viz_type + "plotly_py (" + db_name + ")", resources=resources, compress=compress)
     
     else:
         pass
     
     
-if __name__ == "__main__":
-    
+def main() -> None:
+    """Query PostGIS, prepare the layers and render, as when run as a script. Called by the mapcompare command, see mapcompare/cli.py.
+    """
+
+    global buildings_in, buildings_out, rivers, merged, zoom, centerx, centery, tempdir, basemap_source
+
     buildings_in, buildings_out, rivers = sql2gdf(db_name, password)
 
     merged, zoom, centerx, centery, tempdir = prepGDFs(buildings_in, buildings_out, rivers)
 
-    renderFigure(merged, zoom, centerx, centery)
\ No newline at end of file
+    basemap_source = basemapSource('plotly', tile_cache)
+
+    renderFigure(merged, zoom, centerx, centery)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -14,10 +14,14 @@ from datetime import datetime
 import matplotlib.pyplot as plt
 import docx # uncomment last section below to save dataframe to docx
 from mapcompare.cProfile_viz import num_times
+from mapcompare.benchstore import profileTimes, recordProfiles
+from mapcompare.benchstats import pairwise, summarise
 
 # INPUTS
 viz_type = 'static/'
 db_name = 'dd_subset'
+robust = True # plot the median of warm runs without outliers with its bootstrap 95% CI instead of mean and std of all runs, see mapcompare/benchstats.py
+record = True # record the profiles as a run in the benchmark store, see mapcompare/benchstore.py and `mapcompare compare`
 
 profiledir = 'mapcompare/profiles/' + viz_type + db_name + "/"
 
@@ -76,11 +80,27 @@ if __name__ == "__main__":
 
     df1['std'] = df.groupby('library', as_index=False)['cumtime'].std()['cumtime'].round(decimals=3)
 
+    y, yerr, title = 'mean', list(df1['std']), "cProfile: mean cumulative CPU runtime ("+ str(num_times) + ' runs)'
+
+    if robust:
+
+        # datashader's first run, i.e. its JIT compilation, reported apart from warm runs
+        times = profileTimes(profiledir)
+        df1 = summarise(times).rename(columns={'lib': 'library'})
+        y, yerr, title = 'median', [list(df1['median'] - df1['ci_low']), list(df1['ci_high'] - df1['median'])], "cProfile: median cumulative CPU runtime of warm runs (95% CI)"
+
+        pairs = pairwise(times)
+        print(df1.round(3).to_string(index=False))
+        print(pairs.round(3).to_string(index=False))
+
+        df1.to_csv(profiledir + datetime.today().strftime('%Y-%m-%d') + ' ' + db_name + ' summary.csv', index=False)
+        pairs.to_csv(profiledir + datetime.today().strftime('%Y-%m-%d') + ' ' + db_name + ' pairwise.csv', index=False)
+
     if viz_type == 'interactive/':
-        rename_dict = {'bkh': 'Bokeh', 'plotly_py': 'Plotly.py', 'gv': 'GeoViews+\nBokeh', 'gv_ds': 'GeoViews+\ndatashader+\nBokeh Server', 'hv_plot': 'hvPlot+\nGeoViews+\nBokeh'}
+        rename_dict = {'bkh': 'Bokeh', 'plotly_py': 'Plotly.py', 'plotly_gl': 'Plotly.py\n(WebGL mesh)', 'gv': 'GeoViews+\nBokeh', 'gv_ds': 'GeoViews+\ndatashader+\nBokeh Server', 'hv_plot': 'hvPlot+\nGeoViews+\nBokeh'}
 
     else:
-        rename_dict = {'alt': 'Altair+\nVega-Lite', 'carto': 'Cartopy+\nMatplotlib', 'ds': 'Data-\nshader*', 'gpd': 'GeoPandas+\nMatplotlib', 'gplt': 'geoplot+\nMatplotlib', 'gv': 'GeoViews+\nMatplotlib'}
+        rename_dict = {'alt': 'Altair+\nVega-Lite', 'carto': 'Cartopy+\nMatplotlib', 'carto_pp': 'Cartopy+\nMatplotlib\n(pre-projected)', 'ds': 'Data-\nshader*', 'gpd': 'GeoPandas+\nMatplotlib', 'gplt': 'geoplot+\nMatplotlib', 'gv': 'GeoViews+\nMatplotlib', 'mpl_pc': 'PathCollection+\nMatplotlib', 'mpl_pc_ragged': 'PathCollection+\nMatplotlib\n(ragged arrays)'}
 
 
     df1['library'].replace(rename_dict, inplace=True)
@@ -97,22 +117,26 @@ if __name__ == "__main__":
 
     # Plot cumtimes to bar chart
 
-    ax = df1.plot.bar(x=x_label, y="mean", yerr=list(df1['std']), ecolor='grey', capsize=5, alpha=0.5, ylabel="seconds", rot='horizontal', title="cProfile: mean cumulative CPU runtime ("+ str(num_times) + ' runs)', legend=False)
+    ax = df1.plot.bar(x=x_label, y=y, yerr=yerr, ecolor='grey', capsize=5, alpha=0.5, ylabel="seconds", rot='horizontal', title=title, legend=False)
 
-    for i in range(len(df1['mean'])):
-        plt.annotate("{:.2f}".format(df1['mean'][i]) + 's', xy=(df.index[i], df1['mean'][i]), ha='center', va='bottom')
+    for i in range(len(df1[y])):
+        plt.annotate("{:.2f}".format(df1[y][i]) + 's', xy=(df.index[i], df1[y][i]), ha='center', va='bottom')
 
     plt.subplots_adjust(bottom=0.25)
 
     ax.spines["top"].set_visible(False)
     ax.spines["right"].set_visible(False)
-    ax.set_title("cProfile: mean cumulative CPU runtime ("+ str(num_times) + ' runs)', pad=0)
+    ax.set_title(title, pad=0)
     plt.tight_layout()
 
     plt.savefig(profiledir + datetime.today().strftime('%Y-%m-%d') + ' ' + db_name + ' comparison.jpg', dpi=300, facecolor='white')
 
     plt.savefig('data/comp_profile_' + viz_type[:-1] + '_' + db_name + '.jpg', dpi=300, facecolor='white')
 
+    if record:
+        run_id = recordProfiles(profiledir, db_name, label='profile_comp ' + viz_type[:-1])
+        print("Recorded profiles as run {} in the benchmark store".format(run_id))
+
     # # Create a docx containing the final dataframe
 
     # # open an existing document
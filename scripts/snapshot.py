@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+"""Export the three layers of a PostGIS database to a memory-mapped Arrow IPC snapshot (see mapcompare/snapshot.py).
+
+Scripts and apps opening the snapshot via loadSnapshot() skip PostGIS altogether and share the mapped pages across processes.
+loadSnapshot() re-exports a stale snapshot itself if given the source fingerprint, otherwise re-run after the database has changed.
+"""
+
+from mapcompare.inputs import override
+from mapcompare.sql2gdf import sourceFingerprint, timer
+from mapcompare.snapshot import updateSnapshot, readSnapshot
+from mapcompare.misc.pw import password
+
+# INPUTS
+db_name = override('db_name', 'dd')
+importance = override('importance', False) # store the vertex importance for readers simplifying, see mapcompare/simplify.py
+
+
+@timer
+def exportSnapshot(db_name: str=db_name) -> str:
+    """Query PostGIS as ragged arrays and write the snapshot to mapcompare/temp/snapshots/[db_name].[version].arrow.
+    """
+
+    return updateSnapshot(db_name, password, sourceFingerprint(db_name, password), importance=importance)
+
+
+@timer
+def openSnapshot(path: str) -> None:
+    """Time opening the snapshot memory-mapped, for comparison with the export.
+    """
+
+    for name, layer in readSnapshot(path).items():
+        print("{}: {} features, {:.1f} MB".format(name, len(layer), layer.nbytes / 2**20))
+
+
+def main() -> None:
+    """Export the snapshot and time opening it, as when run as a script. Called by the mapcompare command, see mapcompare/cli.py.
+    """
+
+    path = exportSnapshot()
+
+    openSnapshot(path)
+
+
+if __name__ == "__main__":
+
+    main()
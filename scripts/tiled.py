@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""Render the map template as a print-resolution poster (A0 by default) by splitting the extent into tiles
+and rendering these in a process pool with either matplotlib or datashader (see mapcompare/tiled.py).
+
+Unlike the other static scripts, no cProfile is created as cProfile only captures the main process.
+Total and per-tile wall times are printed instead.
+"""
+
+import os
+import numpy as np
+from typing import List
+from geopandas import GeoDataFrame
+from mapcompare.inputs import override
+from mapcompare.sql2gdf import sql2gdf, timer
+from mapcompare.tiled import renderTiled
+from mapcompare.symbology import LAYERS
+from mapcompare.misc.pw import password
+
+outputdir = 'mapcompare/outputs/'
+viz_type = 'static/' # non-adjustable
+
+# INPUTS
+db_name = override('db_name', 'dd')
+backend = override('backend', 'mpl') # 'mpl' for flattened matplotlib PathCollections or 'ds' for datashader
+paper = (1189, 841) # width and height in mm, A0 landscape
+dpi = override('dpi', 300)
+tile_px = override('tile_px', 2048)
+fmt = override('fmt', 'png') # 'png' or 'tif'
+workers = None # defaults to the number of CPUs
+
+
+def getExtent(*gdfs: GeoDataFrame) -> List[np.float64]:
+    """Return combined bbox of all GDFs in cartopy set_extent format (x0, x1, y0, y1).
+
+    This step is separated from actual rendering to not affect performance measurement.
+    """
+
+    list_of_bounds = [gdf.total_bounds for gdf in gdfs]
+
+    xmin = np.min([item[0] for item in list_of_bounds])
+    xmax = np.max([item[2] for item in list_of_bounds])
+    ymin = np.min([item[1] for item in list_of_bounds])
+    ymax = np.max([item[3] for item in list_of_bounds])
+
+    extent = [xmin, xmax, ymin, ymax]
+
+    return extent
+
+
+@timer
+def renderPoster(*gdfs: GeoDataFrame, extent: List[np.float64], db_name: str=db_name, backend: str=backend) -> str:
+    """Render the map template minus basemap and legend to a single PNG or TIFF in /mapcompare/outputs/[viz_type].
+
+    Parameters
+    ----------
+    buildings_in, buildings_out, rivers : GeoDataframes
+        The three feature sets styled as in gpd.py (matplotlib) or ds.py (datashader).
+    extent : list of float
+        Combined extent as returned by getExtent().
+    db_name : {'dd', 'dd_subset'}
+        Global scope variable indicating the source PostGIS database to be used, 'dd' being the complete dataset and 'dd_subset' the subset.
+    backend : {'mpl', 'ds'}
+        Global scope variable indicating the library used to render each tile.
+
+    Returns
+    ----------
+        Path to the poster.
+    """
+
+    width_px, height_px = [int(round(mm / 25.4 * dpi)) for mm in paper]
+
+    color_key = {'Within_500m': 'red', 'Outside_500m': 'grey', 'River/stream': 'lightblue'}
+
+    if not os.path.exists(outputdir + viz_type):
+        os.makedirs(outputdir + viz_type)
+
+    outpath = outputdir + viz_type + "tiled " + backend + " (" + db_name + ") " + str(dpi) + "dpi." + fmt
+
+    tile_times = renderTiled(*gdfs, extent=extent, width_px=width_px, height_px=height_px, outpath=outpath, backend=backend,
+                             styles=LAYERS, color_key=color_key, dpi=dpi, tile_px=tile_px, workers=workers)
+
+    print("\n{} tiles of {}x{} px, mean {:.2f} secs, max {:.2f} secs per tile".format(len(tile_times), tile_px, tile_px, np.mean(tile_times), np.max(tile_times)))
+
+    return outpath
+
+
+def main() -> None:
+    """Query PostGIS and render the poster, as when run as a script. Called by the mapcompare command, see mapcompare/cli.py.
+    """
+
+    global extent, buildings_in, buildings_out, rivers
+
+    buildings_in, buildings_out, rivers = sql2gdf(db_name, password)
+
+    extent = getExtent(buildings_in, buildings_out, rivers)
+
+    renderPoster(buildings_in, buildings_out, rivers, extent=extent)
+
+
+if __name__ == "__main__":
+
+    main()
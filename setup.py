@@ -9,13 +9,15 @@ setup(name='mapcompare',
       license='GPL',
       packages=['mapcompare'],
       install_requires=[
-                        'numpy', 'matplotlib', 'pandas', 'altair', 'geopandas', 'cartopy',
-                        'geoplot', 'geoviews', 'holoviews', 'datashader', 'hvplot', 'bokeh', 'plotly', 'wrapt'],
+                        'numpy', 'matplotlib', 'pandas', 'altair', 'geopandas', 'shapely>=2.0', 'pyarrow', 'cartopy',
+                        'geoplot', 'geoviews', 'holoviews', 'datashader', 'hvplot', 'bokeh', 'plotly', 'wrapt', 'requests'],
       scripts=['scripts/alt.py', 'scripts/bkh.py', 'scripts/carto.py',
                'scripts/ds.py', 'scripts/gpd.py',
                'scripts/gplt.py', 'scripts/gv.py',
-               'scripts/gv_ds.py', 'scripts/plotly_py.py',
-               'scripts/hv_plot.py', 'scripts/profile_comp.py',
+               'scripts/mpl_pc.py', 'scripts/tiled.py', 'scripts/ds_tiles.py', 'scripts/osm_tiles.py', 'scripts/snapshot.py',
+               'scripts/gv_ds.py', 'scripts/plotly_py.py', 'scripts/plotly_gl.py',
+               'scripts/hv_plot.py', 'scripts/profile_comp.py', 'scripts/output_comp.py',
                'scripts/profile_comp.py',
                'scripts/min_code/code_comp.py'],
+      entry_points={'console_scripts': ['mapcompare=mapcompare.cli:main']},
       zip_safe=False)
\ No newline at end of file
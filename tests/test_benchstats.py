@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+from mapcompare.benchstats import bootstrapCI, cliffsDelta, holm, outlierMask, splitCold
+
+
+def test_outlierMask():
+    assert list(outlierMask([1.0, 1.1, 0.9, 1.0, 100.0])) == [False, False, False, False, True]
+
+
+def test_outlierMask_constant():
+    assert not outlierMask([2.0, 2.0, 2.0]).any()
+
+
+def test_holm():
+    assert np.allclose(holm([0.01, 0.04, 0.03]), [0.03, 0.06, 0.06])
+    assert np.allclose(holm([0.5, 0.6]), [1, 1])
+
+
+def test_cliffsDelta():
+    assert cliffsDelta([1, 2, 3], [4, 5, 6]) == 1
+    assert cliffsDelta([4, 5, 6], [1, 2, 3]) == -1
+    assert cliffsDelta([1, 2], [1, 2]) == 0
+
+
+def test_bootstrapCI_constant():
+    assert bootstrapCI(np.full(10, 3.0), n_boot=100) == (3.0, 3.0)
+
+
+def test_splitCold_defaults_to_first_ds_run():
+    times = pd.DataFrame({'lib': ['ds'] * 3 + ['gpd'] * 3, 'sample': [1, 2, 3] * 2, 'secs': [5.0, 1.0, 1.0, 2.0, 2.0, 2.0]})
+
+    cold, warm = splitCold(times)
+
+    assert list(cold['lib']) == ['ds'] and cold['secs'].iloc[0] == 5.0
+    assert len(warm) == 5
+
+
+def test_splitCold_by_lib():
+    times = pd.DataFrame({'lib': ['a', 'a', 'b', 'b'], 'sample': [0, 1, 0, 1], 'secs': [1.0, 2.0, 3.0, 4.0]})
+
+    cold, _ = splitCold(times, {'b': 1})
+
+    assert list(cold['secs']) == [3.0]
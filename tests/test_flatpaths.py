@@ -0,0 +1,47 @@
+import numpy as np
+from matplotlib.path import Path
+from mapcompare.flatpaths import orient, ringCodes
+
+
+def signedAreas(coords, ring_offsets):
+    return [0.5 * np.sum(ring[:-1, 0] * ring[1:, 1] - ring[1:, 0] * ring[:-1, 1])
+            for ring in np.split(coords, ring_offsets[1:-1])]
+
+
+def test_orient_exterior_ccw_and_holes_cw():
+    # clockwise exterior with a counter-clockwise hole, followed by a counter-clockwise exterior
+    exterior = [(0, 0), (0, 4), (4, 4), (4, 0), (0, 0)]
+    hole = [(1, 1), (2, 1), (2, 2), (1, 2), (1, 1)]
+    other = [(5, 5), (6, 5), (6, 6), (5, 5)]
+    coords = np.array(exterior + hole + other, dtype=float)
+    ring_offsets = np.array([0, 5, 10, 14])
+    polygon_offsets = np.array([0, 2, 3])
+
+    areas = signedAreas(orient(coords, ring_offsets, polygon_offsets), ring_offsets)
+
+    assert areas[0] > 0 and areas[1] < 0 and areas[2] > 0
+
+
+def test_orient_keeps_vertices_and_ring_starts():
+    coords = np.array([(0, 0), (0, 1), (1, 1), (0, 0)], dtype=float)
+
+    oriented = orient(coords, np.array([0, 4]), np.array([0, 1]))
+
+    assert sorted(map(tuple, oriented)) == sorted(map(tuple, coords))
+    assert tuple(oriented[0]) == tuple(oriented[-1])
+
+
+def test_orient_trailing_empty_polygon():
+    coords = np.array([(0, 0), (1, 0), (1, 1), (0, 0)], dtype=float)
+
+    oriented = orient(coords, np.array([0, 4]), np.array([0, 1, 1]))
+
+    assert np.array_equal(oriented, coords)
+
+
+def test_ringCodes():
+    codes = ringCodes(np.array([0, 4, 9]))
+
+    assert codes.dtype == Path.code_type
+    assert list(codes) == ([Path.MOVETO] + [Path.LINETO] * 2 + [Path.CLOSEPOLY]
+                           + [Path.MOVETO] + [Path.LINETO] * 3 + [Path.CLOSEPOLY])
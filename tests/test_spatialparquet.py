@@ -0,0 +1,59 @@
+import os
+import pytest
+
+try:
+    from mapcompare import spatialparquet
+except ImportError as e:
+    # spatialpandas and dask, or a dask compatible pyarrow, not installed
+    pytest.skip(str(e), allow_module_level=True)
+
+
+@pytest.fixture
+def written(tmp_path, monkeypatch):
+    """Record the datasets written, without spatialpandas writing or reading any Parquet.
+    """
+
+    paths = []
+
+    def writeParquet(merged, path):
+        os.makedirs(path, exist_ok=True)
+        paths.append(path)
+        return path
+
+    monkeypatch.setattr(spatialparquet, 'parquetdir', str(tmp_path) + os.sep)
+    monkeypatch.setattr(spatialparquet, 'writeParquet', writeParquet)
+    monkeypatch.setattr(spatialparquet, 'readParquet', lambda path, categories: path)
+
+    return paths
+
+
+def load(fingerprint):
+    return spatialparquet.loadParquet('dd', 3857, ['a'], lambda: None, fingerprint=fingerprint)
+
+
+def test_written_once_per_fingerprint(written):
+    load('1')
+    load('1')
+
+    assert len(written) == 1
+
+
+def test_rewritten_once_stale(written):
+    load('1')
+    load('2')
+
+    assert len(written) == 2
+
+
+def test_existing_dataset_used_without_fingerprint(written):
+    load('1')
+    load(None)
+
+    assert len(written) == 1
+
+
+def test_unknown_source_rewritten_with_fingerprint(written):
+    load(None)
+    load('1')
+
+    assert len(written) == 2
@@ -0,0 +1,57 @@
+import struct
+import numpy as np
+import pytest
+from mapcompare.tiled import tiffMemmap
+
+
+def readIFD(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    assert data[:4] == b'II*\x00'
+    offset, = struct.unpack('<I', data[4:8])
+    count, = struct.unpack('<H', data[offset:offset + 2])
+
+    entries = {}
+    for i in range(count):
+        tag, typ, n, value = struct.unpack('<HHII', data[offset + 2 + 12 * i:offset + 14 + 12 * i])
+        entries[tag] = (typ, n, value & 0xffff if typ == 3 and n == 1 else value)
+
+    return data, entries
+
+
+def test_tiffMemmap_header(tmp_path):
+    path = str(tmp_path / 'out.tif')
+
+    arr = tiffMemmap(path, 3, 5)
+    arr.flush()
+    data, entries = readIFD(path)
+
+    assert arr.shape == (3, 5, 4)
+    assert len(data) == 256 + 3 * 5 * 4
+    assert entries[256][2] == 5 and entries[257][2] == 3
+    assert entries[273][2] == 256 and entries[279][2] == 3 * 5 * 4
+    assert entries[277][2] == 4 and entries[278][2] == 3
+    assert entries[259][2] == 1 and entries[338][2] == 2
+    # BitsPerSample as 4 SHORTs at the offset given
+    assert struct.unpack('<4H', data[entries[258][2]:entries[258][2] + 8]) == (8, 8, 8, 8)
+
+
+def test_tiffMemmap_pixels(tmp_path):
+    Image = pytest.importorskip('PIL.Image')
+    path = str(tmp_path / 'out.tif')
+    pixels = np.arange(2 * 3 * 4, dtype=np.uint8).reshape(2, 3, 4)
+
+    arr = tiffMemmap(path, 2, 3)
+    arr[:] = pixels
+    arr.flush()
+    del arr
+
+    with Image.open(path) as img:
+        assert img.mode == 'RGBA'
+        assert np.array_equal(np.asarray(img), pixels)
+
+
+def test_tiffMemmap_size_limit(tmp_path):
+    with pytest.raises(ValueError):
+        tiffMemmap(str(tmp_path / 'out.tif'), 2**15, 2**15)